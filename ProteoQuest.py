@@ -1,31 +1,133 @@
 #!/usr/bin/python3
+import argparse
+import json
 import os
-import subprocess
 import sys
 import re
 import time
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
+from edirect_cache import get_default_cache
+from eutils import get_default_client, EutilsError
+from history_fetch import fetch_fasta_batches, update_fasta, read_progress, DEFAULT_BATCH_SIZE
+from fasta import read_fasta, write_fasta, write_chunks, get_index
+from length_filter import LengthFilter
+from taxonomy_index import get_taxonomy_index, format_lineage
+from local_protein_db import local_client, LOCAL_DB
+from redundancy import reduce_redundancy, DEFAULT_IDENTITY
+from motif_scan import scan_sequences, scan_chunks, chunk_count
+from prosite import PrositePatterns, PROSITE_DAT, motif_count_table
+from protein_stats import protein_statistics, STATS_COLUMNS
+from artifact_cache import get_artifact_cache, artifact_key
+from results_store import ResultsStore, RESULTS_DB as DEFAULT_RESULTS_DB
+from similarity import build_profiles, nearest_neighbours, heatmap_matrix, plot_heatmap, NEIGHBOURS
+from conservation import column_similarity, sliding_window, save_curve, plot_curve
+from alignment_store import open_alignment_store
+from aligner import run_clustalo, choose_options
+from pipeline import Pipeline
+from emboss_reports import parse_patmatmotifs, pepstats_table, demultiplex
+from instrumentation import get_report, start_report, timed
+from incremental import (record_path, save_record, reusable_accessions, previous_rows, previous_motif_hits,
+                         remove_stale_reports)
+
+# the in-process NCBI E-utilities client (keeps its HTTP connection open, so no esearch/efetch/xtract processes are forked);
+# every query goes through its on-disk cache, so repeated queries (within this run or from earlier runs) do not cost
+# another round-trip. It is created on first use (see get_eutils), so importing this module opens no cache file.
+eutils = None
+# the FASTA dump searched instead of the NCBI protein database (none by default, see use_local_database)
+LOCAL_PROTEIN_DB = LOCAL_DB
+# the outputs of the analysis steps (alignments, plots, motif hits and statistics) are cached by the hash of their input,
+# so re-analysing the same sequences reuses them (opened on first use, see get_artifacts)
+artifacts = None
+
+# the largest number of sequences a search may return before the user is asked to refine it (0 lifts the limit),
+# and how the sequences are downloaded: in batches of FETCH_BATCH_SIZE, FETCH_WORKERS batches at a time
+MAX_SEQ_COUNT = int(os.environ.get("PROTEOQUEST_MAX_SEQS", 1000))
+FETCH_BATCH_SIZE = int(os.environ.get("PROTEOQUEST_FETCH_BATCH_SIZE", DEFAULT_BATCH_SIZE))
+FETCH_WORKERS = int(os.environ.get("PROTEOQUEST_FETCH_WORKERS", 1))
+# the number of sequences scanned at the same time in the motif step (0 uses every available core)
+SCAN_WORKERS = int(os.environ.get("PROTEOQUEST_SCAN_WORKERS", 0))
+# how the protein statistics are calculated: "native" (in-process, all sequences at once) or "pepstats" (EMBOSS)
+STATS_ENGINE = os.environ.get("PROTEOQUEST_STATS_ENGINE", "native")
+# how the EMBOSS tools (patmatmotifs when there is no prosite.dat, pepstats) are given the sequences: "chunked" (a few
+# multi-sequence files, one run each) or "per-sequence" (one file and one run per sequence)
+EMBOSS_MODE = os.environ.get("PROTEOQUEST_EMBOSS_MODE", "chunked")
+# how the conservation is calculated: "native" (in-process, from the alignment) or "plotcon" (EMBOSS),
+# and the window size the conservation is averaged over
+CONSERVATION_ENGINE = os.environ.get("PROTEOQUEST_CONSERVATION_ENGINE", "native")
+CONSERVATION_WINSIZE = int(os.environ.get("PROTEOQUEST_CONSERVATION_WINSIZE", 4))
+# the identity above which sequences are collapsed into one representative before the analysis (0 keeps every sequence)
+REDUNDANCY_IDENTITY = DEFAULT_IDENTITY
+# the number of nearest neighbours listed for every sequence in the k-mer similarity overview (0 turns it off)
+SIMILARITY_NEIGHBOURS = NEIGHBOURS
+# the results warehouse every analysis is added to (none by default, see results_store)
+RESULTS_DB = DEFAULT_RESULTS_DB
+# whether a search downloaded before is only updated with its new sequences (and only those are analysed again)
+INCREMENTAL = os.environ.get("PROTEOQUEST_INCREMENTAL", "1") != "0"
+
+# in batch mode the programme never prompts, never pauses and never opens a viewer window (set by main())
+BATCH_MODE = False
+
+
+def get_eutils():
+    '''This function returns the E-utilities client the searches go through, creating the programme-wide client (and
+    its EDirect cache) on first use.'''
+    global eutils
+    if eutils is None:
+        eutils = get_default_client()
+    return eutils
+
+
+def get_artifacts():
+    '''This function returns the cache of the analysis outputs, opening the programme-wide artifact cache on first
+    use.'''
+    global artifacts
+    if artifacts is None:
+        artifacts = get_artifact_cache()
+    return artifacts
+
+
+# define a function to pause briefly between messages, so that the user can follow what the programme is doing
+def pause(seconds):
+    '''This function pauses for the given number of seconds, except in batch mode where nobody is reading along.'''
+    if not BATCH_MODE:
+        # the pauses are kept apart in the run report, so they do not blur the stage timings
+        get_report().paused(seconds)
+        time.sleep(seconds)
+
+
+# define a function to show the current plot to the user
+def show_plot():
+    '''This function opens the current plot in a new window (interactive mode only) and then closes it,
+    so that the next plot starts on a fresh figure.'''
+    if not BATCH_MODE:
+        plt.show()
+    plt.close('all')
+
+
 ##### STEP 1: GET USER INPUT ####
 # the following script takes an input from the user, asking them which database they'd like to search from
 # and then asks them which search item they'd like to search for and what search type this search item is.
 # then it asks whether they'd like to search for a partial match or not.
 
-# welcome the user to the programme, introduce what the programme does and what input it will take from the user
-print("Welcome to the ProteoQuest programme!"
-      "\nThis programme is used for searching protein sequences within the protein database"
-      "\nIt will start by asking the user to specify their search terms step by step:"
-      "\n1) The taxonomic group name"
-      "\n2) The protein group"
-      "\n3) Partial or not partial search"
-      "\nThe user will be given an opportunity to refine the whole search term before any protein sequence is analysed."
-      "\nThe programme will then proceed to search the protein database for the specified search terms;"
-      "\nThen the programme will then proceed to determine and plot the level of conservation between protein sequences;"
-      "\nThen, it will scan the protein sequences of interest with motifs from the PROSITE database and plot any motifs found and their counts;"
-      "\nFinally, it will calculate protein statistics and plot anything meaningful in a bar plot"
-      "\nYou can use CTRL + C to abort the programme at any point and restart the programme.")
-time.sleep(0.5)
+# define a function to welcome the user to the programme, introduce what the programme does and what input it will take from the user
+def welcome():
+    '''This function welcomes the user to the programme.'''
+    print("Welcome to the ProteoQuest programme!"
+          "\nThis programme is used for searching protein sequences within the protein database"
+          "\nIt will start by asking the user to specify their search terms step by step:"
+          "\n1) The taxonomic group name"
+          "\n2) The protein group"
+          "\n3) Partial or not partial search"
+          "\nThe user will be given an opportunity to refine the whole search term before any protein sequence is analysed."
+          "\nThe programme will then proceed to search the protein database for the specified search terms;"
+          "\nThen the programme will then proceed to determine and plot the level of conservation between protein sequences;"
+          "\nThen, it will scan the protein sequences of interest with motifs from the PROSITE database and plot any motifs found and their counts;"
+          "\nFinally, it will calculate protein statistics and plot anything meaningful in a bar plot"
+          "\nYou can use CTRL + C to abort the programme at any point and restart the programme.")
+    pause(0.5)
 
 ##### PROCESS STEP 1_1: GET USER INITIAL INPUT OF TAXONOMY #####
 ## This step takes the user's TAXONOMY input and store it as a variable
@@ -43,6 +145,19 @@ def get_confirmation():
         else:
             print("Invalid input. Please enter 'y' or 'n'")
 
+# define a function to search a local protein database instead of NCBI
+def use_local_database(fasta_path):
+    '''This function makes every protein search run on the FASTA file at fasta_path (e.g. a UniProt or RefSeq dump)
+    instead of the NCBI protein database; the file is indexed the first time it is used. Taxonomy look-ups still go
+    to the local taxonomy index or NCBI.'''
+    global eutils, LOCAL_PROTEIN_DB
+    if not os.path.exists(fasta_path):
+        print("The local protein database", fasta_path, "does not exist.")
+        sys.exit(1)
+    LOCAL_PROTEIN_DB = fasta_path
+    eutils = local_client(fasta_path)
+    print("Protein searches are run on the local database", fasta_path, "instead of NCBI.")
+
 # define a function to check the quality of the user's input
 def quality_check_user_input(user_input):
     '''This function checks the quality of the user's input. It checks whether the user has specified a valid taxonomic group or not.
@@ -53,18 +168,32 @@ def quality_check_user_input(user_input):
         print("No input was given.")
         return False
 
-    # run esearch in the taxonomy database on the commandline and save it to esearch_user_input
-    esearch_user_input = subprocess.getoutput("esearch -db taxonomy -spell -query "+'"' + str(user_input) +'"'+"| efetch")
+    # look the name up in the local taxonomy index first, which needs no network round-trip
+    taxonomy = get_taxonomy_index()
+    if taxonomy is not None:
+        if taxonomy.resolve(user_input):
+            return True
+        suggestions = taxonomy.suggest(user_input)
+        if suggestions:
+            print("Did you mean:", ", ".join(suggestions), "?")
+        # the name may be newer than the local index, so NCBI still has the last word
 
-    # if esearch returns an empty line on NCBI, return False
-    if re.search("^$", esearch_user_input):
-        print("No result was found with that input")
+    # run esearch in the taxonomy database and save the result to esearch_user_input
+    try:
+        esearch_user_input = get_eutils().esearch("taxonomy", user_input)
+    except EutilsError as error:
+        print("Failure, warning or error was returned:", error)
         return False
 
-    # if esearch returns a warning or error on NCBI, return False, else True
-    if "FAILURE" in esearch_user_input or "WARNING" in esearch_user_input or "ERROR" in esearch_user_input:
+    # if esearch returns a warning or error on NCBI, return False
+    if esearch_user_input["errors"] or esearch_user_input["warnings"]:
         print("Failure, warning or error was returned")
         return False
+
+    # if esearch does not find anything on NCBI, return False, else True
+    if esearch_user_input["count"] == 0:
+        print("No result was found with that input")
+        return False
     else:
         return True
 
@@ -78,78 +207,109 @@ def quality_check_search_term(search_term):
         print("No input was given.")
         return False
 
-    # run esearch in the protein database on the commandline and save its Count number to esearch_user_input
-    esearch_search_term = subprocess.getoutput("esearch -db protein -spell -query "+'"' + str(search_term) +'"'+"| grep 'Count'")
-
-    # if esearch returns an empty line on NCBI, return False
-    if re.search("^$", esearch_search_term):
-        print("No result was found with that input")
+    # run esearch in the protein database and save the result (including its Count) to esearch_search_term
+    try:
+        esearch_search_term = get_eutils().esearch("protein", search_term)
+    except EutilsError as error:
+        print("Failure, warning or error was returned:", error)
         return False
 
-    # if esearch returns a warning or error on NCBI, return False, else True
-    if "FAILURE" in esearch_search_term or "WARNING" in esearch_search_term or "ERROR" in esearch_search_term or "0" in esearch_search_term:
+    # if esearch returns a warning or error on NCBI, return False
+    if esearch_search_term["errors"] or esearch_search_term["warnings"]:
         print("Failure, warning or error was returned")
         return False
+
+    # if esearch does not find anything on NCBI, return False, else True
+    if esearch_search_term["count"] == 0:
+        print("No result was found with that input")
+        return False
     else:
         return True
 
-file_name = ""
+# define a function to turn a search term into a name that can be used for files and folders
+def search_term_to_file_name(search_term):
+    '''This function returns the file_name used for the outputs of search_term:
+    the file_name cannot contain any special characters or spaces, so they are removed from the search term'''
+    file_name = search_term.replace(" ", "_")
+    file_name = (file_name.replace("[", "").replace("]", "").replace("'", "")
+                 .replace(",", "").replace(".", "").replace("-", "")
+                 .replace("*", ""))
+    return file_name
+
 # define a function to perform an esearch within the NCBI protein database given a valid input and outputs the fasta sequence of the protein specified.
-def protein_esearch(search_term):
+def protein_esearch(search_term, max_seq_count=MAX_SEQ_COUNT, out_dir=".", make_folder=None):
     '''This function performs an esearch within the NCBI protein database given a valid input and outputs the fasta
-    sequence of the protein specified.'''
+    sequence of the protein specified.
+    The sequences are streamed to {file_name}.fasta in batches through the NCBI history server, so result sets of any size
+    can be downloaded with bounded memory, and an interrupted download resumes from its last completed batch.
+    max_seq_count: the largest number of results accepted without asking the user to refine the search term (0 for no limit)
+    out_dir: the directory the outputs are saved in
+    make_folder: whether to save the outputs in a new folder called file_name inside out_dir (None asks the user)
+    It returns the path of the fasta file, the file_name, the number of sequences and the directory the outputs are saved in.'''
     while True:
         # count the number of results or sequences found using search_term, use this to quality check the search term
-        seq_count = subprocess.getoutput("esearch -db protein -spell -query " +'"'+ str(search_term)+'"'+ "| grep 'Count'")
-        # the esearch result for the number of sequences found is typically in the form of <Count>1234</Count>
-        seq_count = seq_count.replace("<Count>", "")
-        seq_count = seq_count.replace("</Count>", "")
-        # if seq_count is more than 1000, then the user needs to refine their search term
-        if int(seq_count) > 1000 or int(seq_count) == 0:
+        try:
+            seq_count = get_eutils().count("protein", search_term)
+        except EutilsError as error:
+            print("Failure, warning or error was returned:", error)
+            seq_count = 0
+        # if seq_count is more than max_seq_count, then the user needs to refine their search term
+        if (max_seq_count and int(seq_count) > max_seq_count) or int(seq_count) == 0:
             print("Your search term returned ",seq_count, " results.")
-            time.sleep(1)
-            print("This is either more than 1000 results or did not return any result. Please refine your search term."
+            pause(1)
+            print("This is either more than", max_seq_count, "results or did not return any result. Please refine your search term."
                   "\nYour search term was", search_term)
-            time.sleep(0.5)
+            pause(0.5)
+            # in batch mode there is nobody to refine the search term
+            if BATCH_MODE:
+                sys.exit(1)
             search_term = input("The search term should be in the format of:"
                                 "\n     Organism[ORGN] AND Protein[PROT]"
                                 "\nYou can also specify a non-partial search term, e.g., Organism[ORGN] AND Protein[PROT] NOT PARTIAL"
                                 "\nPlease enter a new search term:")
         else:
             break
-    # run esearch in the protein database on the commandline and save it to user_result
-    esearch_result = subprocess.getoutput("esearch -db protein -spell -query " + '"' + str(search_term) + '"' + "| efetch -format fasta")
 
-    # save the output to a file
     print("Your search term returned ", seq_count, " results.")
-    time.sleep(1)
+    pause(1)
     print("Proceeding to create a fasta sequence file for the search results...")
-    time.sleep(0.5)
+    pause(0.5)
 
     # the file_name cannot contain any special characters or spaces, so remove any from the search term
-    file_name = search_term.replace(" ", "_")
-    file_name = (file_name.replace("[", "").replace("]", "").replace("'", "")
-                 .replace(",", "").replace(".", "").replace("-", "")
-                 .replace("*", ""))
+    file_name = search_term_to_file_name(search_term)
 
     # give the user a choice to open a new folder to save any outputs from the search result
-    print(f"Would you like to proceed to open a new folder called {file_name} from now on?")
-    time.sleep(0.5)
-    confirmation = get_confirmation()
-    # if the user does want to proceed, then we make a new folder called file_name and change directory to it
-    if confirmation == True:
-        os.makedirs(f"{file_name}",exist_ok=True)
-        # changing directory into the new folder
-        os.chdir(f"{file_name}")
-        os.getcwd()
-
-    # save the output to a file
-    with open(f"{file_name}.fasta", "w") as f:
-        f.write(esearch_result)
-        f.close()
-        print(f"Output saved to {file_name}.fasta in your current working directory.")
-        time.sleep(0.5)
-    return esearch_result,file_name, seq_count
+    if make_folder is None:
+        print(f"Would you like to proceed to open a new folder called {file_name} from now on?")
+        pause(0.5)
+        make_folder = get_confirmation()
+    # if the user does want to proceed, then we make a new folder called file_name and save everything in it
+    work_dir = os.path.join(out_dir, file_name) if make_folder == True else out_dir
+    os.makedirs(work_dir, exist_ok=True)
+
+    fasta_path, seq_count = fetch_sequences(search_term, file_name, work_dir)
+    return fasta_path, file_name, seq_count, work_dir
+
+# define a function to download the sequences found by a search term
+def fetch_sequences(search_term, file_name, work_dir=".", report=print):
+    '''This function searches the protein database with search_term and streams every sequence found as fasta into
+    {file_name}.fasta in work_dir, batch by batch. If a complete {file_name}.fasta from an earlier run is already there,
+    only the sequences that are new since then are downloaded (and the ones no longer found are dropped).
+    It returns the path of the fasta file and the number of sequences.
+    report: a function called with progress messages'''
+    fasta_path = os.path.join(work_dir, f"{file_name}.fasta")
+    # a download that is still in progress (a progress file exists) is resumed rather than updated
+    with get_report().stage("fetch"):
+        if INCREMENTAL and os.path.exists(fasta_path) and read_progress(fasta_path) is None:
+            seq_count, added, removed = update_fasta(get_eutils(), "protein", search_term, fasta_path,
+                                                     batch_size=FETCH_BATCH_SIZE, report=report)
+        else:
+            seq_count = fetch_fasta_batches(get_eutils(), "protein", search_term, fasta_path,
+                                            batch_size=FETCH_BATCH_SIZE, workers=FETCH_WORKERS, report=report)
+    get_report().count("fetch", seq_count)
+    report(f"Output saved to {fasta_path}.")
+    pause(0.5)
+    return fasta_path, seq_count
 
 # define a function to get user_input as taxonomic group
 def get_input():
@@ -160,28 +320,20 @@ def get_input():
     while True:
         if quality_check_user_input(user_input):
             print("The taxonomic group you have specified is valid.")
-            time.sleep(0.5)
+            pause(0.5)
             print(f"The taxonomic group you have specified is: {user_input}")
-            time.sleep(0.5)
+            pause(0.5)
             print("Please wait...")
-            time.sleep(0.5)
+            pause(0.5)
             return user_input
         # if the user has not specified a valid taxonomic group then they need to specify the input again
         else:
             print("The taxonomic group you have specified is not valid. Please try again.")
-            time.sleep(0.5)
+            pause(0.5)
             # ask user to specify the taxonomic group they'd like to search for AGAIN
             user_input = input("Which taxonomic group would you like to search for? Enter its name to proceed: ")
             continue
     return user_input
-
-
-# save user_input as a global variable, but also allow the user to interrupt the programme
-try:
-    user_input = get_input()
-except KeyboardInterrupt:
-    print("\nProgramme interrupted by the user.")
-    sys.exit(0)
 ##### END OF PROCESS STEP 1_1 GET USER INITIAL INPUT FOR TAXONOMY #####
 
 ##### PROCESS STEP 1_2 REFINE USER INPUT #####
@@ -191,28 +343,33 @@ def get_scientific_names(user_input):
     result_name_list: a list of scientific names of the taxonomic groups
     result_len: the length of the scientific_name_list
     result_name: a string of scientific names of the taxonomic groups
-    user_result: the output of the esearch command on NCBI
+    user_result: the esearch result on NCBI (count, ids, errors and warnings)
     '''
-    # search for this taxonomic group on esearch and save the output in user_result
-    user_result = subprocess.getoutput("esearch -db taxonomy -spell -query " + str(user_input) + "| efetch")
-
-    # search for this taxonomic group on esearch and save the names of the possible taxonimic groups to a string variable
-    result_name = subprocess.getoutput(
-        "esearch -db taxonomy -spell -query " + str(user_input) +
-        "| efetch -format docsum | xtract -pattern DocumentSummary -element ScientificName")
-    # -spell performs spell check, 'efetch -format docsum' gets the DocSum of the query, and 'xtract -pattern
-    # DocumentSummary -element ScientificName' extracts the scientific name
-
-    # if esearch returns error or warning on NCBI, return False, else True (e.g. if user_input is a protein)
-    if "FAILURE" in user_result or "WARNING" in user_result or "ERROR" in user_result:
+    # resolve the taxonomic group in the local taxonomy index if there is one
+    taxonomy = get_taxonomy_index()
+    taxa = taxonomy.resolve(user_input) if taxonomy is not None else []
+    if taxa:
+        user_result = {"count": len(taxa), "ids": [str(taxon["taxid"]) for taxon in taxa], "errors": [], "warnings": []}
+        result_name = [taxon["name"] for taxon in taxa]
+    else:
+        # search for this taxonomic group on esearch and save the result in user_result
+        # (this is the same query as in quality_check_user_input, so it is normally answered by the cache)
+        try:
+            user_result = get_eutils().esearch("taxonomy", user_input)
+            # get the DocSums of the possible taxonomic groups and save their scientific names to a list
+            result_name = get_eutils().scientific_names(user_input)
+        except EutilsError as error:
+            user_result = {"errors": [str(error)], "warnings": []}
+            result_name = []
+
+    # if esearch returns error or warning on NCBI, exit (e.g. if user_input is a protein)
+    if user_result["errors"] or user_result["warnings"]:
         print("Failure, warning or error was returned, possibly due to input not being a taxonomic group..."
               "\nPlease check your input spelling and try again!"
               "\nYour input was",str(user_input))
-        time.sleep(0.5)
+        pause(0.5)
         sys.exit(1)
 
-    # saving every item within scientific_names into a list
-    result_name = result_name.splitlines()  # splitting the list into a list of scientific names
     result_len = len(result_name)
     # use a dictionary to save each item in result_name_list as a value and its index as a key
     result_name_dict = {}
@@ -232,9 +389,14 @@ def get_scientific_names(user_input):
 
     return result_name_dict, result_len, result_name, user_result
 
-# execute get_scientific_names to save the outputs as global variables,
-# result_name_dict is the most important one as it will be used to select and refine search terms
-result_name_dict, result_len, result_name, user_result = get_scientific_names(user_input)
+# define a function to show the lineage of a taxonomic group
+def print_lineage(name):
+    '''This function prints the lineage of the taxonomic group called name, if the local taxonomy index knows it.'''
+    taxonomy = get_taxonomy_index()
+    taxa = taxonomy.resolve(name) if taxonomy is not None else []
+    for taxon in taxa:
+        print("Lineage of", taxon["name"], f"({taxon['rank']}, taxid {taxon['taxid']}):",
+              format_lineage(taxonomy.lineage(taxon["taxid"])))
 
 # define a function to refine the taxonomy search term
 def refine_tax_search_terms(user_input):
@@ -244,7 +406,7 @@ def refine_tax_search_terms(user_input):
         # (this should not happen, but a sanity check is always good!)
         if len(result_name_dict) == 0:
             print("It looks like you haven't yet provided a valid input.")
-            time.sleep(0.5)
+            pause(0.5)
             # use the get_input function
             user_input = get_input()
             # once the condition for scientific_name_list != 0 is satisfied, continue to the next if statement
@@ -256,27 +418,29 @@ def refine_tax_search_terms(user_input):
                   #TODO: with x number of results on NCBI,
                   "\nNow you can choose to proceed further using the current search term OR refine your search further."
                   "\nTo start over, use CTRL + C")
-            time.sleep(0.5)
+            # show where the taxonomic group sits in the tree of life, if the local taxonomy index knows it
+            print_lineage(result_name_dict[0])
+            pause(0.5)
             print('To proceed further with the current search term, please enter \'y\', or refine your search term further by entering \'n\'')
-            time.sleep(0.5)
+            pause(0.5)
             user_confirmation = get_confirmation()
             # if the user would like to proceed, then we can go ahead with the user_input
             if user_confirmation == True:
                 result_name = result_name_dict[0]
                 print("Thank you, proceeding with the taxonomic group ", result_name)
-                time.sleep(0.5)
+                pause(0.5)
                 return result_name
 
             # if the user does not want to proceed, then we can further refine the search
             elif user_confirmation == False:
                 print("Let's refine your results further...")
-                time.sleep(0.5)
+                pause(0.5)
                 print("Your initial search term was ", user_input,
                       "\nPlease update your search term (this will take you back to the start of the programme)")
-                time.sleep(0.5)
+                pause(0.5)
                 user_input = get_input()
                 print("Your updated search term is ", user_input)
-                time.sleep(0.5)
+                pause(0.5)
                 # ask the user if they'd like to proceed with the updated search term
                 user_confirmation = get_confirmation()
                 result_name_dict, result_len, result_name, user_result = get_scientific_names(user_input)
@@ -304,7 +468,7 @@ def refine_tax_search_terms(user_input):
                     break
                 except:
                     print("Please enter a valid index.")
-                    time.sleep(0.5)
+                    pause(0.5)
             print("Your updated search term is ", result_name)
             # ask the user if they'd like to proceed with the updated search term
             user_confirmation = get_confirmation()
@@ -312,24 +476,29 @@ def refine_tax_search_terms(user_input):
             if user_confirmation == True:
                 result_name = result_name_dict[0]
                 print("Thank you, proceeding with taxonomic group ", result_name)
-                time.sleep(0.5)
+                pause(0.5)
                 return result_name
             # if the user does not want to proceed, then exit the programme.
             else:
                 print("Thank you for using the programme.")
-                time.sleep(0.5)
+                pause(0.5)
                 sys.exit(0)
-# get the user input (taxonomic group) and refine it
-try:
-    user_input = refine_tax_search_terms(user_input)
-except KeyboardInterrupt:
-    print("\nProgramme interrupted by the user.")
-    time.sleep(0.5)
-    sys.exit(0)
+
+# define a function to build the search term from the taxonomic group, the protein and whether the protein is partial
+def build_search_term(user_input, protein_type, partial_protein=None):
+    '''This function returns the search term user_input[ORGN] AND protein_type[PROT],
+    followed by PARTIAL if partial_protein is 'y', NOT PARTIAL if it is 'n' and nothing otherwise.'''
+    # if the protein is partial, then we need to add "PARTIAL" at the end of search_term, elif not partial: "NOT PARTIAL"
+    if partial_protein == 'y':
+        return str(str(user_input) + "[ORGN]" + " AND " + str(protein_type) + "[PROT] " + "PARTIAL")
+    elif partial_protein == 'n':
+        return str(str(user_input) + "[ORGN]" + " AND " + str(protein_type) + "[PROT] " + "NOT PARTIAL")
+    else:
+        return str(str(user_input) + "[ORGN]" + " AND " + str(protein_type) + "[PROT]")
 
 # define a function which takes the protein type as a further input before saving both user_input and protein_type
 # as search_term to use in protein_esearch()
-def get_search_term():
+def get_search_term(user_input):
     '''This function takes the protein type as a further input before saving both user_input and protein_type into search_term
     It returns the search term as a string
     user_input: the taxonomic group
@@ -341,39 +510,10 @@ def get_search_term():
 
     # ask the user if the protein is partial or not
     partial_protein = input("Is the protein partial? (y/n)").lower()
-    # if the protein is partial, then we need to add "PARTIAL" at the end of search_term, elif not partial: "NOT PARTIAL"
-    if partial_protein == 'y':
-        partial_protein = "PARTIAL"
-        search_term = str(str(user_input) + "[ORGN]" + " AND " + str(protein_type) + "[PROT] "+str(partial_protein))
-        print("Your search term is ", search_term)
-        time.sleep(0.5)
-        return search_term
-    elif partial_protein == 'n':
-        partial_protein = "NOT PARTIAL"
-        search_term = str(str(user_input) + "[ORGN]" + " AND " + str(protein_type) + "[PROT] "+str(partial_protein))
-        print("Your search term is ", search_term)
-        time.sleep(0.5)
-        return search_term
-    else:
-        # get the user_input and protein_type as search_term
-        search_term = str(str(user_input) + "[ORGN]" + " AND " + str(protein_type) + "[PROT]")
-        print("Your search term is ",search_term)
-        time.sleep(0.5)
-        return search_term
-
-# get the search term
-try:
-    search_term = get_search_term()
-except KeyboardInterrupt:
-    print("\nProgramme interrupted by the user.")
-    sys.exit(0)
-
-# use protein_esearch() to search for the search term on NCBI
-try:
-    esearch_result,file_name, seq_count = protein_esearch(search_term)
-except KeyboardInterrupt:
-    print("\nProgramme interrupted by the user.")
-    sys.exit(0)
+    search_term = build_search_term(user_input, protein_type, partial_protein)
+    print("Your search term is ", search_term)
+    pause(0.5)
+    return search_term
 ##### END OF PROCESS STEP 1_2 REFINE SEARCH TERMS #####
 ##### END OF STEP 1 #####
 
@@ -381,53 +521,42 @@ except KeyboardInterrupt:
 ##### PROCESS STEP 2_1 LIMIT PROTEIN SEQUENCE NUMBERS FROM FASTA FILE #####
 
 # define a function to get the minimum and maximum length of the protein sequences within the fasta file
-def get_min_and_max_seq_len():
+def get_min_and_max_seq_len(fasta_path):
     '''This function takes the minimum and maximum length of the protein sequences within the fasta file
     and returns the minimum and maximum length as a tuple'''
-    # count the sequence length for each sequence in the fasta file
-    # get the content of the fasta file into a variable and splitting the content into individual sequences
-    sequences = subprocess.getoutput("cat "+str(file_name)+".fasta").split('>')[1:]
-    # create a list to collect the sequence lengths
-    seq_lens = []
-    # count the length of each sequence and append seq_len into seq_lens
-    for sequence in sequences:
-        lines = sequence.split('\n')
-        header = lines[0]
-        seq_data = ''.join(lines[1:])
-        # count the length of each sequence
-        seq_len = len(seq_data)
-        seq_lens.append(seq_len)
-
-    # get the minimum and maximum length of the protein sequences within the fasta file
-    min_seq_len = min(seq_lens)
-    max_seq_len = max(seq_lens)
-    # return the minimum and maximum length as a tuple
+    # the index of the fasta file is built in a single pass and holds the length of every sequence,
+    # so the file is not read again when the lengths are needed later on
+    index = get_index(fasta_path)
+    # get the minimum and maximum length of the protein sequences within the fasta file and return them as a tuple
+    min_seq_len, max_seq_len = index.min_max()
     return min_seq_len, max_seq_len
 
 # ask the user whether they want to limit the number of sequences to use for the conervsation analysis
-def define_min_and_max_seq_len():
+def define_min_and_max_seq_len(fasta_path, seq_count):
     '''This function allows the user to decide whether they'd like to limit the number of sequences to use for the
     conservation analysis and to limit the seq num by defining a min and max sequence length.'''
     # inform the user how many sequences there are in the fasta file generated from the last step, so that they can make an informed decision
     print('\nWe will now determine and plot the level of conservation between the protein sequences.')
-    time.sleep(0.5)
+    pause(0.5)
     print('\nBefore we do that, you may wish to limit the number of sequences used for the conservation analysis.')
-    time.sleep(0.5)
+    pause(0.5)
     print('\nAn advantage of this is so that the analysis focuses on the most biologically meaningful data and that as little noise as possible is in the conservation plot.')
-    time.sleep(0.5)
+    pause(0.5)
     print('\nThere are ',int(seq_count),' sequences in your fasta file (containing protein sequences found on NCBI according to your search term).')
     # inform the user how long the shortest sequence is and the longest, so that they can make an informed decision
-    min_seq_len, max_seq_len = get_min_and_max_seq_len()
+    min_seq_len, max_seq_len = get_min_and_max_seq_len(fasta_path)
+    # the length filter answers how many sequences fall in any length window instantly, from the sorted sequence lengths
+    length_filter = LengthFilter(fasta_path)
     print('\nThe shortest sequence is ',min_seq_len,' amino acids long,'
                                                     '\nand the longest sequence is ', max_seq_len,' amino acids long.')
-    time.sleep(0.5)
+    pause(0.5)
     print('\nEnter \'y\' if you\'d like to reduce the number of sequences to use in the conservation analysis, and \'n\' if you want to skip this.')
-    time.sleep(0.5)
+    pause(0.5)
     # ask the user whether they'd like to proceed to reduce the number of sequences to use in the conservation analysis
     confirmation = get_confirmation()
     if confirmation == True:
         print("The programme will now prompt you to enter the minimum and maximum length of the protein sequences you'd like to use in the conservation analysis.")
-        time.sleep(0.5)
+        pause(0.5)
         while True:
             while True:
                 # get the minimum length of the protein sequences you'd like to use in the conservation analysis
@@ -438,7 +567,7 @@ def define_min_and_max_seq_len():
                     break
                 except ValueError:
                     print("Please enter an integer.")
-            time.sleep(0.5)
+            pause(0.5)
             while True:
                 # get the maximum length of the protein sequences you'd like to use in the conservation analysis
                 # error trap
@@ -449,443 +578,775 @@ def define_min_and_max_seq_len():
                 except:
                     print("Please enter an integer.")
                     continue
-            time.sleep(0.5)
+            pause(0.5)
             # remind the user of their input
             print("The minimum and maximum length of the protein sequences you'd like to use in the conservation analysis are "+ str(def_min_seq_len)+ " and "+ str(def_max_seq_len)+ ".")
             # get the sequence count after trimming the sequences
-            try:
-                trimmed_seq_count = subprocess.getoutput(
-                    "/localdisk/data/BPSM/ICA2/pullseq -i " + str(file_name) + ".fasta -m " + str(
-                        def_min_seq_len) + " -a " + str(def_max_seq_len)+"| grep -c '>'")
-            except:
-                print("The number of sequences in your trimmed fasta file is empty. Please enter a valid minimum and maximum length.")
-                time.sleep(0.5)
+            trimmed_seq_count = length_filter.count(def_min_seq_len, def_max_seq_len)
 
             print("The number of sequences in your trimmed fasta file is ", trimmed_seq_count)
-            time.sleep(0.5)
+            pause(0.5)
             # error trap: if max and min range is not appropriate
-            if int(trimmed_seq_count) == 0 or "not found" in trimmed_seq_count or 'Error' in trimmed_seq_count:
+            if trimmed_seq_count == 0:
                 print("Please enter a valid minimum and maximum length. (Do NOT proceed - bad things will happen!)")
-                time.sleep(0.5)
+                pause(0.5)
 
             # ask whether the user would like to proceed with the entered values
             confirmation = get_confirmation()
             if confirmation == True:
                 print("Thank you, proceeding with the analysis...")
-                time.sleep(0.5)
+                pause(0.5)
                 return def_min_seq_len,def_max_seq_len
             else:
                 print("Taking you back to the last step...")
-                time.sleep(0.5)
+                pause(0.5)
     # if the user does not want to apply any min or max length for sequences, then proceed with the analysis
     else:
         print("Thank you, proceeding with the analysis with default minimum and maxium sequence lengths...")
-        time.sleep(0.5)
+        pause(0.5)
         # give def_min_seq_len and def_max_seq_len default values
         def_max_seq_len, def_min_seq_len = int(max_seq_len), int(min_seq_len)
         print("The minimum and maximum length of the protein sequences you'd like to use in the conservation analysis are " + str(
                 def_min_seq_len) + " and " + str(def_max_seq_len) + ".")
-        time.sleep(0.5)
+        pause(0.5)
 
         return def_min_seq_len,def_max_seq_len
 
-# get the minimum and maximum length of the protein sequences to use in the conservation analysis
-def_min_seq_len, def_max_seq_len = define_min_and_max_seq_len()
+# define a function to save the sequences within the length window to a new file
+def trim_sequences(file_name, work_dir, def_min_seq_len, def_max_seq_len):
+    '''This function saves the sequences of {file_name}.fasta whose length is between def_min_seq_len and def_max_seq_len
+    to {file_name}_min{def_min_seq_len}_max{def_max_seq_len}.fasta, and returns that new file name (without .fasta)'''
+    # make sure the user entered integers for min and max length of sequences
+    if type(def_min_seq_len) != int or type(def_max_seq_len) != int:
+        print("Please enter integers for the minimum and maximum length of the protein sequences you'd like to use in the conservation analysis.")
+        sys.exit(1)
+    new_file_name = str(str(file_name) + "_min" + str(def_min_seq_len) + "_max" + str(def_max_seq_len))
+    kept = LengthFilter(os.path.join(work_dir, f"{file_name}.fasta")).write(
+        os.path.join(work_dir, f"{new_file_name}.fasta"), def_min_seq_len, def_max_seq_len)
+    get_report().count("trim", kept)
+    return new_file_name
+
+# define a function to collapse identical and near-identical sequences into one representative each
+def remove_redundancy(file_name, work_dir="."):
+    '''This function clusters the sequences of {file_name}.fasta at REDUNDANCY_IDENTITY identity, saves the representative
+    of every cluster to {file_name}_nr{identity}.fasta and the cluster membership to {file_name}_nr{identity}_clusters.csv,
+    and returns that new file name (without .fasta); only the representatives are analysed from then on.
+    If REDUNDANCY_IDENTITY is 0, every sequence is kept and file_name is returned unchanged.'''
+    if not REDUNDANCY_IDENTITY:
+        return file_name
+    nr_file_name = str(file_name) + "_nr" + str(int(round(REDUNDANCY_IDENTITY * 100)))
+    seq_count, representative_count = reduce_redundancy(os.path.join(work_dir, f"{file_name}.fasta"),
+                                                        os.path.join(work_dir, f"{nr_file_name}.fasta"),
+                                                        os.path.join(work_dir, f"{nr_file_name}_clusters.csv"),
+                                                        REDUNDANCY_IDENTITY)
+    get_report().count("dedup", seq_count)
+    print(f"{seq_count} sequences were collapsed into {representative_count} clusters of at least "
+          f"{REDUNDANCY_IDENTITY:.0%} identity; the cluster members are listed in {nr_file_name}_clusters.csv.")
+    pause(0.5)
+    return nr_file_name
 
 ##### END OF PROCESS STEP 2_1 LIMIT PROTEIN SEQUENCE NUMBERS FROM FASTA FILE #####
 
 ##### PROCESS STEP 2_2 PLOTTING THE LEVEL OF CONSERVATION BETWEEN THE PROTEIN SEQUENCES #####
 # define a function to determine and plot the level of conservation between the protein sequences
-def plot_conservation(file_name):
+def plot_conservation(file_name, work_dir="."):
     '''This function plots the level of conservation between the protein sequences
-    sequences: the fasta sequence of the protein asked for
+    file_name: the name of the fasta file (without .fasta) holding the protein sequences, in work_dir
     '''
+    if align_sequences(file_name, work_dir):
+        show_conservation(file_name, work_dir)
+
+# define a function to align the protein sequences and calculate their conservation
+def align_sequences(file_name, work_dir="."):
+    '''This function aligns the protein sequences in {file_name}.fasta and calculates their conservation
+    (the native engine saves the conservation curve as data, plotcon saves the plots).
+    It returns False if the sequences could not be aligned.'''
     print("Preparing your plot, please wait...")
-    time.sleep(0.5)
-    # use clustalo to get sequence alignment
-    try:
-        subprocess.call("clustalo --infile="+str(file_name)+".fasta --outfile="+ str(file_name)+ ".msf --threads=200 --force", shell = True)
-    except:
-        print("Something went wrong, please try again.")
-        sys.exit(1)
-    # sprotein1 specifies whether the sequence is a protein
-    subprocess.call("plotcon -sequences "+str(file_name)+".msf -sprotein1 True -winsize 4 -graph pdf -goutfile "+str(file_name), shell = True)
-    # save as file_name.pdf and file_name.1.png .1 is added because only then it can be opened by eog
-    subprocess.call("plotcon -sequences " + str(file_name) + ".msf -sprotein1 True -winsize 4 -graph png -goutfile " + str(file_name), shell=True)
+    pause(0.5)
+    file_path = os.path.join(work_dir, str(file_name))
+    # the clustering options depend on the number of sequences to align
+    seq_count = len(get_index(file_path+".fasta"))
+    get_report().count("align", seq_count)
+    clustalo_options = choose_options(seq_count)
+    # the alignment only depends on the sequences being aligned, so it is looked up in the artifact cache by their hash
+    with open(file_path+".fasta", "rb") as f:
+        alignment_key = artifact_key("clustalo", {"options": clustalo_options}, f.read())
+    if get_artifacts().get_file(alignment_key, file_path+".msf"):
+        print("Reusing the alignment of these sequences from the cache.")
+    else:
+        # use clustalo to get sequence alignment, with as many threads as the machine can spare for it
+        status = run_clustalo(file_path+".fasta", file_path+".msf", seq_count, options=clustalo_options)
+        if status == 0:
+            get_artifacts().put_file(alignment_key, "clustalo", file_path+".msf")
+    if not os.path.exists(file_path+".msf"):
+        print("The sequences could not be aligned, so the conservation plot is skipped.")
+        return False
+    if CONSERVATION_ENGINE == "native":
+        # convert the alignment once into a memory-mapped residue matrix and compute the conservation curve from it
+        # in-process, a block of sequences at a time; the curve is also saved as data
+        alignment_store = open_alignment_store(file_path+".msf")
+        counts = alignment_store.column_counts()
+        positions, similarity = sliding_window(column_similarity(counts), CONSERVATION_WINSIZE)
+        save_curve(positions, similarity, file_path)
+        # save the similarity and gap fraction of every column, and the identity of every sequence to the consensus
+        alignment_store.column_table(counts).to_csv(file_path+"_columns.csv", index=False)
+        alignment_store.sequence_table(counts).to_csv(file_path+"_identity.csv")
+        print('The conservation curve is saved in csv and npy files called', file_name+'_conservation.csv and',
+              file_name+'_conservation.npy.')
+        print('The column and sequence statistics of the alignment are saved in', file_name+'_columns.csv and',
+              file_name+'_identity.csv.')
+    else:
+        # the plots only depend on the alignment and the plotcon options
+        alignment = b""
+        if os.path.exists(file_path+".msf"):
+            with open(file_path+".msf", "rb") as f:
+                alignment = f.read()
+        # save as file_name.pdf and file_name.1.png .1 is added because only then it can be opened by eog
+        for graph, plot_path in (("pdf", file_path+".pdf"), ("png", file_path+".1.png")):
+            plot_key = artifact_key("plotcon", {"winsize": CONSERVATION_WINSIZE, "graph": graph}, alignment)
+            if get_artifacts().get_file(plot_key, plot_path):
+                continue
+            # sprotein1 specifies whether the sequence is a protein
+            status = get_report().call("plotcon -sequences "+file_path+".msf -sprotein1 True -winsize "+str(CONSERVATION_WINSIZE)+
+                                       " -graph "+graph+" -gdirectory "+str(work_dir)+" -goutfile "+str(file_name),
+                                       inputs=[file_path+".msf"], outputs=[plot_path], shell = True)
+            if status == 0 and alignment:
+                get_artifacts().put_file(plot_key, "plotcon", plot_path)
+    return True
+
+# define a function to draw the conservation plot and show it to the user
+def show_conservation(file_name, work_dir="."):
+    '''This function draws the conservation curve saved by align_sequences (the native engine) in a pdf and a png file
+    and shows the plot to the user.'''
+    file_path = os.path.join(work_dir, str(file_name))
+    if CONSERVATION_ENGINE == "native":
+        positions, similarity = np.load(file_path+"_conservation.npy")
+        # draw the plot once and save it in both formats
+        plot_curve(positions, similarity, "Conservation of "+str(file_name), [file_path+".pdf", file_path+".1.png"])
     # tell the user where the plot is saved
     print('The conservation plot is saved in a pdf file and a png file called', file_name, '1.png and ', file_name, 'pdf respectively.')
-    time.sleep(0.5)
-    # open the plot
-    print('Opening a new window to show the plot, please close it after viewing to proceed...')
-    time.sleep(0.5)
-    subprocess.call("eog "+str(file_name)+".1.png", shell=True)
-
-# this is where we use pullseq to allow the user to limit the number of sequences
-# make sure the user entered integers for min and max length of sequences
-if type(def_min_seq_len) == int and type(def_max_seq_len) == int:
-    trimmed_seq = subprocess.getoutput("/localdisk/data/BPSM/ICA2/pullseq -i "+str(file_name)+".fasta -m "+str(def_min_seq_len)+" -a "+str(def_max_seq_len))
-    # save the trimmed sequence to a new file
-    new_file_name = str(str(file_name) + "_min" + str(def_min_seq_len) + "_max" + str(def_max_seq_len))
-    with open(f"{new_file_name}" + ".fasta", "w") as f:
-        f.write(trimmed_seq)
-        f.close()
-    # plot the conservation of the trimmed sequence
-    plot_conservation(new_file_name)
-else:
-    print("Please enter integers for the minimum and maximum length of the protein sequences you'd like to use in the conservation analysis.")
-    sys.exit(1)
+    pause(0.5)
+    # open the plot (not in batch mode, where nobody is there to close the window)
+    if not BATCH_MODE:
+        print('Opening a new window to show the plot, please close it after viewing to proceed...')
+        pause(0.5)
+    if CONSERVATION_ENGINE == "native":
+        show_plot()
+    elif not BATCH_MODE:
+        get_report().call("eog "+file_path+".1.png", inputs=[file_path+".1.png"], shell=True)
 
 ##### END OF PROCESS STEP 2_2 #####
+
+##### PROCESS STEP 2_3 COMPARING THE K-MER CONTENTS OF THE PROTEIN SEQUENCES #####
+# define a function to compare every sequence with every other one by their k-mer contents
+def similarity_overview(seq_data_dict, file_name, work_dir="."):
+    '''This function compares the k-mer profiles of all the sequences in seq_data_dict with each other, saves the
+    nearest neighbours of every sequence to {file_name}_neighbours.csv and returns the accession IDs and the
+    similarity matrix to draw in the heatmap (None if the overview is turned off or there are too few sequences).'''
+    if not SIMILARITY_NEIGHBOURS or len(seq_data_dict) < 2:
+        return None
+    profiles = build_profiles(seq_data_dict)
+    neighbours = nearest_neighbours(profiles, SIMILARITY_NEIGHBOURS)
+    neighbours.to_csv(os.path.join(work_dir, f"{file_name}_neighbours.csv"), index=False)
+    get_report().count("similarity", len(profiles))
+    print('The nearest neighbours of every sequence by k-mer similarity are saved in a csv file called',
+          f'{file_name}_neighbours.csv.')
+    return heatmap_matrix(profiles)
+
+# define a function to draw the similarity heatmap
+def show_similarity(heatmap, file_name, work_dir="."):
+    '''This function draws the clustered similarity heatmap returned by similarity_overview in
+    {file_name}_similarity.png and shows the plot to the user.'''
+    if heatmap is None:
+        return
+    accessions, matrix = heatmap
+    plot_heatmap(accessions, matrix, "k-mer Similarity of "+str(file_name),
+                 os.path.join(work_dir, f"{file_name}_similarity.png"))
+    print('The similarity heatmap is saved in a png file called', f'{file_name}_similarity.png.')
+    pause(0.5)
+    if not BATCH_MODE:
+        print('Opening a new window to show the plot, please close it after viewing to proceed...')
+    show_plot()
+
+##### END OF PROCESS STEP 2_3 #####
 ##### END OF STEP 2 #####
 
 ##### STEP 3 SCANNING THE PROTEIN SEQUENCE WITH MOTIFS FROM THE PROSITE DATABASE #####
 ##### PROCESS STEP 3_1 EXTRACTING SEQUENCES FROM THE FASTA FILE TO A FOLDER CONTAINING ALL SEQUENCES AS FASTA FILES #####
 
 # define a function to extract the sequences from the fasta file to a folder containing all sequences as fasta files
-def extract_seq(file_name):
+def extract_seq(file_name, work_dir=".", write_files=None):
     '''This function takes the fasta sequence containing multiple sequences as an input and extracts the sequences to separate files.
     The separate files are saved in a new folder and each sequence is also saved as a dictionary item with their accession ID as their key
+    write_files: write the separate files (by default only when the EMBOSS tools are run once per sequence file)
     '''
+    if write_files is None:
+        write_files = EMBOSS_MODE == "per-sequence"
     # create a new directory to save the extracted sequences
-    new_dir = str("sequences_"+str(file_name))
+    new_dir = os.path.join(work_dir, "sequences_"+str(file_name))
     # 'exist_ok = True' makes sure no error is returned if the directory already exists
     os.makedirs(f"{new_dir}",exist_ok=True)
-    # split the sequences within the fasta file into individual sequences
-    # get the content of the fasta file into a variable and splitting the content into individual sequences
-    sequences = subprocess.getoutput("cat "+str(file_name)+".fasta").split('>')[1:]
     # define an empty dictionary to collect seq_data
     seq_data_dict = {}
-    # extract the sequence data of each sequence in the fasta file
-    for sequence in sequences:
-        # split the sequence into individual
-        lines = sequence.split('\n')
-        # save the accession ID by taking the first line in lines and splitting it by space
-        header = lines[0].split(' ')
-        # the first item in header is the accession ID
-        accession_id = header[0]
-        # join all the lines together to get the whole sequence
-        seq_data = ''.join(lines[1:])
-        # use a dictionary to save each item in result_name_dict as a value and its header as a key
+    # read the fasta file one sequence at a time, the accession ID is the first word of each header
+    for accession_id, header, seq_data in read_fasta(os.path.join(work_dir, str(file_name)+".fasta")):
+        # use a dictionary to save each sequence as a value and its accession ID as a key
         seq_data_dict[accession_id] = seq_data
         # save the sequence data to a new file
-        with open(f"./{new_dir}/{accession_id}" + ".fasta", "w") as f:
-            f.write(">"+str(header)+"\n")
-            f.write(seq_data)
-            f.close()
+        if write_files:
+            with open(os.path.join(new_dir, f"{accession_id}.fasta"), "w") as f:
+                write_fasta(f, header, seq_data)
     # inform the user where the files are saved
-    print('The extracted sequences are saved in a new folder called', f'{new_dir}', '.')
-    time.sleep(0.5)
+    if write_files:
+        print('The extracted sequences are saved in a new folder called', f'{new_dir}', '.')
+    get_report().count("extract", len(seq_data_dict))
+    pause(0.5)
     # return the dictionary of sequence data and the header
     return seq_data_dict
 
-# executing seq_data_dict and saving the dictionary as a global variable
-seq_data_dict = extract_seq(new_file_name)
+# define a function to list the sequence files extracted by extract_seq
+def list_sequence_files(seq_dir):
+    '''This function returns the paths of all the fasta files in seq_dir, sorted by name.'''
+    return [os.path.join(seq_dir, name) for name in sorted(os.listdir(seq_dir)) if name.endswith(".fasta")]
 ##### END OF PROCESS STEP 3_1 ####
 
 ##### PROCESS STEP 3_2 SCANNING THE PROTEIN SEQUENCE WITH MOTIFS FROM THE PROSITE DATABASE #####
-# now we need to scan the protein sequences with motifs from the PROSITE database
-# inform the user that the report is being prepared
-print('\nWe will now scan the protein sequences with motifs from the PROSITE database.'
-      '\nPROSITE is a database of protein families and domains with annotated patterns. '
-      '\nIt provides conserved motifs, functional insights, and cross-references to aid in protein analysis. '
-      '\nIt is usually used for predicting protein functions and guiding experimental studies.'
-      '\n***Please note: this only works for protein sequences, trying with anything else will return error! ***')
-
-time.sleep(0.5)
-print("Preparing your report, please wait...")
-time.sleep(0.5)
-# change directory to sequence_{file_name}
-os.chdir("./sequences_"+str(new_file_name))
-
-# get the list of all the sequences in the folder
-seq_list = subprocess.getoutput("ls *.fasta").split('\n')
-
-# create a new directory to save the outfiles from patmatmotifs
-new_dir = str("patmatmotifs_"+str(new_file_name))
-
-# 'exist_ok = True' makes sure no error is returned if the directory already exists
-os.makedirs(f"{new_dir}",exist_ok=True)
-
-# allow the user to decide whether they'd like to scan simple post-translational modifications
-print("Would you like to scan for simple post-translational modification sites? (y/n)"
-      "\nIf you choose \'n\', then simple post-translational modification sites will not be reported:"
-      "myristyl, asn_glycosylation,camp_phospho_site, pkc_phospho_site, ck2_phospho_site, and tyr_phospho_site.")
-time.sleep(0.5)
-# ask the user if they'd like to scan simple post-translational modifications
-confirmation = get_confirmation()
-# if the user would like to scan for simple post-translational modifications, continue with the scan
-if  confirmation == True:
-    # for loop to scan each sequence with patmatmotifs
-    for seq in seq_list:
-        # use patmatmotifs to scan a protein sequence with motifs from the PROSITE database
-        # scan the protein sequences with motifs form the PROSITE database and save the report as {seq}.patmatmotifs
-        subprocess.call("patmatmotifs -sequence "+ str(seq)
-                        +" -outfile "+str(seq)+".patmatmotifs", shell = True)
-# if the user would not like to scan for simple post-translational modifications, pass in the additional argument -prune
-else:
-    for seq in seq_list:
-        # use patmatmotifs to scan a protein sequence with motifs from the PROSITE database
-        # scan the protein sequences with motifs form the PROSITE database and save the report as {seq}.patmatmotifs
-        subprocess.call("patmatmotifs -sequence "+ str(seq)
-                        +" -outfile "+str(seq)+".patmatmotifs -prune", shell = True)
-
-# move every patmatmotifs report to the new directory
-subprocess.call("mv *.patmatmotifs ./"+new_dir, shell=True)
-
-# change directory to {new_dir}:
-os.chdir(str(new_dir))
-# define a dictionary to collect seq_name as the key and motif names and count as values (a nested dict)
-seq_motif_dict = {}
-# for each sequence in the folder, read the patmatmotifs report and extract the motif names and counts
-for seq in seq_list:
-    with open(str(seq)+".patmatmotifs",'r') as f:
-        # initialise seq_name outside the loop and a dictionary to collect seq_name as the key and
-        # motif names and count as values
-        seq_name = None
-        # initialise motif_name outside the loop, this is our inner dictionary
-        motif_name_count = {}
-        # same as splitlines (ish)
-        lines = f.readlines()
-        for line in lines:
-            # if the line starts with '#    -sequence', then extract the sequence name
-            if line.startswith('#    -sequence'):
-                seq_name = line.split('-sequence')[1]
-                seq_name= seq_name.strip(".fasta\n")
-
-            # if 'Motif' is found, then extract the motif name and count of that motif
-            if 'Motif' in line:
-                # split the line into two parts: motif name and the count of it (+1 each time it's found)
-                motif_name = line.split(' = ')[1].strip()
-                # collect motif_name and increment the count in a dictionary,
-                # if the name does not exist, then insert the key with the value 0, which is the count for that motif
-                motif_name_count.setdefault(motif_name,0)
-                # increment by 1 for that motif_name
-                motif_name_count[motif_name] += 1
-        seq_motif_dict[seq_name] = motif_name_count
-        # remember to close the file connection
-        f.close()
-
-print('The reports for each sequenece in the fasta file with motifs from the PROSITE database'
-      'are saved in a new folder called', f'{new_dir}', '.')
-time.sleep(1)
-print('You are now in the new folder.')
-# convert the dictionary to a dataframe, with index as the column
-df = pd.DataFrame.from_dict(seq_motif_dict, orient='index')
-# fill the NaN values with 0
-df = df.fillna(0)
-# convert the dataframe to a csv file
-df.to_csv(f'{new_file_name}_motif_counts.csv',index=True)
-
-
-print('A summary file for all the sequences scanned with motifs from the PROSITE data base is saved'
-      'in a csv file called '+str(new_file_name)+'_motif_count.csv.')
-time.sleep(0.5)
-print('The summary file looks like this:')
-print(df)
-
-print('Plotting this in a bar plot...')
-# plotting this csv file
-df.plot.bar(stacked = True)
-plt.xlabel('Sequence Name')
-plt.ylabel('Motif Count')
-plt.title('Motif Counts in Each Sequence')
-plt.legend(title='Motif',bbox_to_anchor=(0.8, 1), loc='upper right',fontsize='small')
-plt.savefig(f"{new_file_name}.png")
-print('Opening the plot in a new window to show the plot, please close it after viewing to proceed...')
-plt.show()
-# inform the user where the report is saved
-print('The report is saved in a png file called '+str(new_file_name)+'.png.')
-time.sleep(0.5)
-print(f'Going back to the sequence_{new_file_name} directory, and moving onto the next step... ')
-time.sleep(0.5)
-os.chdir("..") # PWD = sequence_{new_file_name}
+# define a function to ask the user whether they'd like to scan for simple post-translational modifications
+def ask_prune():
+    '''This function asks the user whether they'd like to scan for simple post-translational modification sites.
+    It returns True if those sites should be left out of the scan (patmatmotifs -prune).'''
+    # allow the user to decide whether they'd like to scan simple post-translational modifications
+    print("Would you like to scan for simple post-translational modification sites? (y/n)"
+          "\nIf you choose \'n\', then simple post-translational modification sites will not be reported:"
+          "myristyl, asn_glycosylation,camp_phospho_site, pkc_phospho_site, ck2_phospho_site, and tyr_phospho_site.")
+    pause(0.5)
+    # ask the user if they'd like to scan simple post-translational modifications
+    confirmation = get_confirmation()
+    # if the user would not like to scan for simple post-translational modifications, pass in the additional argument -prune
+    return confirmation != True
+
+# define a function to scan the protein sequences with motifs from the PROSITE database
+def scan_motifs(seq_data_dict, new_file_name, work_dir=".", prune=False):
+    '''This function scans every sequence with the motifs from the PROSITE database, saves the motif counts of every sequence
+    to {new_file_name}_motif_counts.csv in sequences_{new_file_name}/patmatmotifs_{new_file_name} and returns them as a dataframe
+    prune: leave out the simple post-translational modification sites'''
+    # now we need to scan the protein sequences with motifs from the PROSITE database
+    # inform the user that the report is being prepared
+    print('\nWe will now scan the protein sequences with motifs from the PROSITE database.'
+          '\nPROSITE is a database of protein families and domains with annotated patterns. '
+          '\nIt provides conserved motifs, functional insights, and cross-references to aid in protein analysis. '
+          '\nIt is usually used for predicting protein functions and guiding experimental studies.'
+          '\n***Please note: this only works for protein sequences, trying with anything else will return error! ***')
+
+    pause(0.5)
+    print("Preparing your report, please wait...")
+    pause(0.5)
+    seq_dir = os.path.join(work_dir, "sequences_"+str(new_file_name))
+
+    # create a new directory to save the outfiles from patmatmotifs
+    new_dir = os.path.join(seq_dir, "patmatmotifs_"+str(new_file_name))
+
+    # 'exist_ok = True' makes sure no error is returned if the directory already exists
+    os.makedirs(f"{new_dir}",exist_ok=True)
+
+    # use the native PROSITE engine when the PROSITE pattern file is available: it reads prosite.dat once and scans every
+    # sequence in-process, instead of starting one patmatmotifs process per sequence; without it, patmatmotifs is run
+    # once per multi-sequence chunk (chunked mode) and its hits are handled the same way
+    if os.path.exists(PROSITE_DAT) or EMBOSS_MODE == "chunked":
+        if os.path.exists(PROSITE_DAT):
+            prosite_patterns = PrositePatterns(PROSITE_DAT)
+            motif_params = {"prosite": prosite_patterns.signature, "prune": prune}
+            scan = lambda sequences: prosite_patterns.scan(sequences, prune=prune)
+        else:
+            motif_params = {"engine": "patmatmotifs", "prune": prune}
+            scan = lambda sequences: scan_chunks(sequences, os.path.join(new_dir, str(new_file_name)), prune=prune,
+                                                 workers=SCAN_WORKERS)
+        # the sequences already scanned by the previous run of this analysis are taken from its _motif_hits.csv
+        motif_record = record_path(new_dir, new_file_name, "motifs")
+        seq_hits = previous_motif_hits(os.path.join(new_dir, f'{new_file_name}_motif_hits.csv'),
+                                       reusable_accessions(motif_record, motif_params, seq_data_dict) if INCREMENTAL else set())
+        # the hits of every other sequence are cached by the hash of the sequence, so only the sequences not seen before are scanned
+        cached_hits, missing = get_artifacts().lookup_sequences("motif_hits", motif_params, {accession: seq_data_dict[accession]
+                                                          for accession in seq_data_dict if accession not in seq_hits})
+        seq_hits.update(cached_hits)
+        print(f"Reusing the motif hits of {len(seq_data_dict) - len(missing)} sequences, scanning {len(missing)} sequences.")
+        new_hits = {accession: [] for accession in missing}
+        for accession, motif, start, end in scan({accession: seq_data_dict[accession] for accession in missing}):
+            if motif is not None and accession in new_hits:
+                new_hits[accession].append([motif, start, end])
+        get_artifacts().store_sequences("motif_hits", motif_params, seq_data_dict, new_hits)
+        seq_hits.update(new_hits)
+        # every hit is (accession, motif, start, end)
+        motif_hits = [(accession, motif, start, end) for accession in seq_data_dict for motif, start, end in seq_hits[accession]]
+        # count the motifs of every sequence
+        df = motif_count_table(motif_hits, seq_data_dict)
+        # save every motif hit, with its position, to a csv file
+        pd.DataFrame(motif_hits, columns=['Sequence Name', 'Motif', 'Start', 'End']).to_csv(
+            os.path.join(new_dir, f'{new_file_name}_motif_hits.csv'), index=False)
+        save_record(motif_record, motif_params, seq_data_dict)
+    else:
+        # get the list of all the sequences in the folder
+        seq_list = list_sequence_files(seq_dir)
+        # the reports are cached by the hash of the accession ID and sequence (the report names the sequence),
+        # so only the sequences not seen before are scanned
+        named_seqs = {}
+        for seq in seq_list:
+            accession_id = os.path.basename(seq)[:-len(".fasta")]
+            named_seqs[seq] = accession_id + "\n" + str(seq_data_dict.get(accession_id, ""))
+        # the reports of the sequences already scanned by the previous run of this analysis are read back from its folder
+        motif_params = {"engine": "patmatmotifs", "prune": prune}
+        motif_record = record_path(new_dir, new_file_name, "motifs")
+        reusable = reusable_accessions(motif_record, motif_params, seq_data_dict) if INCREMENTAL else set()
+        motif_reports = {}
+        for seq in seq_list:
+            report_path = os.path.join(new_dir, os.path.basename(seq)+".patmatmotifs")
+            if os.path.basename(seq)[:-len(".fasta")] in reusable and os.path.exists(report_path):
+                with open(report_path, 'r') as f:
+                    motif_reports[seq] = f.read()
+        cached_reports, missing = get_artifacts().lookup_sequences("patmatmotifs", {"prune": prune},
+                                                             {seq: named_seqs[seq] for seq in seq_list if seq not in motif_reports})
+        motif_reports.update(cached_reports)
+        print(f"Reusing the reports of {len(seq_list) - len(missing)} sequences, scanning {len(missing)} sequences.")
+        # use patmatmotifs to scan the protein sequences with motifs from the PROSITE database, running the scans in parallel;
+        # the reports are collected in memory as the scans finish
+        new_reports = scan_sequences(missing, prune=prune, workers=SCAN_WORKERS) if missing else {}
+        get_artifacts().store_sequences("patmatmotifs", {"prune": prune}, named_seqs, new_reports)
+        motif_reports.update(new_reports)
+
+        # for each sequence, save its patmatmotifs report as {seq}.patmatmotifs and read its motif hits in one pass
+        # over the report; every hit is (accession, motif, start, end)
+        motif_hits = []
+        for seq in seq_list:
+            motif_report = motif_reports[seq]
+            with open(os.path.join(new_dir, os.path.basename(seq)+".patmatmotifs"),'w') as f:
+                f.write(motif_report)
+            # the sequence is named after its file, e.g. sequences_{new_file_name}/{accession}.fasta
+            motif_hits.extend(parse_patmatmotifs(motif_report.splitlines(), name=os.path.basename(seq)[:-len(".fasta")]))
+        # count the motifs of every sequence, and save every motif hit, with its position, to a csv file
+        df = motif_count_table(motif_hits, seq_data_dict)
+        pd.DataFrame([hit for hit in motif_hits if hit[1] is not None], columns=['Sequence Name', 'Motif', 'Start', 'End']).to_csv(
+            os.path.join(new_dir, f'{new_file_name}_motif_hits.csv'), index=False)
+        save_record(motif_record, motif_params, seq_data_dict)
+        # the reports of sequences that are no longer found are removed
+        remove_stale_reports(new_dir, ".fasta.patmatmotifs", seq_data_dict)
+
+    print('The reports for each sequenece in the fasta file with motifs from the PROSITE database'
+          'are saved in a new folder called', f'{new_dir}', '.')
+    pause(1)
+    # convert the dataframe to a csv file
+    df.to_csv(os.path.join(new_dir, f'{new_file_name}_motif_counts.csv'),index=True)
+
+    print('A summary file for all the sequences scanned with motifs from the PROSITE data base is saved'
+          'in a csv file called '+str(new_file_name)+'_motif_count.csv.')
+    pause(0.5)
+    print('The summary file looks like this:')
+    print(df)
+    get_report().count("motifs", len(seq_data_dict))
+    return df
+
+# define a function to plot the motif counts of every sequence in a stacked bar plot
+def plot_motif_counts(df, new_file_name, work_dir="."):
+    '''This function plots the motif counts (df) in a stacked bar plot saved as {new_file_name}.png next to the motif counts csv file'''
+    new_dir = os.path.join(work_dir, "sequences_"+str(new_file_name), "patmatmotifs_"+str(new_file_name))
+    print('Plotting this in a bar plot...')
+    # a plot needs at least one motif to show
+    if df.empty or len(df.columns) == 0:
+        print('No motif was found, so there is nothing to plot.')
+        return
+    # plotting this csv file
+    df.plot.bar(stacked = True)
+    plt.xlabel('Sequence Name')
+    plt.ylabel('Motif Count')
+    plt.title('Motif Counts in Each Sequence')
+    plt.legend(title='Motif',bbox_to_anchor=(0.8, 1), loc='upper right',fontsize='small')
+    plt.savefig(os.path.join(new_dir, f"{new_file_name}.png"))
+    if not BATCH_MODE:
+        print('Opening the plot in a new window to show the plot, please close it after viewing to proceed...')
+    show_plot()
+    # inform the user where the report is saved
+    print('The report is saved in a png file called '+str(new_file_name)+'.png.')
+    pause(0.5)
 
 ##### END OF PROCESS STEP 3_2 #####
 ##### END OF STEP 3 #####
 
 ##### STEP 4 USING PEPSTATS TO RETRIEVE PROTEIN STATISTICS #####
 ##### PROCESS STEP 4_1 RUN PEPSTATS TO CALCULATE THE STATISTICS OF THE PROTEIN PROPERTIES ####
-# introducing this section and pepstats and things we'll do here
-print("We will now calculate and showcase the protein statistics using pepstats. ")
-time.sleep(0.5)
-print('The pepstats tool provides valuable information such as molecular weight, charge, isoelectric point, and more.')
-time.sleep(0.5)
-print("We will run pepstats on a set of protein sequences and extract key statistics to gain insights into the physicochemical properties of the proteins. ")
-time.sleep(0.5)
-print("\nThe calculated values will be further analysed and visualised to provide a comprehensive understanding of the protein dataset.")
-time.sleep(0.5)
-
-# create a new directory to save the outfiles from patmatmotifs
-new_dir = str("pepstats_"+str(new_file_name))
-
-# 'exist_ok = True' makes sure no error is returned if the directory already exists
-os.makedirs(f"{new_dir}",exist_ok=True)
-
-# for loop to scan each sequence with pepstats
-for seq in seq_list:
-    # use pepstats to calculate the statistics of the protein properties and save the report as {seq}.pepstats
-    subprocess.call("pepstats -sequence "+ str(seq)
-                    +" -outfile "+str(seq)+".pepstats", shell = True)
-
-# move every patmatmotifs report to the new directory
-subprocess.call("mv *.pepstats ./"+str(new_dir), shell=True)
-
-print('The protein statistics report for each sequenece in the fasta file'
-      'is saved in a new folder called', f'{new_dir}', '.')
-time.sleep(0.5)
+# define a function to calculate the statistics with one pepstats run per sequence and extract them from the reports
+def pepstats_statistics(seq_list, new_dir):
+    '''This function runs pepstats on every sequence file in seq_list, saves the reports in new_dir,
+    and returns the statistics extracted from the reports as a dataframe with the sequence name as the index'''
+    # for loop to scan each sequence with pepstats
+    for seq in seq_list:
+        # use pepstats to calculate the statistics of the protein properties and save the report as {seq}.pepstats in new_dir
+        report_path = os.path.join(new_dir, os.path.basename(seq))+".pepstats"
+        get_report().call("pepstats -sequence "+ str(seq) +" -outfile "+report_path,
+                          inputs=[seq], outputs=[report_path], shell = True)
+
+    print('The protein statistics report for each sequenece in the fasta file'
+          'is saved in a new folder called', f'{new_dir}', '.')
+    pause(0.5)
+
+    # read every report in one pass, line by line, straight into the columns of the table
+    def reports():
+        for seq in seq_list:
+            with open(os.path.join(new_dir, os.path.basename(seq))+".pepstats",'r') as f:
+                # the sequence is named after its file, e.g. sequences_{new_file_name}/{accession}.fasta
+                yield os.path.basename(seq)[:-len(".fasta")], f
+    return pepstats_table(reports())
+
+# define a function to calculate the statistics with one pepstats run per multi-sequence chunk
+def pepstats_chunk_statistics(sequences, prefix, workers=0):
+    '''This function runs pepstats once per multi-sequence chunk of sequences (a dictionary with the accession ID as the
+    key and the sequence as the value), one chunk per worker, and returns the statistics as a dataframe with the
+    accession ID as the index. The chunks are written to {prefix}_chunk{n}.fasta and their reports saved as
+    {prefix}_chunk{n}.pepstats.'''
+    chunks = write_chunks(sequences, prefix, chunk_count(len(sequences), workers))
+    # run the chunks side by side, every worker only waits on its own pepstats process
+    with ThreadPoolExecutor(max_workers=len(chunks)) as executor:
+        for path, accessions in chunks:
+            executor.submit(get_report().call, ["pepstats", "-sequence", path, "-outfile", os.path.splitext(path)[0]+".pepstats",
+                                                "-auto"], inputs=[path], outputs=[os.path.splitext(path)[0]+".pepstats"])
+    chunk_dfs = []
+    for path, accessions in chunks:
+        os.remove(path)
+        report_path = os.path.splitext(path)[0]+".pepstats"
+        if not os.path.exists(report_path):
+            raise RuntimeError("pepstats failed on " + path)
+        with open(report_path, 'r') as f:
+            chunk_df = pepstats_table([(None, f)])
+        # the report names every sequence; the names are turned back into the accession IDs of the chunk
+        chunk_df.index = [name for name, in demultiplex([(name,) for name in chunk_df.index], accessions)]
+        chunk_dfs.append(chunk_df)
+    print('The protein statistics reports are saved in', os.path.dirname(prefix), '.')
+    return pd.concat(chunk_dfs)
+
+# define a function to calculate the protein statistics of every sequence
+def calculate_statistics(seq_data_dict, new_file_name, work_dir="."):
+    '''This function calculates the protein statistics of every sequence, saves them to {new_file_name}_stats.csv in
+    sequences_{new_file_name}/pepstats_{new_file_name} and returns them as a dataframe (stats_df)'''
+    # introducing this section and pepstats and things we'll do here
+    print("We will now calculate and showcase the protein statistics using pepstats. ")
+    pause(0.5)
+    print('The pepstats tool provides valuable information such as molecular weight, charge, isoelectric point, and more.')
+    pause(0.5)
+    print("We will run pepstats on a set of protein sequences and extract key statistics to gain insights into the physicochemical properties of the proteins. ")
+    pause(0.5)
+    print("\nThe calculated values will be further analysed and visualised to provide a comprehensive understanding of the protein dataset.")
+    pause(0.5)
+    seq_dir = os.path.join(work_dir, "sequences_"+str(new_file_name))
+
+    # create a new directory to save the outfiles from pepstats
+    new_dir = os.path.join(seq_dir, "pepstats_"+str(new_file_name))
 
-# change directory to {new_dir}:
-os.chdir(str(new_dir))
+    # 'exist_ok = True' makes sure no error is returned if the directory already exists
+    os.makedirs(f"{new_dir}",exist_ok=True)
 
-time.sleep(1)
-print('You are now in the new folder.')
+    # the statistics of the sequences already processed by the previous run of this analysis are taken from its _stats.csv
+    stats_record = record_path(new_dir, new_file_name, "stats")
+    seq_stats = previous_rows(os.path.join(new_dir, f'{new_file_name}_stats.csv'),
+                              reusable_accessions(stats_record, {"engine": STATS_ENGINE}, seq_data_dict) if INCREMENTAL else set())
+    # the statistics of every other sequence are cached by the hash of the sequence, so only the sequences not seen before are computed
+    cached_stats, missing = get_artifacts().lookup_sequences("stats", {"engine": STATS_ENGINE}, {accession: seq_data_dict[accession]
+                                                       for accession in seq_data_dict if accession not in seq_stats})
+    seq_stats.update(cached_stats)
+    print(f"Reusing the statistics of {len(seq_data_dict) - len(missing)} sequences, calculating {len(missing)} sequences.")
+    # compute the statistics of every sequence at once in-process (the default), or with one pepstats run per sequence
+    if not missing:
+        new_stats_df = pd.DataFrame(columns=STATS_COLUMNS)
+    elif STATS_ENGINE == "native":
+        new_stats_df = protein_statistics({accession: seq_data_dict[accession] for accession in missing})
+    elif EMBOSS_MODE == "chunked":
+        new_stats_df = pepstats_chunk_statistics({accession: seq_data_dict[accession] for accession in missing},
+                                                 os.path.join(new_dir, str(new_file_name)), workers=SCAN_WORKERS)
+    else:
+        new_stats_df = pepstats_statistics([os.path.join(seq_dir, f"{accession}.fasta") for accession in missing], new_dir)
+    new_stats = new_stats_df.to_dict("index")
+    get_artifacts().store_sequences("stats", {"engine": STATS_ENGINE}, seq_data_dict, new_stats)
+    seq_stats.update(new_stats)
+    stats_df = pd.DataFrame.from_dict({accession: seq_stats[accession] for accession in seq_data_dict if accession in seq_stats},
+                                      orient='index').reindex(columns=STATS_COLUMNS)
+    save_record(stats_record, {"engine": STATS_ENGINE}, seq_data_dict)
+    # the reports of sequences that are no longer found are removed
+    remove_stale_reports(new_dir, ".fasta.pepstats", seq_data_dict)
 
 ##### END OF PROCESS STEP 4_1 #####
 
-##### PROCESS STEP 4_2 EXTRACT THE STATISTICS FROM THE REPORTS INTO A CSV FILE ####
-# define a dictionary to collect seq_name as the key and stat names and values as values (a nested dict)
-seq_stats_dict = {}
-
-# define regex for pattern matching (sigh... realising now that I could have done this for step 3...)
-# . matching any character except newline \d for digits, \s for white space, + for 1 or more of the instance
-pattern_mw = re.compile(r'Molecular weight = ([\d.]+)\s+Residues = (\d+)')
-pattern_average_residue_weight = re.compile(r"Average Residue Weight\s+=\s+([\d.]+)")
-pattern_charge = re.compile(r'Charge\s+=\s+([\d.]+)')
-pattern_isoelectric_point = re.compile(r'Isoelectric Point\s+=\s+([\d.]+)')
-pattern_a280_molar_extinction = re.compile(
-    r'A280 Molar Extinction Coefficients\s+=\s+(\d+)\s+\(reduced\)\s+(\d+)\s+\(cystine bridges\)')
-pattern_a280_extinction_1mgml = re.compile(
-    r'A280 Extinction Coefficients 1mg/ml\s+=\s+([\d.]+)\s+\(reduced\)\s+([\d.]+)\s+\(cystine bridges\)')
-
-# for each sequence in the folder, read the pepstats report and extract the statistic name and values
-for seq in seq_list:
-    with open(str(seq)+".pepstats",'r') as f:
-        # initialise seq_name outside the loop and a dictionary to collect seq_name as the key and
-        # basic statistics as values
-        seq_name = None
-        # initialise stats_data outside the loop, this is our inner dictionary
-        stats_data = {}
-        # same as splitlines (ish)
-        lines = f.readlines()
-        for line in lines:
-            # if the line starts with 'PEPSTATS of', then extract the sequence name
-            if line.startswith('PEPSTATS of'):
-                seq_name = line.split(' ')[2]
-                seq_name = seq_name.replace("'","").replace("[","")
-                seq_name = seq_name.rstrip('_')
-
-            # extract information regarding pep statistics by the patterns defined
-            match_mw = pattern_mw.search(line)
-            match_average_residue_weight = pattern_average_residue_weight.search(line)
-            match_charge = pattern_charge.search(line)
-            match_isoelectric_point = pattern_isoelectric_point.search(line)
-            match_a280_molar_extinction = pattern_a280_molar_extinction.search(line)
-            match_a280_extinction_1mgml = pattern_a280_extinction_1mgml.search(line)
-
-            # collect the basic statistics in the dictionary stats_data
-            if match_mw:
-                stats_data['Molecular Weight'] = float(match_mw.group(1))
-                stats_data['Number of Residues'] = int(match_mw.group(2))
-            if match_average_residue_weight:
-                stats_data['Average Residue Weight'] = float(match_average_residue_weight.group(1))
-            if match_charge:
-                stats_data['Charge'] = float(match_charge.group(1))
-            if match_isoelectric_point:
-                stats_data['Isoelectric Point'] = float(match_isoelectric_point.group(1))
-            if match_a280_molar_extinction:
-                stats_data['A280 Molar Extinction (Reduced)'] = int(match_a280_molar_extinction.group(1))
-                stats_data['A280 Molar Extinction (Cysteine Bridges)'] = int(match_a280_molar_extinction.group(2))
-            if match_a280_extinction_1mgml:
-                stats_data['A280 Extinction 1mg/ml (Reduced)'] = float(match_a280_extinction_1mgml.group(1))
-                stats_data['A280 Extinction 1mg/ml (Cysteine Bridges)'] = float(match_a280_extinction_1mgml.group(2))
-
-        # create a nested dictionary to collect the stats_data names and values for each sequence
-        seq_stats_dict[seq_name] = stats_data
-
-        # remember to close the file connection
-        f.close()
-
-# convert the seq_stats_dict dictionary to a dataframe, with index as the column
-stats_df = pd.DataFrame.from_dict(seq_stats_dict, orient='index')
-# save the dataframe as a csv file
-stats_df.to_csv(f'{new_file_name}_stats.csv',index=True)
-
-print('These are the protein statistics:')
-time.sleep(0.5)
-print(stats_df)
-time.sleep(0.5)
-print('A summary file for all the sequence statistics is saved '
-      'in a csv file called '+str(new_file_name)+'_stats.csv.')
-time.sleep(0.5)
+##### PROCESS STEP 4_2 SAVE THE STATISTICS INTO A CSV FILE ####
+    # save the dataframe as a csv file
+    stats_df.to_csv(os.path.join(new_dir, f'{new_file_name}_stats.csv'),index=True)
+
+    print('These are the protein statistics:')
+    pause(0.5)
+    print(stats_df)
+    pause(0.5)
+    print('A summary file for all the sequence statistics is saved '
+          'in a csv file called '+str(new_file_name)+'_stats.csv.')
+    pause(0.5)
+    get_report().count("stats", len(seq_data_dict))
+    return stats_df
 
 ##### END OF PROCESS STEP 4_2 #####
 
 ##### PROCESS STEP 4_3 PLOT THE STATISTICS IN BAR PLOTS ####
-print('Plotting this in bar plots...')
-time.sleep(0.5)
-# plotting this csv file
-# Plotting Molecular Weight
-stats_df['Molecular Weight'].plot(kind='bar', title='Molecular Weight')
-plt.xlabel('Proteins')
-plt.ylabel('Molecular Weight')
-plt.grid(True, axis='y')
-plt.xticks(rotation=45, ha='right')  # rotate x-axis labels for better visibility
-plt.suptitle("Protein Statistics - Molecular Weight", fontsize=16)
-plt.tight_layout()
-plt.savefig(f"{new_file_name}_molecular_weight.png")
-plt.show()
-
-# Plotting Charge
-stats_df['Charge'].plot(kind='bar', title='Charge')
-plt.xlabel('Proteins')
-plt.ylabel('Charge')
-plt.grid(True, axis='y')
-plt.xticks(rotation=45, ha='right')  # rotate x-axis labels for better visibility
-plt.suptitle("Protein Statistics - Charge", fontsize=16)
-plt.tight_layout()
-plt.savefig(f"{new_file_name}_charge.png")
-plt.show()
-
-# Plotting Isoelectric Point
-stats_df['Isoelectric Point'].plot(kind='bar', title='Isoelectric Point')
-plt.xlabel('Proteins')
-plt.ylabel('Isoelectric Point')
-plt.grid(True, axis='y')
-plt.xticks(rotation=45, ha='right')  # rotate x-axis labels for better visibility
-plt.suptitle("Protein Statistics - Isoelectric Point", fontsize=16)
-plt.tight_layout()
-plt.savefig(f"{new_file_name}_isoelectric_point.png")
-plt.show()
-
-# Plotting A280 Molar Extinction (Reduced)
-stats_df['A280 Molar Extinction (Reduced)'].plot(kind='bar', title='A280 Molar Extinction (Reduced)')
-plt.xlabel('Proteins')
-plt.ylabel('A280 Molar Extinction (Reduced)')
-plt.grid(True, axis='y')
-plt.xticks(rotation=45, ha='right')  # rotate x-axis labels for better visibility
-plt.suptitle("Protein Statistics - A280 Molar Extinction (Reduced)", fontsize=16)
-plt.tight_layout()
-plt.savefig(f"{new_file_name}_a280_molar_extinction.png")
-plt.show()
-
-# inform the user where the report is saved
-print('The report plots are saved in a png file called '+str(new_file_name)+'_stats.png.')
-time.sleep(0.5)
-print(f'Going back to the sequence_{new_file_name} directory, and moving onto the next step... ')
-time.sleep(0.5)
-os.chdir("..") # PWD = sequence_{new_file_name}
-
-# work-up:
-print('Going back to the directory where we started...')
-time.sleep(0.5)
-# deleting the individual fasta files in the sequences_{new_file_name} folder
-subprocess.call("rm -f *.fasta", shell=True)
-# go back to the original directory
-os.chdir("..") # PWD = where this script is stored.
-print("Thank you for using the ProteoQuest programme, exiting now...")
-time.sleep(2)
-sys.exit(0)
+# define a function to plot the protein statistics in bar plots
+def plot_statistics(stats_df, new_file_name, work_dir="."):
+    '''This function plots the molecular weight, charge, isoelectric point and A280 molar extinction of every sequence
+    in bar plots saved next to the statistics csv file'''
+    new_dir = os.path.join(work_dir, "sequences_"+str(new_file_name), "pepstats_"+str(new_file_name))
+    print('Plotting this in bar plots...')
+    pause(0.5)
+    # plotting this csv file, one bar plot per statistic: (column, title, file suffix)
+    plots = [('Molecular Weight', 'Molecular Weight', 'molecular_weight'),
+             ('Charge', 'Charge', 'charge'),
+             ('Isoelectric Point', 'Isoelectric Point', 'isoelectric_point'),
+             ('A280 Molar Extinction (Reduced)', 'A280 Molar Extinction (Reduced)', 'a280_molar_extinction')]
+    for column, title, suffix in plots:
+        stats_df[column].plot(kind='bar', title=title)
+        plt.xlabel('Proteins')
+        plt.ylabel(title)
+        plt.grid(True, axis='y')
+        plt.xticks(rotation=45, ha='right')  # rotate x-axis labels for better visibility
+        plt.suptitle("Protein Statistics - " + title, fontsize=16)
+        plt.tight_layout()
+        plt.savefig(os.path.join(new_dir, f"{new_file_name}_{suffix}.png"))
+        show_plot()
+
+    # inform the user where the report is saved
+    print('The report plots are saved in a png file called '+str(new_file_name)+'_stats.png.')
+    pause(0.5)
+
+# define a function to clean up after the analysis
+def clean_up(new_file_name, work_dir="."):
+    '''This function deletes the individual fasta files in the sequences_{new_file_name} folder'''
+    seq_dir = os.path.join(work_dir, "sequences_"+str(new_file_name))
+    for seq in list_sequence_files(seq_dir):
+        os.remove(seq)
+
+# define a function to add the results of the analysis to the results warehouse
+def store_results(new_file_name, stats_df, work_dir=".", search_term=None, def_min_seq_len=None, def_max_seq_len=None):
+    '''This function adds the sequences of {new_file_name}.fasta, their motif hits (from {new_file_name}_motif_hits.csv)
+    and their protein statistics to the results warehouse RESULTS_DB, in one transaction, so they can be queried across
+    every run. It returns the run_id of the analysis, or None if there is no results warehouse.'''
+    if not RESULTS_DB:
+        return None
+    hits_path = os.path.join(work_dir, "sequences_"+str(new_file_name), "patmatmotifs_"+str(new_file_name),
+                             f"{new_file_name}_motif_hits.csv")
+    hits = pd.read_csv(hits_path) if os.path.exists(hits_path) else pd.DataFrame(columns=['Sequence Name', 'Motif', 'Start', 'End'])
+    store = ResultsStore(RESULTS_DB)
+    try:
+        run_id = store.add_run(new_file_name, work_dir, os.path.join(work_dir, f"{new_file_name}.fasta"),
+                               hits[['Sequence Name', 'Motif', 'Start', 'End']].itertuples(index=False, name=None),
+                               stats_df, search_term=search_term, min_length=def_min_seq_len,
+                               max_length=def_max_seq_len, source=LOCAL_PROTEIN_DB or "NCBI")
+    finally:
+        store.close()
+    get_report().count("store", len(hits))
+    print(f"The results of this analysis are added to the results warehouse {RESULTS_DB} as run {run_id}.")
+    return run_id
 
 ##### END OF PROCESS STEP 4_3 #####
 ##### END OF STEP 4 #####
-#############################################################
\ No newline at end of file
+
+##### RUNNING THE PIPELINE #####
+# define a function to run steps 2 to 4 on the sequences downloaded in step 1
+def analyse_sequences(file_name, work_dir, def_min_seq_len, def_max_seq_len, prune=None, search_term=None):
+    '''This function trims the downloaded sequences to the length window, plots their conservation, scans them with motifs
+    from the PROSITE database and calculates their protein statistics.
+    prune: leave out the simple post-translational modification sites (None asks the user)
+    search_term: the search the sequences were downloaded with, kept with the run in the results warehouse
+    It returns the new file name, the motif counts and the protein statistics.'''
+    # the stages run side by side, so every question is asked before the analysis starts
+    if prune is None:
+        prune = ask_prune()
+    # the analysis as a graph of stages: the sequences within the length window are saved to a new file, which is
+    # reduced to one representative per cluster of near-identical sequences (if asked for) and then aligned while the
+    # sequences are extracted; the k-mer similarity overview, the motif scan and the statistics only need the extracted
+    # sequences, so they run while the alignment is still being made
+    # every stage is timed in the run report
+    pipeline = Pipeline()
+    pipeline.add("trim", timed("trim", lambda: trim_sequences(file_name, work_dir, def_min_seq_len, def_max_seq_len)))
+    pipeline.add("dedup", timed("dedup", lambda new_file_name: remove_redundancy(new_file_name, work_dir)), after=["trim"])
+    pipeline.add("align", timed("align", lambda new_file_name: align_sequences(new_file_name, work_dir)), after=["dedup"])
+    pipeline.add("extract", timed("extract", lambda new_file_name: extract_seq(new_file_name, work_dir)), after=["dedup"])
+    pipeline.add("similarity", timed("similarity", lambda new_file_name, seq_data_dict: similarity_overview(
+        seq_data_dict, new_file_name, work_dir)), after=["dedup", "extract"])
+    pipeline.add("motifs", timed("motifs", lambda new_file_name, seq_data_dict: scan_motifs(seq_data_dict, new_file_name,
+                                                                                            work_dir, prune=prune)),
+                 after=["dedup", "extract"])
+    pipeline.add("stats", timed("stats", lambda new_file_name, seq_data_dict: calculate_statistics(seq_data_dict,
+                                                                                                   new_file_name, work_dir)),
+                 after=["dedup", "extract"])
+    # only one stage can be run under cProfile at a time, so the stages run one after the other while profiling
+    results = pipeline.run(workers=1 if get_report().profiling() else None)
+    new_file_name, df, stats_df = results["dedup"], results["motifs"], results["stats"]
+    # the plots are drawn (and shown) one after the other, once every stage has finished
+    with get_report().stage("plots"):
+        if results["align"]:
+            show_conservation(new_file_name, work_dir)
+        show_similarity(results["similarity"], new_file_name, work_dir)
+        plot_motif_counts(df, new_file_name, work_dir)
+        plot_statistics(stats_df, new_file_name, work_dir)
+    # the results of every run are kept together in the results warehouse (if there is one)
+    with get_report().stage("store"):
+        store_results(new_file_name, stats_df, work_dir, search_term, def_min_seq_len, def_max_seq_len)
+    # work-up: deleting the individual fasta files in the sequences_{new_file_name} folder
+    with get_report().stage("clean_up"):
+        clean_up(new_file_name, work_dir)
+    # save the run report next to the outputs
+    report_path = get_report().write(os.path.join(work_dir, f"{new_file_name}_run_report.json"))
+    print('The timings of this run are saved in', report_path)
+    return new_file_name, df, stats_df
+
+# define a function to run the whole programme interactively
+def run_interactive():
+    '''This function runs the programme interactively, asking the user for every decision along the way.'''
+    welcome()
+    # get the user input (taxonomic group) and refine it
+    user_input = get_input()
+    user_input = refine_tax_search_terms(user_input)
+    # get the search term and use protein_esearch() to search for the search term on NCBI
+    search_term = get_search_term(user_input)
+    fasta_path, file_name, seq_count, work_dir = protein_esearch(search_term)
+    # get the minimum and maximum length of the protein sequences to use in the conservation analysis
+    def_min_seq_len, def_max_seq_len = define_min_and_max_seq_len(fasta_path, seq_count)
+    analyse_sequences(file_name, work_dir, def_min_seq_len, def_max_seq_len, search_term=search_term)
+
+# define a function to run the whole programme without any prompt, from the command line options
+def run_batch(options):
+    '''This function runs the programme unattended, with every decision taken from the command line options (or config file).'''
+    # build the search term from the taxonomic group, protein and partial flag, unless a whole search term was given
+    search_term = options.search_term
+    if not search_term:
+        if not options.taxon or not options.protein:
+            print("Batch mode needs --taxon and --protein (or --search-term).")
+            sys.exit(2)
+        if not quality_check_user_input(options.taxon):
+            print("The taxonomic group you have specified is not valid:", options.taxon)
+            sys.exit(1)
+        search_term = build_search_term(options.taxon, options.protein, options.partial)
+    print("Your search term is ", search_term)
+    fasta_path, file_name, seq_count, work_dir = protein_esearch(search_term, max_seq_count=options.max_seqs,
+                                                                 out_dir=options.output_dir, make_folder=True)
+    # the length window defaults to the shortest and longest sequence found
+    min_seq_len, max_seq_len = get_min_and_max_seq_len(fasta_path)
+    def_min_seq_len = options.min_len if options.min_len is not None else int(min_seq_len)
+    def_max_seq_len = options.max_len if options.max_len is not None else int(max_seq_len)
+    if LengthFilter(fasta_path).count(def_min_seq_len, def_max_seq_len) == 0:
+        print("No sequence is between", def_min_seq_len, "and", def_max_seq_len, "amino acids long.")
+        sys.exit(1)
+    return analyse_sequences(file_name, work_dir, def_min_seq_len, def_max_seq_len, prune=options.prune,
+                             search_term=search_term)
+
+# define a function to read the command line options
+def parse_arguments(argv=None):
+    '''This function reads the command line options. Options can also be given in a JSON config file (--config),
+    whose keys are the option names with underscores (e.g. "min_len"); options on the command line win over the file.'''
+    parser = argparse.ArgumentParser(description="Search NCBI protein sequences of a taxonomic group and analyse their "
+                                                 "conservation, PROSITE motifs and protein statistics. Without options the "
+                                                 "programme runs interactively; with --taxon/--protein, --search-term or "
+                                                 "--config it runs unattended in batch mode.")
+    parser.add_argument("--config", help="a JSON file with any of the options below")
+    parser.add_argument("--batch", action="store_true", help="run without any prompt, pause or viewer window")
+    parser.add_argument("--taxon", help="the taxonomic group, e.g. Aves")
+    parser.add_argument("--protein", help="the protein, e.g. glucose-6-phosphatase")
+    parser.add_argument("--partial", choices=["y", "n", "any"], default="any",
+                        help="search for partial proteins (y), non-partial proteins (n) or both (any, the default)")
+    parser.add_argument("--search-term", help="a complete NCBI protein search term, used instead of --taxon/--protein/--partial")
+    parser.add_argument("--min-len", type=int, help="the minimum sequence length (default: the shortest sequence)")
+    parser.add_argument("--max-len", type=int, help="the maximum sequence length (default: the longest sequence)")
+    parser.add_argument("--prune", dest="prune", action="store_true", default=False,
+                        help="leave simple post-translational modification sites out of the motif scan")
+    parser.add_argument("--no-prune", dest="prune", action="store_false", help="scan for every motif (the default)")
+    parser.add_argument("--identity", type=float, default=REDUNDANCY_IDENTITY,
+                        help="collapse sequences at least this identical (e.g. 0.95) into one representative before the "
+                             "analysis; the cluster members are saved in a csv file (default: 0, keep every sequence)")
+    parser.add_argument("--neighbours", type=int, default=SIMILARITY_NEIGHBOURS,
+                        help="the number of nearest neighbours listed for every sequence by k-mer similarity, next to a "
+                             "clustered similarity heatmap (default: %(default)s; 0 skips the similarity overview)")
+    parser.add_argument("--output-dir", default=".", help="the directory the outputs are saved in (default: .)")
+    parser.add_argument("--local-db", default=LOCAL_PROTEIN_DB,
+                        help="search this protein FASTA file (e.g. a UniProt or RefSeq dump) instead of NCBI; it is "
+                             "indexed the first time it is used")
+    parser.add_argument("--results-db", default=RESULTS_DB,
+                        help="add the sequences, motif hits and protein statistics of this run to this SQLite results "
+                             "warehouse, to query them across runs with results_store.py")
+    parser.add_argument("--max-seqs", type=int, default=MAX_SEQ_COUNT,
+                        help="the largest number of sequences a search may return (0 for no limit)")
+    parser.add_argument("--fetch-workers", type=int, default=FETCH_WORKERS, help="the number of download batches fetched at once")
+    parser.add_argument("--scan-workers", type=int, default=SCAN_WORKERS,
+                        help="the number of patmatmotifs scans run at once (0 for every core)")
+    parser.add_argument("--stats-engine", choices=["native", "pepstats"], default=STATS_ENGINE,
+                        help="how the protein statistics are calculated")
+    parser.add_argument("--emboss-mode", choices=["chunked", "per-sequence"], default=EMBOSS_MODE,
+                        help="run patmatmotifs and pepstats once per multi-sequence chunk (the default) or once per sequence")
+    parser.add_argument("--conservation-engine", choices=["native", "plotcon"], default=CONSERVATION_ENGINE,
+                        help="how the conservation is calculated")
+    parser.add_argument("--winsize", type=int, default=CONSERVATION_WINSIZE,
+                        help="the window size the conservation is averaged over (default: 4)")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="recompute every alignment, plot, motif scan and statistic instead of reusing cached ones")
+    parser.add_argument("--no-incremental", action="store_true",
+                        help="download and analyse every sequence again, instead of only those new since the last run")
+    parser.add_argument("--profile", default="",
+                        help="run these stages under cProfile, comma-separated (e.g. motifs,stats) or all; "
+                             "the profiles are saved next to the run report (the analysis stages then run one at a "
+                             "time instead of side by side)")
+    options = parser.parse_args(argv)
+    # read the config file, then parse the command line again so that its options win over the file
+    if options.config:
+        with open(options.config, "r") as f:
+            config = json.load(f)
+        parser.set_defaults(**{key.replace("-", "_"): value for key, value in config.items()})
+        options = parser.parse_args(argv)
+        options.batch = True
+    if options.taxon or options.search_term:
+        options.batch = True
+    return options
+
+# define the main function, which runs the programme
+def main(argv=None):
+    '''This function runs the programme, interactively or in batch mode depending on the command line options.'''
+    global BATCH_MODE, MAX_SEQ_COUNT, FETCH_WORKERS, SCAN_WORKERS, STATS_ENGINE, INCREMENTAL, EMBOSS_MODE
+    global CONSERVATION_ENGINE, CONSERVATION_WINSIZE, REDUNDANCY_IDENTITY, SIMILARITY_NEIGHBOURS
+    global RESULTS_DB
+    options = parse_arguments(argv)
+    BATCH_MODE = options.batch
+    MAX_SEQ_COUNT = options.max_seqs
+    FETCH_WORKERS = options.fetch_workers
+    SCAN_WORKERS = options.scan_workers
+    STATS_ENGINE = options.stats_engine
+    EMBOSS_MODE = options.emboss_mode
+    REDUNDANCY_IDENTITY = options.identity
+    SIMILARITY_NEIGHBOURS = options.neighbours
+    RESULTS_DB = options.results_db
+    CONSERVATION_ENGINE = options.conservation_engine
+    CONSERVATION_WINSIZE = options.winsize
+    get_artifacts().enabled = not options.no_cache
+    INCREMENTAL = INCREMENTAL and not options.no_incremental
+    start_report(profile=[stage.strip() for stage in options.profile.split(",") if stage.strip()])
+    if options.local_db:
+        use_local_database(options.local_db)
+    try:
+        if BATCH_MODE:
+            # plots are only saved to files, so no display is needed
+            plt.switch_backend("Agg")
+            run_batch(options)
+        else:
+            run_interactive()
+    # allow the user to interrupt the programme
+    except KeyboardInterrupt:
+        print("\nProgramme interrupted by the user.")
+        sys.exit(0)
+    # report how many NCBI round-trips were answered by the EDirect cache
+    print(get_default_cache().report())
+    print(get_artifacts().report())
+    # where the time went
+    print(get_report().summary())
+    print("Thank you for using the ProteoQuest programme, exiting now...")
+    pause(2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,120 @@
+#!/usr/bin/python3
+'''A resource-aware launcher for the multiple aligner (clustalo).
+
+Instead of always asking clustalo for 200 threads, the number of threads is sized from the cores this process may run
+on (os.sched_getaffinity), the number of sequences (small alignments gain nothing from many threads) and the number of
+other ProteoQuest alignments running on the same machine at the same time, which are seen through small lock files in
+the cache directory. The clustering options follow the number of sequences: a full distance matrix for small sets,
+where it is cheap and more accurate, and clustalo's fast mBed guide trees without refinement iterations for large ones.
+The wall time of every alignment is appended to a timing log together with its configuration, so the thresholds can be
+tuned from real runs.
+'''
+import json
+import math
+import os
+import time
+import uuid
+
+from edirect_cache import DEFAULT_CACHE_DIR
+from motif_scan import available_cores
+from instrumentation import get_report
+
+# the lock files of the running alignments and the timing log
+JOBS_DIR = os.path.join(DEFAULT_CACHE_DIR, "jobs")
+TIMINGS_PATH = os.path.join(DEFAULT_CACHE_DIR, "alignment_timings.jsonl")
+
+# sets of up to FULL_DISTANCE_LIMIT sequences are clustered with a full distance matrix (clustalo --full)
+FULL_DISTANCE_LIMIT = int(os.environ.get("PROTEOQUEST_FULL_DISTANCE_LIMIT", 100))
+# one more thread is worth starting for every SEQUENCES_PER_THREAD sequences
+SEQUENCES_PER_THREAD = int(os.environ.get("PROTEOQUEST_SEQUENCES_PER_THREAD", 50))
+# the largest number of threads given to one alignment (0 for no limit)
+MAX_THREADS = int(os.environ.get("PROTEOQUEST_ALIGNER_MAX_THREADS", 0))
+
+
+def process_alive(pid):
+    '''This function returns True if a process with this pid is running.'''
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # the process exists but belongs to another user
+        return True
+    return True
+
+
+def running_jobs(jobs_dir=JOBS_DIR):
+    '''This function returns the lock files of the alignments running right now (the locks of processes that have
+    died are removed on the way).'''
+    jobs = []
+    if not os.path.isdir(jobs_dir):
+        return jobs
+    for name in os.listdir(jobs_dir):
+        path = os.path.join(jobs_dir, name)
+        try:
+            with open(path, "r") as f:
+                job = json.load(f)
+        except (OSError, ValueError):
+            continue
+        if process_alive(job.get("pid", -1)):
+            jobs.append(job)
+        else:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+    return jobs
+
+
+def choose_threads(seq_count, cores=None, other_jobs=0):
+    '''This function returns the number of threads for an alignment of seq_count sequences: an equal share of the
+    cores between this alignment and the other_jobs running, but no more than the sequences can keep busy.'''
+    if cores is None:
+        cores = available_cores()
+    share = max(1, cores // (other_jobs + 1))
+    useful = max(1, math.ceil(seq_count / SEQUENCES_PER_THREAD))
+    threads = min(share, useful)
+    if MAX_THREADS:
+        threads = min(threads, MAX_THREADS)
+    return threads
+
+
+def choose_options(seq_count):
+    '''This function returns the clustalo clustering options for an alignment of seq_count sequences.'''
+    if seq_count <= FULL_DISTANCE_LIMIT:
+        # a full distance matrix is cheap for a few sequences and gives a better guide tree
+        return ["--full"]
+    # mBed guide trees, no full distance matrix and no refinement iterations: the fast path for many sequences
+    return ["--iter=0"]
+
+
+def record_timing(record, timings_path=TIMINGS_PATH):
+    '''This function appends the configuration and wall time of an alignment to the timing log.'''
+    os.makedirs(os.path.dirname(timings_path), exist_ok=True)
+    with open(timings_path, "a") as f:
+        f.write(json.dumps(record) + "\n")
+
+
+def run_clustalo(in_path, out_path, seq_count, threads=None, options=None, jobs_dir=JOBS_DIR):
+    '''This function aligns the sequences in in_path with clustalo into out_path and returns its exit code.
+    seq_count: the number of sequences in in_path
+    threads, options: override the number of threads and the clustering options chosen from seq_count'''
+    os.makedirs(jobs_dir, exist_ok=True)
+    if options is None:
+        options = choose_options(seq_count)
+    if threads is None:
+        threads = choose_threads(seq_count, other_jobs=len(running_jobs(jobs_dir)))
+    # announce this alignment to the other ProteoQuest processes for as long as it runs
+    lock_path = os.path.join(jobs_dir, str(os.getpid()) + "-" + uuid.uuid4().hex + ".lock")
+    with open(lock_path, "w") as f:
+        json.dump({"pid": os.getpid(), "threads": threads, "sequences": seq_count}, f)
+    command = ["clustalo", "--infile=" + str(in_path), "--outfile=" + str(out_path),
+               "--threads=" + str(threads), "--force"] + options
+    start = time.perf_counter()
+    try:
+        status = get_report().call(command, inputs=[in_path], outputs=[out_path])
+    finally:
+        os.remove(lock_path)
+    record_timing({"time": time.time(), "sequences": seq_count, "threads": threads, "options": options,
+                   "cores": available_cores(), "seconds": round(time.perf_counter() - start, 3), "status": status})
+    return status
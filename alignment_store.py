@@ -0,0 +1,193 @@
+#!/usr/bin/python3
+'''A compact on-disk store for multiple alignments, read through numpy.memmap.
+
+The clustalo output is converted once into a raw matrix of uint8 residue codes (one row per sequence, one column per
+alignment position, the codes of conservation.py) and a side table of accession IDs. The conversion streams the
+alignment into the memory-mapped matrix (a FASTA alignment one sequence at a time, an MSF alignment one line of one
+block at a time, as its sequences are interleaved), and the statistics (column conservation, column gap fraction and the identity of
+every sequence to the consensus) are then computed a block of rows at a time from the memory-mapped matrix, so the
+memory used stays flat whatever the number of sequences: a 10000 x 2000 alignment is a 20 MB file and never more than
+one block of it is held in memory.
+'''
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from conservation import (GAP, encode, read_alignment, is_fasta_alignment, msf_names, msf_pieces, column_counts,
+                          column_similarity, sliding_window)
+
+# the number of sequences processed at a time
+DEFAULT_CHUNK_ROWS = 1024
+
+
+def store_paths(prefix):
+    '''This function returns the paths of the matrix, the accession table and the description of the store at prefix.'''
+    return prefix + ".aln.u8", prefix + ".aln.accessions", prefix + ".aln.json"
+
+
+def source_signature(path):
+    '''This function returns what identifies the version of an alignment file (its size and modification time).'''
+    stat = os.stat(path)
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def convert_alignment(alignment_path, prefix=None):
+    '''This function converts an alignment file (the FASTA or MSF written by clustalo) into an alignment store at prefix
+    (by default the alignment file without its extension), streaming it into the matrix, and returns the prefix.'''
+    if prefix is None:
+        prefix = os.path.splitext(alignment_path)[0]
+    matrix_path, accessions_path, description_path = store_paths(prefix)
+    if is_fasta_alignment(alignment_path):
+        rows, columns = write_fasta_alignment(alignment_path, matrix_path, accessions_path)
+    else:
+        rows, columns = write_msf_alignment(alignment_path, matrix_path, accessions_path)
+    with open(description_path, "w") as f:
+        json.dump({"rows": rows, "columns": columns, "source": os.path.abspath(alignment_path),
+                   "signature": source_signature(alignment_path)}, f)
+    return prefix
+
+
+def write_fasta_alignment(alignment_path, matrix_path, accessions_path):
+    '''This function writes a FASTA alignment to the matrix and the accession table one sequence at a time, and
+    returns the number of rows and columns.'''
+    # the first pass only measures the alignment, so that the matrix can be created at its final size
+    rows = 0
+    columns = 0
+    for accession, sequence in read_alignment(alignment_path):
+        rows += 1
+        columns = max(columns, len(sequence))
+    # the second pass writes every sequence to its row of the matrix as it is read
+    matrix = np.memmap(matrix_path, dtype=np.uint8, mode="w+", shape=(max(rows, 1), max(columns, 1)))
+    with open(accessions_path, "w") as f:
+        for i, (accession, sequence) in enumerate(read_alignment(alignment_path)):
+            codes = encode(sequence)
+            matrix[i, :len(codes)] = codes
+            matrix[i, len(codes):] = GAP
+            f.write(accession + "\n")
+    matrix.flush()
+    del matrix
+    return rows, columns
+
+
+def write_msf_alignment(alignment_path, matrix_path, accessions_path):
+    '''This function writes an MSF alignment to the matrix and the accession table one line of one block at a time
+    (every line goes straight to its place in the matrix), and returns the number of rows and columns.'''
+    names = msf_names(alignment_path)
+    row_of = {name: i for i, name in enumerate(names)}
+    # the first pass only measures the sequences, so that the matrix can be created at its final size
+    lengths = np.zeros(len(names), dtype=np.int64)
+    for name, piece in msf_pieces(alignment_path):
+        lengths[row_of[name]] += len(piece)
+    rows = len(names)
+    columns = int(lengths.max()) if rows else 0
+    # the second pass writes every piece next to the previous piece of the same sequence
+    matrix = np.memmap(matrix_path, dtype=np.uint8, mode="w+", shape=(max(rows, 1), max(columns, 1)))
+    ends = np.zeros(len(names), dtype=np.int64)
+    for name, piece in msf_pieces(alignment_path):
+        row = row_of[name]
+        matrix[row, ends[row]:ends[row] + len(piece)] = encode(piece)
+        ends[row] += len(piece)
+    # shorter sequences are padded with gaps
+    for row in np.flatnonzero(ends < columns):
+        matrix[row, ends[row]:] = GAP
+    matrix.flush()
+    del matrix
+    with open(accessions_path, "w") as f:
+        f.writelines(name + "\n" for name in names)
+    return rows, columns
+
+
+class AlignmentStore:
+    '''A multiple alignment stored as a memory-mapped uint8 matrix of residue codes.
+    prefix: the prefix the store was written to by convert_alignment
+    matrix: the (sequences x columns) numpy.memmap of residue codes
+    accessions: the accession ID of every row
+    '''
+
+    def __init__(self, prefix):
+        self.prefix = prefix
+        matrix_path, accessions_path, description_path = store_paths(prefix)
+        with open(description_path, "r") as f:
+            self.description = json.load(f)
+        with open(accessions_path, "r") as f:
+            self.accessions = [line.rstrip("\n") for line in f]
+        rows, columns = self.description["rows"], self.description["columns"]
+        if rows and columns:
+            self.matrix = np.memmap(matrix_path, dtype=np.uint8, mode="r", shape=(rows, columns))
+        else:
+            self.matrix = np.zeros((0, 0), dtype=np.uint8)
+
+    @property
+    def shape(self):
+        return self.matrix.shape
+
+    def column_counts(self, chunk_rows=DEFAULT_CHUNK_ROWS):
+        '''This function returns the (columns x codes) matrix of residue counts of every column.'''
+        return column_counts(self.matrix, chunk_rows)
+
+    def conservation(self, winsize=4, chunk_rows=DEFAULT_CHUNK_ROWS):
+        '''This function returns the conservation curve (positions and similarity) of the alignment.'''
+        return sliding_window(column_similarity(self.column_counts(chunk_rows)), winsize)
+
+    def gap_fraction(self, counts=None):
+        '''This function returns the fraction of gaps in every column.'''
+        if counts is None:
+            counts = self.column_counts()
+        return counts[:, GAP] / max(len(self.matrix), 1)
+
+    def consensus(self, counts=None):
+        '''This function returns the consensus residue code of every column (the most common residue, gaps left out;
+        GAP for a column made of gaps only).'''
+        if counts is None:
+            counts = self.column_counts()
+        consensus = counts[:, :GAP].argmax(axis=1).astype(np.uint8)
+        consensus[counts[:, :GAP].sum(axis=1) == 0] = GAP
+        return consensus
+
+    def identity(self, counts=None, chunk_rows=DEFAULT_CHUNK_ROWS):
+        '''This function returns, for every sequence, the fraction of its residues (gaps left out) that match the
+        consensus, and the fraction of the alignment columns where it has a gap.'''
+        consensus = self.consensus(counts)
+        identity = np.zeros(len(self.matrix))
+        gaps = np.zeros(len(self.matrix))
+        for start in range(0, len(self.matrix), chunk_rows):
+            chunk = np.asarray(self.matrix[start:start + chunk_rows])
+            residues = chunk != GAP
+            matches = (chunk == consensus) & residues
+            length = residues.sum(axis=1)
+            identity[start:start + len(chunk)] = np.divide(matches.sum(axis=1), length, out=np.zeros(len(chunk)),
+                                                           where=length > 0)
+            gaps[start:start + len(chunk)] = 1.0 - length / max(chunk.shape[1], 1)
+        return identity, gaps
+
+    def column_table(self, counts=None):
+        '''This function returns a dataframe with the similarity and the gap fraction of every alignment column.'''
+        if counts is None:
+            counts = self.column_counts()
+        return pd.DataFrame({'Column': np.arange(1, len(counts) + 1),
+                             'Similarity': np.round(column_similarity(counts), 4),
+                             'Gap Fraction': np.round(self.gap_fraction(counts), 4)})
+
+    def sequence_table(self, counts=None):
+        '''This function returns a dataframe with the identity to the consensus and the gap fraction of every sequence.'''
+        identity, gaps = self.identity(counts)
+        return pd.DataFrame({'Identity to Consensus': np.round(identity, 4), 'Gap Fraction': np.round(gaps, 4)},
+                            index=self.accessions)
+
+
+def open_alignment_store(alignment_path):
+    '''This function returns the AlignmentStore of an alignment file, converting the file first if it has no store yet
+    or has changed since its store was written.'''
+    prefix = os.path.splitext(alignment_path)[0]
+    description_path = store_paths(prefix)[2]
+    try:
+        with open(description_path, "r") as f:
+            description = json.load(f)
+        current = description.get("signature") == source_signature(alignment_path)
+    except (OSError, ValueError):
+        current = False
+    if not current:
+        convert_alignment(alignment_path, prefix)
+    return AlignmentStore(prefix)
@@ -0,0 +1,146 @@
+#!/usr/bin/python3
+'''A content-addressed cache for the outputs of the analysis steps (alignments, plots, motif hits and statistics).
+
+Every output is stored under the hash of what it was computed from: the input sequences (or alignment) plus the
+parameters of the tool. Re-running an analysis on the same sequences therefore reuses the clustalo alignment, the
+plotcon plots and the per-sequence motif hits and statistics instead of computing them again. Motif hits and
+statistics are cached per sequence, so when a few sequences are added to a search only those few are computed.
+Like the EDirect cache, the artifacts live in a small SQLite file, expire after a time-to-live and the least recently
+used entries are evicted once the cache grows past its size limit (both caches are sqlite_cache.TTLCache tables).
+'''
+import hashlib
+import json
+import os
+import sqlite3
+
+from edirect_cache import DEFAULT_CACHE_DIR
+from sqlite_cache import TTLCache
+
+# how long an artifact is kept and how large the artifact cache is allowed to grow
+# (both can be overridden with environment variables)
+DEFAULT_TTL = int(os.environ.get("PROTEOQUEST_ARTIFACT_TTL", 90 * 24 * 60 * 60))  # 90 days, in seconds
+DEFAULT_MAX_BYTES = int(os.environ.get("PROTEOQUEST_ARTIFACT_MAX_BYTES", 1024 * 1024 * 1024))  # 1 GB
+
+
+def artifact_key(kind, params, data):
+    '''This function returns the key (a sha256 hex digest) of an artifact of the given kind computed from data
+    (a string or bytes, e.g. a sequence or an alignment) with the tool parameters in params (a dictionary).'''
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    digest = hashlib.sha256(json.dumps([str(kind), params], sort_keys=True).encode("utf-8"))
+    digest.update(b"\0")
+    digest.update(data)
+    return digest.hexdigest()
+
+
+class ArtifactCache(TTLCache):
+    '''A persistent, TTL and size bounded LRU cache of analysis outputs.
+    path: the SQLite file used to store the artifacts
+    ttl: the number of seconds an artifact is kept for (0 or None disables expiry)
+    max_bytes: the total size of the stored artifacts before least recently used entries are evicted
+    enabled: when False nothing is read from or written to the cache (--no-cache)
+    '''
+
+    def __init__(self, path=None, ttl=DEFAULT_TTL, max_bytes=DEFAULT_MAX_BYTES, enabled=True):
+        if path is None:
+            path = os.path.join(DEFAULT_CACHE_DIR, "artifacts.sqlite")
+        TTLCache.__init__(self, path, "artifacts", [("kind", "TEXT"), ("value", "BLOB")], ttl, max_bytes)
+        self.enabled = enabled
+        # counters used by report()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        '''This function returns the artifact stored under key (as bytes), or None if there is no fresh entry.'''
+        if not self.enabled:
+            return None
+        row = self.lookup(key, ["value"])
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return bytes(row[0])
+
+    def put(self, key, kind, value):
+        '''This function stores an artifact (bytes or a string) under key.'''
+        if not self.enabled:
+            return
+        if isinstance(value, str):
+            value = value.encode("utf-8")
+        self.store([(key, len(value), (str(kind), sqlite3.Binary(value)))])
+
+    def get_json(self, key):
+        '''This function returns the artifact stored under key decoded from JSON, or None if there is no fresh entry.'''
+        value = self.get(key)
+        return None if value is None else json.loads(value.decode("utf-8"))
+
+    def put_json(self, key, kind, value):
+        '''This function stores a JSON-serialisable artifact under key.'''
+        self.put(key, kind, json.dumps(value))
+
+    def get_file(self, key, out_path):
+        '''This function writes the artifact stored under key to out_path and returns True, or returns False on a miss.'''
+        value = self.get(key)
+        if value is None:
+            return False
+        with open(out_path, "wb") as f:
+            f.write(value)
+        return True
+
+    def put_file(self, key, kind, path):
+        '''This function stores the contents of the file at path under key (missing files are not stored).'''
+        if self.enabled and os.path.exists(path):
+            with open(path, "rb") as f:
+                self.put(key, kind, f.read())
+
+    def lookup_sequences(self, kind, params, sequences):
+        '''This function looks up the per-sequence artifacts of every sequence.
+        sequences: a dictionary with the accession ID as the key and the sequence as the value
+        It returns a dictionary of the cached artifacts (by accession ID) and the list of accession IDs still to compute.'''
+        if not self.enabled:
+            return {}, list(sequences)
+        keys = {accession: artifact_key(kind, params, str(sequence)) for accession, sequence in sequences.items()}
+        # every sequence is looked up in one batch, rather than one query and one commit per sequence
+        rows = self.lookup_many(keys.values(), ["value"])
+        found = {}
+        missing = []
+        for accession, key in keys.items():
+            if key in rows:
+                found[accession] = json.loads(bytes(rows[key][0]).decode("utf-8"))
+            else:
+                missing.append(accession)
+        self.hits += len(found)
+        self.misses += len(missing)
+        return found, missing
+
+    def store_sequences(self, kind, params, sequences, values):
+        '''This function stores the per-sequence artifacts in values (a dictionary by accession ID).
+        Artifacts of accession IDs that are not in sequences are skipped.'''
+        if not self.enabled:
+            return
+        rows = []
+        for accession, value in values.items():
+            if accession in sequences:
+                value = json.dumps(value).encode("utf-8")
+                rows.append((artifact_key(kind, params, str(sequences[accession])), len(value),
+                             (str(kind), sqlite3.Binary(value))))
+        # all the artifacts are written in one transaction and the cache is trimmed once
+        self.store(rows)
+
+    def report(self):
+        '''This function returns a short, human readable summary of the artifact cache hits and misses of this run.'''
+        if not self.enabled:
+            return "Artifact cache: disabled."
+        return "Artifact cache: " + str(self.hits) + " hits, " + str(self.misses) + " misses."
+
+
+# a lazily created cache shared by the whole programme
+_default_cache = None
+
+
+def get_artifact_cache():
+    '''This function returns the ArtifactCache shared by the whole programme, creating it on first use.'''
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = ArtifactCache()
+    return _default_cache
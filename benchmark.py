@@ -0,0 +1,436 @@
+#!/usr/bin/python3
+'''A reproducible, offline benchmark of every stage of the ProteoQuest pipeline.
+
+A synthetic proteome of the requested size and length distribution is generated from a seed, and served to the
+download stage by a local stand-in for the NCBI E-utilities (answering esearch, espell and efetch from the synthetic
+FASTA file, so the batching of history_fetch.py runs as it would against NCBI). The external programs are replaced by
+small stand-in scripts put first on the PATH: clustalo, patmatmotifs and pepstats copy a report or an alignment
+generated beforehand (from the same sequences, in the format of the real tool), so what is measured is the cost of
+starting the programs and of everything ProteoQuest does around them: extract_seq, the motif report parser loop, the
+pepstats regex loop, the dataframes and the plots.
+
+Every stage is run on its own, one after the other, at every size (10, 1000 and 100000 sequences by default), and the
+wall time, the time spent in external programs and the number of records are appended with the git commit to a
+results file (benchmarks.jsonl in the cache directory), so the timings of different commits can be compared:
+
+    python3 benchmark.py --sizes 10,1000,100000
+    python3 benchmark.py --compare --size 1000
+
+The benchmark keeps its own caches in a scratch directory, so it neither reuses nor disturbs those of real runs.
+'''
+import argparse
+import contextlib
+import json
+import os
+import platform
+import shutil
+import stat
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+# the results file lives in the real cache directory, so it outlives the scratch directory and every checkout
+RESULTS_PATH = os.environ.get("PROTEOQUEST_BENCHMARK_RESULTS", os.path.join(
+    os.environ.get("PROTEOQUEST_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "proteoquest")),
+    "benchmarks.jsonl"))
+# the caches (EDirect, artifacts, PROSITE patterns, alignment timings) are kept in a scratch directory, which has to be
+# chosen before the ProteoQuest modules are imported (they read PROTEOQUEST_CACHE_DIR when they are imported)
+SCRATCH_DIR = tempfile.mkdtemp(prefix="proteoquest_benchmark_")
+os.environ["PROTEOQUEST_CACHE_DIR"] = os.path.join(SCRATCH_DIR, "cache")
+
+import matplotlib
+matplotlib.use("Agg")
+
+import ProteoQuest as pq
+from eutils import EutilsClient, RateLimiter
+from fasta import read_fasta, write_fasta, get_index
+from prosite import PrositePatterns
+from protein_stats import protein_statistics
+from motif_scan import available_cores
+from instrumentation import start_report, get_report
+
+# the stages measured, in the order they run
+STAGES = ["fetch", "trim", "extract", "align", "similarity", "motifs_native", "motifs_patmatmotifs",
+          "stats_native", "stats_pepstats", "plots", "clean_up"]
+DEFAULT_SIZES = [10, 1000, 100000]
+
+# the background amino acid frequencies of UniProtKB/Swiss-Prot, used to draw the synthetic sequences
+BACKGROUND = {"A": 8.25, "R": 5.53, "N": 4.06, "D": 5.45, "C": 1.37, "Q": 3.93, "E": 6.75, "G": 7.07, "H": 2.27,
+              "I": 5.96, "L": 9.66, "K": 5.84, "M": 2.42, "F": 3.86, "P": 4.70, "S": 6.56, "T": 5.34, "W": 1.08,
+              "Y": 2.92, "V": 6.87}
+
+# a few common PROSITE patterns, so that the motif stages find a realistic number of hits
+SYNTHETIC_PROSITE = [
+    ("ASN_GLYCOSYLATION", "PS00001", "N-glycosylation site.", "N-{P}-[ST]-{P}."),
+    ("CAMP_PHOSPHO_SITE", "PS00004", "cAMP- and cGMP-dependent protein kinase phosphorylation site.", "[RK](2)-x-[ST]."),
+    ("PKC_PHOSPHO_SITE", "PS00005", "Protein kinase C phosphorylation site.", "[ST]-x-[RK]."),
+    ("CK2_PHOSPHO_SITE", "PS00006", "Casein kinase II phosphorylation site.", "[ST]-x(2)-[DE]."),
+    ("MYRISTYL", "PS00008", "N-myristoylation site.", "G-{EDRKHPFYW}-x(2)-[STAGCN]-{P}."),
+    ("AMIDATION", "PS00009", "Amidation site.", "x-G-[RK]-[RK]."),
+    ("ZINC_FINGER_C2H2_1", "PS00028", "Zinc finger C2H2 type domain signature.", "C-x(2,4)-C-x(3)-[LIVMFYWC]-x(8)-H-x(3,5)-H."),
+]
+
+# copies the reports generated for every sequence of the FASTA file it reads (one sequence file or a multi-sequence chunk),
+# one after the other, as the EMBOSS tools report every sequence of their input
+CONCATENATE_REPORTS = ('exec awk -v reports="$PROTEOQUEST_BENCHMARK_REPORTS" -v suffix=SUFFIX \'/^>/ { '
+                       'split(substr($0, 2), words, " "); path = reports "/" words[1] ".fasta." suffix; '
+                       'while ((getline line < path) > 0) print line; close(path) }\' "$2"')
+# the stand-in programs: each one copies what was generated for the sequences (or the alignment) it is given
+STAND_INS = {
+    # patmatmotifs -sequence <path> -outfile stdout -auto [-prune]: the report goes to standard output
+    "patmatmotifs": CONCATENATE_REPORTS.replace("SUFFIX", "patmatmotifs") + "\n",
+    # pepstats -sequence <path> -outfile <report> [-auto]
+    "pepstats": CONCATENATE_REPORTS.replace("SUFFIX", "pepstats") + ' > "$4"\n',
+    # clustalo --infile=<fasta> --outfile=<alignment> ...
+    "clustalo": ('out=""\nfor word in "$@"; do\n    case "$word" in\n        --outfile=*) out="${word#--outfile=}";;\n'
+                 '    esac\ndone\nexec cp "$PROTEOQUEST_BENCHMARK_REPORTS/alignment.fasta" "$out"\n'),
+}
+
+
+def synthetic_proteome(path, count, mean_length=350, sd_length=150, min_length=30, max_length=2000, seed=0):
+    '''This function writes count synthetic protein sequences to the FASTA file at path and returns them as a
+    dictionary (accession ID: sequence). The lengths follow a log-normal distribution with the given mean and standard
+    deviation (clipped to min_length and max_length) and the residues are drawn from the Swiss-Prot background
+    frequencies, so the same seed always gives the same proteome.'''
+    rng = np.random.default_rng(seed)
+    # the parameters of the log-normal distribution with this mean and standard deviation
+    sigma = np.sqrt(np.log(1.0 + (sd_length / mean_length) ** 2))
+    mu = np.log(mean_length) - sigma ** 2 / 2.0
+    lengths = np.clip(rng.lognormal(mu, sigma, count).astype(np.int64), min_length, max_length)
+    residues = np.array(list(BACKGROUND), dtype="<U1")
+    weights = np.array(list(BACKGROUND.values()))
+    weights = weights / weights.sum()
+    sequences = {}
+    with open(path, "w") as f:
+        for i, length in enumerate(lengths, start=1):
+            accession = "SYN" + format(i, "07d") + ".1"
+            # every protein starts with a methionine
+            sequence = "M" + "".join(rng.choice(residues, int(length) - 1, p=weights))
+            write_fasta(f, accession + " synthetic protein " + str(i) + " [Synthetica benchmarkensis]", sequence)
+            sequences[accession] = sequence
+    return sequences
+
+
+def write_synthetic_prosite(path):
+    '''This function writes the synthetic PROSITE patterns to path in the prosite.dat format.'''
+    with open(path, "w") as f:
+        for entry_id, accession, description, pattern in SYNTHETIC_PROSITE:
+            f.write("ID   " + entry_id + "; PATTERN.\nAC   " + accession + ";\nDE   " + description + "\nPA   "
+                    + pattern + "\n//\n")
+
+
+class LocalTransport:
+    '''A stand-in for the NCBI E-utilities (esearch, espell and efetch), answering every search with the records of
+    one local FASTA file. It has the request(endpoint, params) method of eutils.HTTPTransport.'''
+
+    def __init__(self, fasta_path):
+        self.index = get_index(fasta_path)
+        self.positions = {accession: i for i, accession in enumerate(self.index.accessions)}
+
+    def records(self, numbers):
+        '''This function returns the FASTA records with these numbers (0-based, in file order) as bytes.'''
+        chunks = []
+        with open(self.index.path, "rb") as f:
+            for i in numbers:
+                f.seek(self.index.starts[i])
+                chunks.append(f.read(self.index.ends[i] - self.index.starts[i]))
+        return b"".join(chunks)
+
+    def request(self, endpoint, params):
+        if endpoint == "espell.fcgi":
+            return b"<eSpellResult><CorrectedQuery></CorrectedQuery></eSpellResult>"
+        if endpoint == "esearch.fcgi":
+            return ("<eSearchResult><Count>" + str(len(self.index)) + "</Count><RetMax>0</RetMax>"
+                    "<QueryKey>1</QueryKey><WebEnv>benchmark</WebEnv><IdList></IdList></eSearchResult>").encode("utf-8")
+        if endpoint == "efetch.fcgi":
+            if "id" in params:
+                numbers = [self.positions[accession] for accession in params["id"].split(",") if accession in self.positions]
+            else:
+                start = int(params.get("retstart", 0))
+                numbers = range(start, min(start + int(params.get("retmax", len(self.index))), len(self.index)))
+            if params.get("rettype") == "acc":
+                return "".join(self.index.accessions[i] + "\n" for i in numbers).encode("utf-8")
+            return self.records(numbers)
+        raise ValueError("the benchmark has no stand-in for " + str(endpoint))
+
+
+def patmatmotifs_report(accession, sequence, hits):
+    '''This function returns a patmatmotifs (dbmotif format) report of one sequence and its motif hits.'''
+    lines = ["########################################", "# Program: patmatmotifs",
+             "# Rundate: " + time.strftime("%a %d %b %Y %H:%M:%S"), "# Commandline: patmatmotifs",
+             "#    -sequence sequences/" + accession + ".fasta", "#    -outfile stdout", "#    -auto",
+             "# Report_format: dbmotif", "# Report_file: stdout", "########################################", "",
+             "#=======================================", "#",
+             "# Sequence: " + accession + "     from: 1   to: " + str(len(sequence)),
+             "# HitCount: " + str(len(hits)), "#", "# Full: No", "# Prune: No",
+             "# Data_file: /usr/share/EMBOSS/data/PROSITE/prosite.lines", "#",
+             "#=======================================", ""]
+    for motif, start, end in hits:
+        lines += ["Length = " + str(end - start + 1), "Start = position " + str(start) + " of sequence",
+                  "End = position " + str(end) + " of sequence", "", "Motif = " + motif, "",
+                  sequence[max(0, start - 6):start - 1] + " " + sequence[start - 1:end] + " " + sequence[end:end + 5],
+                  "", ""]
+    lines += ["#---------------------------------------", "#---------------------------------------", ""]
+    return "\n".join(lines)
+
+
+def pepstats_report(accession, sequence, stats):
+    '''This function returns a pepstats report of one sequence from its statistics (a row of protein_statistics).'''
+    lines = ["PEPSTATS of " + accession + " from 1 to " + str(len(sequence)), "",
+             "Molecular weight = " + format(stats['Molecular Weight'], ".2f") + " \t\tResidues = "
+             + str(stats['Number of Residues']) + "\t",
+             "Average Residue Weight  = " + format(stats['Average Residue Weight'], ".3f") + " \tCharge   = "
+             + format(stats['Charge'], ".1f") + "\t",
+             "Isoelectric Point = " + format(stats['Isoelectric Point'], ".4f"),
+             "A280 Molar Extinction Coefficients  = " + str(stats['A280 Molar Extinction (Reduced)']) + " (reduced)   "
+             + str(stats['A280 Molar Extinction (Cysteine Bridges)']) + " (cystine bridges)",
+             "A280 Extinction Coefficients 1mg/ml = " + format(stats['A280 Extinction 1mg/ml (Reduced)'], ".3f")
+             + " (reduced)   " + format(stats['A280 Extinction 1mg/ml (Cysteine Bridges)'], ".3f") + " (cystine bridges)",
+             "Improbability of expression in inclusion bodies = 0.500", "",
+             "Residue\t\tNumber\t\tMole%\t\tDayhoffStat"]
+    for residue in BACKGROUND:
+        number = sequence.count(residue)
+        lines.append(residue + " = " + residue + "\t\t" + str(number) + "\t\t"
+                     + format(100.0 * number / max(len(sequence), 1), ".3f") + "\t\t0.000\t")
+    lines.append("")
+    return "\n".join(lines)
+
+
+def write_stand_in_outputs(sequences, prosite_path, reports_dir):
+    '''This function writes what the stand-in programs copy: a patmatmotifs and a pepstats report of every sequence
+    and an alignment of all of them (every sequence padded with gaps to the length of the longest).'''
+    os.makedirs(reports_dir, exist_ok=True)
+    hits = {accession: [] for accession in sequences}
+    for accession, motif, start, end in PrositePatterns(prosite_path).scan(sequences):
+        hits[accession].append((motif, start, end))
+    stats = protein_statistics(sequences).to_dict("index")
+    for accession, sequence in sequences.items():
+        with open(os.path.join(reports_dir, accession + ".fasta.patmatmotifs"), "w") as f:
+            f.write(patmatmotifs_report(accession, sequence, hits[accession]))
+        with open(os.path.join(reports_dir, accession + ".fasta.pepstats"), "w") as f:
+            f.write(pepstats_report(accession, sequence, stats[accession]))
+    width = max(len(sequence) for sequence in sequences.values())
+    with open(os.path.join(reports_dir, "alignment.fasta"), "w") as f:
+        for accession, sequence in sequences.items():
+            write_fasta(f, accession, sequence + "-" * (width - len(sequence)))
+
+
+def install_stand_ins(bin_dir, reports_dir):
+    '''This function writes the stand-in programs to bin_dir and puts bin_dir first on the PATH.'''
+    os.makedirs(bin_dir, exist_ok=True)
+    for program, script in STAND_INS.items():
+        path = os.path.join(bin_dir, program)
+        with open(path, "w") as f:
+            f.write("#!/bin/sh\n# a ProteoQuest benchmark stand-in for " + program + "\n" + script)
+        os.chmod(path, os.stat(path).st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+    os.environ["PROTEOQUEST_BENCHMARK_REPORTS"] = reports_dir
+    os.environ["PATH"] = bin_dir + os.pathsep + os.environ.get("PATH", "")
+
+
+def git_commit():
+    '''This function returns the current git commit of the repository (with "+dirty" if it has uncommitted changes),
+    or None outside a git checkout.'''
+    repo_dir = os.path.dirname(os.path.abspath(__file__))
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=repo_dir, stdout=subprocess.PIPE,
+                                stderr=subprocess.DEVNULL, universal_newlines=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=repo_dir,
+                               stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, universal_newlines=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return commit + ("+dirty" if dirty else "")
+
+
+def run_stage(name, function, timings, log):
+    '''This function runs one stage, with everything it prints going to log, and records its wall time, the time
+    spent in external programs and the number of records processed in timings. It returns the result of the stage.'''
+    report = get_report()
+    first_subprocess = len(report.subprocesses)
+    first_records = dict(report.records)
+    began = time.perf_counter()
+    with contextlib.redirect_stdout(log), report.stage(name):
+        result = function()
+    seconds = time.perf_counter() - began
+    external = sum(record["seconds"] for record in report.subprocesses[first_subprocess:])
+    # the records counted by the pipeline's own instrumentation while the stage ran
+    records = sum(count - first_records.get(counter, 0) for counter, count in report.records.items())
+    timings[name] = {"seconds": round(seconds, 4), "external_seconds": round(external, 4),
+                     "runs": len(report.subprocesses) - first_subprocess, "records": records}
+    return result
+
+
+def benchmark_size(size, base_dir, stages=STAGES, seed=0, mean_length=350, sd_length=150, emboss_mode="chunked",
+                   report=print):
+    '''This function runs every stage in stages on a synthetic proteome of size sequences, in a new folder in
+    base_dir, and returns the timings of the stages.
+    emboss_mode: how the EMBOSS stand-ins are run ("chunked" or "per-sequence", see ProteoQuest.EMBOSS_MODE)'''
+    work_dir = os.path.join(base_dir, "size_" + str(size))
+    source_dir = os.path.join(work_dir, "source")
+    os.makedirs(source_dir, exist_ok=True)
+    # the setup (the proteome, the PROSITE patterns and everything the stand-ins copy) is not timed
+    setup_start = time.perf_counter()
+    source_path = os.path.join(source_dir, "proteome.fasta")
+    sequences = synthetic_proteome(source_path, size, mean_length, sd_length, seed=seed)
+    prosite_path = os.path.join(source_dir, "prosite.dat")
+    write_synthetic_prosite(prosite_path)
+    reports_dir = os.path.join(source_dir, "reports")
+    write_stand_in_outputs(sequences, prosite_path, reports_dir)
+    install_stand_ins(os.path.join(base_dir, "bin"), reports_dir)
+    report("  setup: " + format(time.perf_counter() - setup_start, ".1f") + " s")
+
+    # every stage starts cold: no cache, no previous run to reuse, no pause, no window
+    pq.BATCH_MODE = True
+    pq.INCREMENTAL = False
+    pq.get_artifacts().enabled = False
+    pq.SCAN_WORKERS = 1
+    pq.EMBOSS_MODE = emboss_mode
+    pq.CONSERVATION_ENGINE = "native"
+    pq.PROSITE_DAT = prosite_path
+    client = EutilsClient(transport=LocalTransport(source_path), cache=False)
+    # the stand-in answers at once, so there is nothing to rate limit
+    client.rate_limiter = RateLimiter(1e9)
+    pq.eutils = client
+    start_report()
+    timings = {}
+    file_name = "benchmark"
+    lengths = [len(sequence) for sequence in sequences.values()]
+    with open(os.path.join(work_dir, "benchmark.log"), "w") as log:
+        if "fetch" in stages:
+            run_stage("fetch", lambda: pq.fetch_sequences("Synthetica benchmarkensis[ORGN]", file_name, work_dir),
+                      timings, log)
+        else:
+            shutil.copy(source_path, os.path.join(work_dir, file_name + ".fasta"))
+        new_file_name = run_stage("trim", lambda: pq.trim_sequences(file_name, work_dir, min(lengths), max(lengths)),
+                                  timings if "trim" in stages else {}, log)
+        seq_data_dict = run_stage("extract", lambda: pq.extract_seq(new_file_name, work_dir),
+                                  timings if "extract" in stages else {}, log)
+        aligned = False
+        if "align" in stages:
+            aligned = run_stage("align", lambda: pq.align_sequences(new_file_name, work_dir), timings, log)
+        heatmap = None
+        if "similarity" in stages:
+            heatmap = run_stage("similarity", lambda: pq.similarity_overview(seq_data_dict, new_file_name, work_dir),
+                                timings, log)
+        df = stats_df = None
+        if "motifs_patmatmotifs" in stages:
+            # without a prosite.dat, scan_motifs falls back on one patmatmotifs run per sequence
+            pq.PROSITE_DAT = os.path.join(source_dir, "missing_prosite.dat")
+            df = run_stage("motifs_patmatmotifs", lambda: pq.scan_motifs(seq_data_dict, new_file_name, work_dir),
+                           timings, log)
+            pq.PROSITE_DAT = prosite_path
+        if "motifs_native" in stages:
+            df = run_stage("motifs_native", lambda: pq.scan_motifs(seq_data_dict, new_file_name, work_dir), timings, log)
+        if "stats_pepstats" in stages:
+            pq.STATS_ENGINE = "pepstats"
+            stats_df = run_stage("stats_pepstats", lambda: pq.calculate_statistics(seq_data_dict, new_file_name, work_dir),
+                                 timings, log)
+        if "stats_native" in stages:
+            pq.STATS_ENGINE = "native"
+            stats_df = run_stage("stats_native", lambda: pq.calculate_statistics(seq_data_dict, new_file_name, work_dir),
+                                 timings, log)
+        if "plots" in stages:
+            def plots():
+                if aligned:
+                    pq.show_conservation(new_file_name, work_dir)
+                pq.show_similarity(heatmap, new_file_name, work_dir)
+                if df is not None:
+                    pq.plot_motif_counts(df, new_file_name, work_dir)
+                if stats_df is not None:
+                    pq.plot_statistics(stats_df, new_file_name, work_dir)
+            run_stage("plots", plots, timings, log)
+        if "clean_up" in stages:
+            run_stage("clean_up", lambda: pq.clean_up(new_file_name, work_dir), timings, log)
+    return timings
+
+
+def record_results(size, timings, options, results_path=RESULTS_PATH):
+    '''This function appends the timings of one size to the results file, with what identifies the run.'''
+    os.makedirs(os.path.dirname(os.path.abspath(results_path)), exist_ok=True)
+    record = {"time": time.time(), "commit": git_commit(), "size": size, "seed": options.seed,
+              "mean_length": options.mean_length, "sd_length": options.sd_length, "emboss_mode": options.emboss_mode, "python": platform.python_version(),
+              "machine": platform.node(), "cores": available_cores(),
+              "stages": timings}
+    with open(results_path, "a") as f:
+        f.write(json.dumps(record) + "\n")
+
+
+def compare_results(size, results_path=RESULTS_PATH, last=5):
+    '''This function returns a table of the stage wall times of the last runs at size, one column per run
+    (labelled with its commit), from the results file.'''
+    runs = []
+    with open(results_path, "r") as f:
+        for line in f:
+            record = json.loads(line)
+            if record["size"] == size:
+                runs.append(record)
+    table = {}
+    for record in runs[-last:]:
+        label = (record["commit"] or "?") + " " + time.strftime("%m-%d %H:%M", time.localtime(record["time"]))
+        table[label] = {stage: timing["seconds"] for stage, timing in record["stages"].items()}
+    return pd.DataFrame(table).reindex([stage for stage in STAGES if any(stage in column for column in table.values())])
+
+
+def summary_table(timings):
+    '''This function returns the timings of one size as a table (a string).'''
+    rows = [{'Stage': name, 'Seconds': timing["seconds"], 'External Seconds': timing["external_seconds"],
+             'External Runs': timing["runs"], 'Records': timing["records"],
+             'Records/s': round(timing["records"] / timing["seconds"], 1) if timing["records"] and timing["seconds"] else ""}
+            for name, timing in timings.items()]
+    return pd.DataFrame(rows).to_string(index=False)
+
+
+def main(argv=None):
+    '''This function runs the benchmark (or compares recorded results) from the command line.'''
+    parser = argparse.ArgumentParser(description="Benchmark every stage of ProteoQuest offline on synthetic proteomes, "
+                                                 "with stand-ins for NCBI, clustalo, patmatmotifs and pepstats.")
+    parser.add_argument("--sizes", default=",".join(str(size) for size in DEFAULT_SIZES),
+                        help="the numbers of sequences to benchmark, comma-separated (default: 10,1000,100000)")
+    parser.add_argument("--stages", default=",".join(STAGES),
+                        help="the stages to time, comma-separated (default: all of " + ",".join(STAGES) + ")")
+    parser.add_argument("--seed", type=int, default=0, help="the seed of the synthetic proteomes (default: 0)")
+    parser.add_argument("--mean-length", type=float, default=350, help="the mean sequence length (default: 350)")
+    parser.add_argument("--sd-length", type=float, default=150,
+                        help="the standard deviation of the sequence lengths (default: 150)")
+    parser.add_argument("--emboss-mode", choices=["chunked", "per-sequence"], default="chunked",
+                        help="run patmatmotifs and pepstats once per chunk (the default) or once per sequence")
+    parser.add_argument("--results", default=RESULTS_PATH, help="the file the results are appended to")
+    parser.add_argument("--no-record", action="store_true", help="print the timings without recording them")
+    parser.add_argument("--keep", action="store_true", help="keep the scratch directory with every output")
+    parser.add_argument("--compare", action="store_true", help="compare the recorded results instead of running")
+    parser.add_argument("--size", type=int, default=1000, help="the size compared by --compare (default: 1000)")
+    options = parser.parse_args(argv)
+    if options.compare:
+        shutil.rmtree(SCRATCH_DIR, ignore_errors=True)
+        if not os.path.exists(options.results):
+            print("No results recorded in", options.results)
+            return 1
+        print(compare_results(options.size, options.results).to_string())
+        return 0
+    stages = [stage.strip() for stage in options.stages.split(",") if stage.strip()]
+    unknown = [stage for stage in stages if stage not in STAGES]
+    if unknown:
+        parser.error("unknown stages: " + ", ".join(unknown))
+    try:
+        for size in [int(size) for size in options.sizes.split(",") if size.strip()]:
+            print("Benchmarking", size, "sequences...")
+            timings = benchmark_size(size, SCRATCH_DIR, stages, options.seed, options.mean_length, options.sd_length,
+                                     options.emboss_mode)
+            print(summary_table(timings))
+            if not options.no_record:
+                record_results(size, timings, options, options.results)
+    finally:
+        if options.keep:
+            print("The outputs are kept in", SCRATCH_DIR)
+        else:
+            shutil.rmtree(SCRATCH_DIR, ignore_errors=True)
+    if not options.no_record:
+        print("The results are recorded in", options.results)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
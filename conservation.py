@@ -0,0 +1,203 @@
+#!/usr/bin/python3
+'''An in-process conservation engine, replacing the two plotcon runs (one per graph format) of the conservation step.
+
+The clustalo alignment is read once into a 2-D NumPy array of residue codes (one row per sequence, one column per
+alignment position). For every column the residues are counted, and the mean substitution score over every pair of
+sequences is computed from those counts with the EBLOSUM62 matrix used by plotcon:
+the sum over all pairs is (c.M.c - sum_a c_a M_aa) / 2 for the residue counts c of the column, so the cost grows with
+the number of sequences, not with the number of pairs. The scores are then averaged over a sliding window, saved as
+data (CSV and NPY) and drawn once with matplotlib, saved as both PDF and PNG.
+Gaps score 0 against anything, so gappy columns are pulled towards 0 as in plotcon.
+'''
+import matplotlib.pyplot as plt
+import numpy as np
+import pandas as pd
+
+from fasta import read_fasta
+
+# EBLOSUM62, as shipped with EMBOSS (rows and columns in the order of MATRIX_RESIDUES)
+MATRIX_RESIDUES = "ARNDCQEGHILKMFPSTWYVBZX*"
+BLOSUM62 = np.array([
+    [4, -1, -2, -2, 0, -1, -1, 0, -2, -1, -1, -1, -1, -2, -1, 1, 0, -3, -2, 0, -2, -1, 0, -4],
+    [-1, 5, 0, -2, -3, 1, 0, -2, 0, -3, -2, 2, -1, -3, -2, -1, -1, -3, -2, -3, -1, 0, -1, -4],
+    [-2, 0, 6, 1, -3, 0, 0, 0, 1, -3, -3, 0, -2, -3, -2, 1, 0, -4, -2, -3, 3, 0, -1, -4],
+    [-2, -2, 1, 6, -3, 0, 2, -1, -1, -3, -4, -1, -3, -3, -1, 0, -1, -4, -3, -3, 4, 1, -1, -4],
+    [0, -3, -3, -3, 9, -3, -4, -3, -3, -1, -1, -3, -1, -2, -3, -1, -1, -2, -2, -1, -3, -3, -2, -4],
+    [-1, 1, 0, 0, -3, 5, 2, -2, 0, -3, -2, 1, 0, -3, -1, 0, -1, -2, -1, -2, 0, 3, -1, -4],
+    [-1, 0, 0, 2, -4, 2, 5, -2, 0, -3, -3, 1, -2, -3, -1, 0, -1, -3, -2, -2, 1, 4, -1, -4],
+    [0, -2, 0, -1, -3, -2, -2, 6, -2, -4, -4, -2, -3, -3, -2, 0, -2, -2, -3, -3, -1, -2, -1, -4],
+    [-2, 0, 1, -1, -3, 0, 0, -2, 8, -3, -3, -1, -2, -1, -2, -1, -2, -2, 2, -3, 0, 0, -1, -4],
+    [-1, -3, -3, -3, -1, -3, -3, -4, -3, 4, 2, -3, 1, 0, -3, -2, -1, -3, -1, 3, -3, -3, -1, -4],
+    [-1, -2, -3, -4, -1, -2, -3, -4, -3, 2, 4, -2, 2, 0, -3, -2, -1, -2, -1, 1, -4, -3, -1, -4],
+    [-1, 2, 0, -1, -3, 1, 1, -2, -1, -3, -2, 5, -1, -3, -1, 0, -1, -3, -2, -2, 0, 1, -1, -4],
+    [-1, -1, -2, -3, -1, 0, -2, -3, -2, 1, 2, -1, 5, 0, -2, -1, -1, -1, -1, 1, -3, -1, -1, -4],
+    [-2, -3, -3, -3, -2, -3, -3, -3, -1, 0, 0, -3, 0, 6, -4, -2, -2, 1, 3, -1, -3, -3, -1, -4],
+    [-1, -2, -2, -1, -3, -1, -1, -2, -2, -3, -3, -1, -2, -4, 7, -1, -1, -4, -3, -2, -2, -1, -2, -4],
+    [1, -1, 1, 0, -1, 0, 0, 0, -1, -2, -2, 0, -1, -2, -1, 4, 1, -3, -2, -2, 0, 0, 0, -4],
+    [0, -1, 0, -1, -1, -1, -1, -2, -2, -1, -1, -1, -1, -2, -1, 1, 5, -2, -2, 0, -1, -1, 0, -4],
+    [-3, -3, -4, -4, -2, -2, -3, -2, -2, -3, -2, -3, -1, 1, -4, -3, -2, 11, 2, -3, -4, -3, -2, -4],
+    [-2, -2, -2, -3, -2, -1, -2, -3, 2, -1, -1, -2, -1, 3, -3, -2, -2, 2, 7, -1, -3, -2, -1, -4],
+    [0, -3, -3, -3, -1, -2, -2, -3, -3, 3, 1, -2, 1, -1, -2, -2, 0, -3, -1, 4, -3, -2, -1, -4],
+    [-2, -1, 3, 4, -3, 0, 1, -1, 0, -3, -4, 0, -3, -3, -2, 0, -1, -4, -3, -3, 4, 1, -1, -4],
+    [-1, 0, 0, 1, -3, 3, 4, -2, 0, -3, -3, 1, -1, -3, -1, 0, -1, -3, -2, -2, 1, 4, -1, -4],
+    [0, -1, -1, -1, -2, -1, -1, -1, -1, -1, -1, -1, -1, -1, -2, 0, 0, -2, -1, -1, -1, -1, -1, -4],
+    [-4, -4, -4, -4, -4, -4, -4, -4, -4, -4, -4, -4, -4, -4, -4, -4, -4, -4, -4, -4, -4, -4, -4, 1],
+], dtype=np.float64)
+
+# the code of a gap; every residue code is its row in BLOSUM62, so the codes fit in a uint8
+GAP = len(MATRIX_RESIDUES)
+GAP_CHARACTERS = "-.~"
+# the substitution matrix extended with a gap row and column scoring 0
+SCORES = np.zeros((GAP + 1, GAP + 1))
+SCORES[:GAP, :GAP] = BLOSUM62
+
+# a lookup table turning a byte into its residue code (letters not in the matrix are counted as X)
+CODES = np.full(256, MATRIX_RESIDUES.index("X"), dtype=np.uint8)
+for _i, _residue in enumerate(MATRIX_RESIDUES):
+    CODES[ord(_residue)] = _i
+    CODES[ord(_residue.lower())] = _i
+for _gap in GAP_CHARACTERS:
+    CODES[ord(_gap)] = GAP
+
+
+def encode(sequence):
+    '''This function turns an aligned sequence into an array of residue codes.'''
+    return CODES[np.frombuffer(str(sequence).encode("ascii", "replace"), dtype=np.uint8)]
+
+
+def msf_names(path):
+    '''This function returns the names of the sequences of an alignment in GCG MSF format, from its header.'''
+    names = []
+    with open(path, "r") as f:
+        for line in f:
+            # the header lists every sequence as "Name: <name> Len: ..." and ends with //
+            if line.strip().startswith("Name:"):
+                names.append(line.split()[1])
+            elif line.strip().startswith("//"):
+                break
+    return names
+
+
+def msf_pieces(path):
+    '''This function reads an alignment in GCG MSF format block by block and yields (name, piece of aligned sequence)
+    for every sequence line, in file order, so the alignment never has to be held in memory.'''
+    names = set(msf_names(path))
+    with open(path, "r") as f:
+        in_alignment = False
+        for line in f:
+            if not in_alignment:
+                in_alignment = line.strip().startswith("//")
+                continue
+            words = line.split()
+            if words and words[0] in names:
+                yield words[0], "".join(words[1:])
+
+
+def read_msf(path):
+    '''This function reads an alignment in GCG MSF format and yields (name, aligned sequence) for every sequence.
+    The sequences are interleaved block by block in the file, so the whole alignment is read before the first one
+    is yielded (alignment_store writes the blocks straight to disk with msf_pieces instead).'''
+    names = msf_names(path)
+    chunks = {name: [] for name in names}
+    for name, piece in msf_pieces(path):
+        chunks[name].append(piece)
+    for name in names:
+        yield name, "".join(chunks[name])
+
+
+def is_fasta_alignment(path):
+    '''This function returns True if an alignment file is FASTA (which clustalo writes by default whatever the file
+    is called), and False if it is GCG MSF.'''
+    with open(path, "r") as f:
+        for line in f:
+            if line.strip():
+                return line.startswith(">")
+    return False
+
+
+def read_alignment(path):
+    '''This function reads the clustalo output (FASTA, which clustalo writes by default whatever the file is called,
+    or GCG MSF) and yields (accession, aligned sequence) for every sequence.'''
+    if is_fasta_alignment(path):
+        for accession, header, sequence in read_fasta(path):
+            yield accession, sequence
+    else:
+        yield from read_msf(path)
+
+
+def load_alignment(path):
+    '''This function reads an alignment file into a 2-D array of residue codes (one row per sequence)
+    and returns it with the list of accession IDs.'''
+    accessions = []
+    rows = []
+    for accession, sequence in read_alignment(path):
+        accessions.append(accession)
+        rows.append(encode(sequence))
+    if not rows:
+        return np.zeros((0, 0), dtype=np.uint8), accessions
+    width = max(len(row) for row in rows)
+    alignment = np.full((len(rows), width), GAP, dtype=np.uint8)
+    for i, row in enumerate(rows):
+        alignment[i, :len(row)] = row
+    return alignment, accessions
+
+
+def column_counts(alignment, chunk_rows=1024):
+    '''This function counts the residue codes of every alignment column and returns a (columns x codes) matrix.
+    The alignment (any 2-D array of codes, e.g. a numpy.memmap) is read chunk_rows sequences at a time.'''
+    rows, columns = alignment.shape
+    counts = np.zeros((columns, GAP + 1), dtype=np.int64)
+    offsets = np.arange(columns, dtype=np.int64) * (GAP + 1)
+    for start in range(0, rows, chunk_rows):
+        chunk = np.asarray(alignment[start:start + chunk_rows], dtype=np.int64)
+        counts += np.bincount((chunk + offsets).ravel(), minlength=columns * (GAP + 1)).reshape(columns, GAP + 1)
+    return counts
+
+
+def column_similarity(counts, matrix=SCORES):
+    '''This function returns the mean substitution score over every pair of sequences for every column,
+    from the residue counts of the columns.'''
+    sequences = counts.sum(axis=1).astype(np.float64)
+    pairs = sequences * (sequences - 1) / 2.0
+    counts = counts.astype(np.float64)
+    # the sum over every pair of sequences: (c.M.c - sum_a c_a M_aa) / 2
+    pair_scores = (((counts @ matrix) * counts).sum(axis=1) - counts @ np.diag(matrix)) / 2.0
+    return np.divide(pair_scores, pairs, out=np.zeros_like(pair_scores), where=pairs > 0)
+
+
+def sliding_window(scores, winsize=4):
+    '''This function averages the scores over a sliding window of winsize columns.
+    It returns the positions (1-based, the centre of every window) and the averaged scores.'''
+    winsize = max(1, min(int(winsize), len(scores)))
+    if len(scores) == 0:
+        return np.zeros(0), np.zeros(0)
+    cumulative = np.concatenate(([0.0], np.cumsum(scores)))
+    averaged = (cumulative[winsize:] - cumulative[:-winsize]) / winsize
+    positions = np.arange(len(averaged)) + (winsize + 1) / 2.0
+    return positions, averaged
+
+
+def conservation_curve(alignment, winsize=4, chunk_rows=1024):
+    '''This function returns the conservation curve (positions and similarity) of an alignment array.'''
+    return sliding_window(column_similarity(column_counts(alignment, chunk_rows)), winsize)
+
+
+def save_curve(positions, similarity, out_prefix):
+    '''This function saves the conservation curve as {out_prefix}_conservation.csv and {out_prefix}_conservation.npy.'''
+    pd.DataFrame({'Position': positions, 'Similarity': np.round(similarity, 4)}).to_csv(
+        out_prefix + "_conservation.csv", index=False)
+    np.save(out_prefix + "_conservation.npy", np.vstack([positions, similarity]))
+
+
+def plot_curve(positions, similarity, title, plot_paths):
+    '''This function draws the conservation curve once and saves it to every path in plot_paths
+    (the format is taken from the extension). The figure is left open for the caller to show or close.'''
+    plt.figure(figsize=(10, 4))
+    plt.plot(positions, similarity, linewidth=1)
+    plt.axhline(0, color='grey', linewidth=0.5)
+    plt.xlabel('Relative Residue Position')
+    plt.ylabel('Similarity')
+    plt.title(title)
+    plt.tight_layout()
+    for plot_path in plot_paths:
+        plt.savefig(plot_path)
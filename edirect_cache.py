@@ -0,0 +1,122 @@
+#!/usr/bin/python3
+'''An on-disk cache for the EDirect (esearch/efetch/xtract) queries ProteoQuest sends to NCBI.
+
+A single ProteoQuest run asks NCBI the same question several times (the taxonomy look-up is done by both
+quality_check_user_input and get_scientific_names, the protein Count is asked by both quality_check_search_term
+and protein_esearch, and the refine loops repeat all of them). Every answer is saved in a small SQLite file keyed by
+the normalised (db, query, format) triple, so a repeated question costs no network round-trip at all.
+Entries expire after a time-to-live and the least recently used entries are evicted once the cache grows past its size
+limit (see sqlite_cache.TTLCache, which the artifact cache shares).
+'''
+import hashlib
+import json
+import os
+import re
+import time
+
+from sqlite_cache import TTLCache
+
+# where the cache lives, how long an entry is trusted and how large the cache is allowed to grow
+# (all three can be overridden with environment variables)
+DEFAULT_CACHE_DIR = os.environ.get("PROTEOQUEST_CACHE_DIR",
+                                   os.path.join(os.path.expanduser("~"), ".cache", "proteoquest"))
+DEFAULT_TTL = int(os.environ.get("PROTEOQUEST_CACHE_TTL", 7 * 24 * 60 * 60))  # one week, in seconds
+DEFAULT_MAX_BYTES = int(os.environ.get("PROTEOQUEST_CACHE_MAX_BYTES", 256 * 1024 * 1024))  # 256 MB
+
+# NCBI reports problems inside the output rather than through the exit code, so these answers are never cached
+FAILURE_MARKERS = ("FAILURE", "WARNING", "ERROR")
+
+
+def is_cacheable(value):
+    '''This function returns True if an answer from NCBI is worth caching, i.e. it is not empty
+    and does not contain a failure, warning or error.'''
+    return bool(value.strip()) and not any(marker in value for marker in FAILURE_MARKERS)
+
+
+def normalise_query(query):
+    '''This function normalises a query so that trivially different spellings of the same query share a cache entry.
+    Surrounding quotes are removed and runs of white space are collapsed into a single space.
+    The case is kept as it is, because Entrez boolean operators (AND, OR, NOT) must stay in upper case.'''
+    query = str(query).strip().strip('"').strip("'")
+    return re.sub(r"\s+", " ", query).strip()
+
+
+def cache_key(db, query, fmt):
+    '''This function returns the cache key (a sha256 hex digest) of the normalised (db, query, format) triple.'''
+    triple = [str(db).strip().lower(), normalise_query(query), str(fmt).strip().lower()]
+    return hashlib.sha256(json.dumps(triple).encode("utf-8")).hexdigest()
+
+
+class EDirectCache(TTLCache):
+    '''A persistent, TTL and size bounded LRU cache of EDirect answers.
+    path: the SQLite file used to store the answers
+    ttl: the number of seconds an answer is trusted for (0 or None disables expiry)
+    max_bytes: the total size of the stored answers before least recently used entries are evicted
+    '''
+
+    def __init__(self, path=None, ttl=DEFAULT_TTL, max_bytes=DEFAULT_MAX_BYTES):
+        if path is None:
+            path = os.path.join(DEFAULT_CACHE_DIR, "edirect_cache.sqlite")
+        columns = [("db", "TEXT"), ("query", "TEXT"), ("format", "TEXT"), ("value", "TEXT"), ("elapsed", "REAL")]
+        TTLCache.__init__(self, path, "entries", columns, ttl, max_bytes)
+        # counters used by report()
+        self.hits = 0
+        self.misses = 0
+        self.saved_seconds = 0.0
+        self.spent_seconds = 0.0
+
+    def get(self, db, query, fmt):
+        '''This function returns the cached answer for (db, query, fmt), or None if there is no fresh entry.'''
+        with self.lock:
+            # an expired entry is removed and treated as a miss
+            row = self.lookup(cache_key(db, query, fmt), ["value", "elapsed"])
+            if row is None:
+                return None
+            value, elapsed = row
+            self.hits += 1
+            self.saved_seconds += elapsed or 0.0
+            return value
+
+    def put(self, db, query, fmt, value, elapsed=0.0):
+        '''This function stores an answer for (db, query, fmt) together with the time it took to get it from NCBI.'''
+        self.store([(cache_key(db, query, fmt), len(value.encode("utf-8")),
+                     (str(db), normalise_query(query), str(fmt), value, elapsed))])
+
+    def get_or_compute(self, db, query, fmt, compute, cacheable=None):
+        '''This function returns the cached answer for (db, query, fmt), or calls compute() to get it from NCBI.
+        compute must return a string. cacheable is an optional function deciding whether a computed answer may be stored
+        (by default empty answers and answers containing a failure, warning or error are returned but never cached).'''
+        value = self.get(db, query, fmt)
+        if value is not None:
+            return value
+        self.misses += 1
+        start = time.perf_counter()
+        value = compute()
+        elapsed = time.perf_counter() - start
+        self.spent_seconds += elapsed
+        if cacheable is None:
+            cacheable = is_cacheable
+        if cacheable(value):
+            self.put(db, query, fmt, value, elapsed)
+        return value
+
+    def report(self):
+        '''This function returns a short, human readable summary of the cache hits and misses of this run
+        and of how much NCBI round-trip time the hits saved.'''
+        lookups = self.hits + self.misses
+        hit_rate = (100.0 * self.hits / lookups) if lookups else 0.0
+        return ("EDirect cache: " + str(self.hits) + " hits, " + str(self.misses) + " misses (" + format(hit_rate, ".0f")
+                + "% hit rate); " + format(self.saved_seconds, ".1f") + " s of NCBI round-trips saved, "
+                + format(self.spent_seconds, ".1f") + " s spent on misses.")
+
+
+# a lazily created cache shared by the whole programme
+_default_cache = None
+
+
+def get_default_cache():
+    '''This function returns the EDirectCache shared by the whole programme, creating it on first use.'''
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = EDirectCache()
+    return _default_cache
@@ -0,0 +1,160 @@
+#!/usr/bin/python3
+'''Single-pass, streaming parsers for the reports of EMBOSS patmatmotifs and pepstats.
+
+Every line is read once and dispatched on its first characters to the field it holds, instead of being matched against
+a list of regular expressions (pepstats) or searched for a keyword anywhere in the line (patmatmotifs). The parsers take
+any iterable of lines (e.g. an open file) and follow the sequence the lines belong to from the report itself, so a
+report holding many sequences (one EMBOSS run over a multi-sequence file) is parsed the same way as a report of one
+sequence. The rows are appended straight to a ColumnBuilder, which keeps one list per column and turns them into a
+dataframe at the end.
+'''
+import math
+import os
+
+import pandas as pd
+
+# the pepstats fields, in the order of protein_stats.STATS_COLUMNS
+PEPSTATS_COLUMNS = ['Molecular Weight', 'Number of Residues', 'Average Residue Weight', 'Charge', 'Isoelectric Point',
+                    'A280 Molar Extinction (Reduced)', 'A280 Molar Extinction (Cysteine Bridges)',
+                    'A280 Extinction 1mg/ml (Reduced)', 'A280 Extinction 1mg/ml (Cysteine Bridges)']
+
+
+class ColumnBuilder:
+    '''A table built row by row into one list per column.
+    columns: the names of the columns, in order
+    '''
+
+    def __init__(self, columns):
+        self.columns = list(columns)
+        self.index = []
+        self.values = {column: [] for column in self.columns}
+
+    def __len__(self):
+        return len(self.index)
+
+    def append(self, key, row):
+        '''This function adds a row: key is its index, row a dictionary of column values (missing columns are NaN).'''
+        self.index.append(key)
+        for column in self.columns:
+            self.values[column].append(row.get(column, math.nan))
+
+    def to_frame(self):
+        '''This function returns the table as a dataframe.'''
+        return pd.DataFrame(self.values, index=self.index, columns=self.columns)
+
+
+def number(text, kind=float):
+    '''This function turns text into a number of the given kind, or NaN if it is not a number (pepstats prints
+    "None" for the isoelectric point of some sequences).'''
+    try:
+        return kind(text)
+    except ValueError:
+        try:
+            return kind(float(text))
+        except ValueError:
+            return math.nan
+
+
+def sequence_name(path):
+    '''This function returns the sequence name of a sequence file path (its file name without .fasta).'''
+    name = os.path.basename(path.strip())
+    return name[:-len(".fasta")] if name.endswith(".fasta") else name
+
+
+def demultiplex(records, names):
+    '''This function yields the records of a multi-sequence report (tuples starting with the sequence name) with every
+    name replaced by the accession ID it stands for. names are the accession IDs of the sequences given to the tool, in
+    order: a name found among them is kept, and any other name (e.g. one shortened by the tool) is taken to be the
+    accession ID at the same position in the input.'''
+    known = set(names)
+    seen = {}
+    for record in records:
+        name = record[0]
+        if name not in seen:
+            seen[name] = name if (name in known or len(seen) >= len(names)) else names[len(seen)]
+        yield (seen[name],) + tuple(record[1:])
+
+
+def parse_patmatmotifs(lines, name=None):
+    '''This function reads a patmatmotifs report (one or many sequences) and yields (sequence name, motif, start, end)
+    for every motif hit, and (sequence name, None, None, None) for every sequence without any hit.
+    name: the name of the sequence of a one-sequence report (by default the name given in the report)'''
+    seq_name = name
+    start = end = None
+    hit_count = None
+    for line in lines:
+        first = line[:1]
+        if first == "#":
+            if line.startswith("# Sequence:"):
+                # a new sequence: "# Sequence: <name>     from: 1   to: <length>"
+                words = line.split()
+                if name is None and len(words) > 2:
+                    seq_name = words[2]
+                hit_count = None
+            elif line.startswith("# HitCount:"):
+                hit_count = number(line.split(":", 1)[1].strip(), int)
+                if hit_count == 0 and seq_name is not None:
+                    yield seq_name, None, None, None
+            elif line.startswith("#    -sequence") and seq_name is None:
+                # older reports only name the sequence file on the command line
+                seq_name = sequence_name(line.split("-sequence", 1)[1])
+        elif first == "S" and line.startswith("Start = position"):
+            start = int(line.split()[3])
+        elif first == "E" and line.startswith("End = position"):
+            end = int(line.split()[3])
+        elif first == "M" and line.startswith("Motif = "):
+            yield seq_name, line[len("Motif = "):].strip(), start, end
+            start = end = None
+
+
+def parse_pepstats(lines, name=None):
+    '''This function reads a pepstats report (one or many sequences) and yields (sequence name, statistics) for every
+    sequence, where the statistics are a dictionary with the PEPSTATS_COLUMNS as keys.
+    name: the name of the sequence of a one-sequence report (by default the name given in the report)'''
+    seq_name = None
+    stats = None
+    for line in lines:
+        first = line[:1]
+        if first == "P" and line.startswith("PEPSTATS of "):
+            if seq_name is not None:
+                yield seq_name, stats
+            # "PEPSTATS of <name> from 1 to <length>"
+            seq_name = name if name is not None else line.split()[2].replace("'", "").replace("[", "").rstrip("_")
+            stats = {}
+        elif stats is None:
+            continue
+        elif first == "M" and line.startswith("Molecular weight"):
+            # "Molecular weight = 38765.43 \t\tResidues = 350"
+            parts = line.split("=")
+            stats['Molecular Weight'] = number(parts[1].split()[0])
+            stats['Number of Residues'] = number(parts[2].split()[0], int)
+        elif first == "A" and line.startswith("Average Residue Weight"):
+            # "Average Residue Weight  = 110.758 \tCharge   = -3.0"
+            parts = line.split("=")
+            stats['Average Residue Weight'] = number(parts[1].split()[0])
+            stats['Charge'] = number(parts[2].split()[0])
+        elif first == "I" and line.startswith("Isoelectric Point"):
+            stats['Isoelectric Point'] = number(line.split("=", 1)[1].split()[0])
+        elif first == "A" and line.startswith("A280 Molar Extinction Coefficients"):
+            # "A280 Molar Extinction Coefficients  = 45840 (reduced)   46215 (cystine bridges)"
+            words = line.split("=", 1)[1].split()
+            stats['A280 Molar Extinction (Reduced)'] = number(words[0], int)
+            stats['A280 Molar Extinction (Cysteine Bridges)'] = number(words[2], int)
+        elif first == "A" and line.startswith("A280 Extinction Coefficients 1mg/ml"):
+            words = line.split("=", 1)[1].split()
+            stats['A280 Extinction 1mg/ml (Reduced)'] = number(words[0])
+            stats['A280 Extinction 1mg/ml (Cysteine Bridges)'] = number(words[2])
+    if seq_name is not None:
+        yield seq_name, stats
+
+
+def pepstats_table(reports):
+    '''This function parses pepstats reports and returns the statistics of every sequence as a dataframe with the
+    sequence name as the index.
+    reports: an iterable of (name, lines), where name is the sequence name of a one-sequence report
+    (None to take the names from the report) and lines an iterable of the lines of the report'''
+    table = ColumnBuilder(PEPSTATS_COLUMNS)
+    for name, lines in reports:
+        for seq_name, stats in parse_pepstats(lines, name):
+            table.append(seq_name, stats)
+    return table.to_frame()
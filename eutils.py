@@ -0,0 +1,260 @@
+#!/usr/bin/python3
+'''A small, in-process client for the NCBI E-utilities (esearch, espell, esummary and efetch).
+
+ProteoQuest used to fork a shell pipeline of the Perl based EDirect tools (esearch | efetch | xtract) for every look-up,
+paying for interpreter start-up and a fresh TLS handshake each time. This client talks to the E-utilities directly,
+keeps its HTTP connections alive between requests, parses the XML and JSON replies itself and returns structured
+results (counts, UIDs, scientific names) instead of text that has to be grepped.
+
+The network layer is a pluggable transport: anything with a request(endpoint, params) method returning the reply
+as bytes can be passed in, so the client can be pointed at a local fixture HTTP server
+(set PROTEOQUEST_EUTILS_URL, or pass HTTPTransport(base_url=...)).
+'''
+import http.client
+import json
+import os
+import threading
+import time
+import urllib.parse
+import xml.etree.ElementTree as ElementTree
+
+from edirect_cache import get_default_cache
+
+# the E-utilities end point, the API key (which raises the rate limit from 3 to 10 requests per second) and the contact
+# details NCBI asks every tool to send
+EUTILS_URL = os.environ.get("PROTEOQUEST_EUTILS_URL", "https://eutils.ncbi.nlm.nih.gov/entrez/eutils/")
+NCBI_API_KEY = os.environ.get("NCBI_API_KEY")
+NCBI_EMAIL = os.environ.get("NCBI_EMAIL")
+TOOL_NAME = "ProteoQuest"
+
+
+class EutilsError(Exception):
+    '''Raised when NCBI cannot be reached or replies with an error.'''
+
+
+class HTTPTransport:
+    '''A transport that sends E-utilities requests over persistent (keep-alive) HTTP or HTTPS connections.
+    Each thread keeps its own connection, so the transport can be shared by concurrent fetches.
+    base_url: the E-utilities base URL, e.g. http://127.0.0.1:8000/ for a local fixture server
+    '''
+
+    def __init__(self, base_url=EUTILS_URL, timeout=60, retries=3):
+        parsed = urllib.parse.urlsplit(base_url)
+        self.scheme = parsed.scheme
+        self.host = parsed.netloc
+        # make sure the path ends with a slash so that endpoint names can simply be appended to it
+        self.path = parsed.path if parsed.path.endswith("/") else parsed.path + "/"
+        self.timeout = timeout
+        self.retries = retries
+        self.local = threading.local()
+
+    def connection(self):
+        '''This function returns the open connection of the calling thread, opening a new one if needed.'''
+        connection = getattr(self.local, "connection", None)
+        if connection is None:
+            if self.scheme == "https":
+                connection = http.client.HTTPSConnection(self.host, timeout=self.timeout)
+            else:
+                connection = http.client.HTTPConnection(self.host, timeout=self.timeout)
+            self.local.connection = connection
+        return connection
+
+    def reset(self):
+        '''This function closes the connection of the calling thread, so that the next request opens a new one.'''
+        connection = getattr(self.local, "connection", None)
+        if connection is not None:
+            connection.close()
+        self.local.connection = None
+
+    def request(self, endpoint, params):
+        '''This function POSTs params to the E-utilities endpoint (e.g. "esearch.fcgi") and returns the reply as bytes.
+        A dropped keep-alive connection or a server error is retried on a fresh connection.'''
+        body = urllib.parse.urlencode(params, doseq=True)
+        headers = {"Content-Type": "application/x-www-form-urlencoded", "Connection": "keep-alive"}
+        for attempt in range(self.retries + 1):
+            try:
+                connection = self.connection()
+                connection.request("POST", self.path + endpoint, body=body, headers=headers)
+                response = connection.getresponse()
+                data = response.read()
+            except (http.client.HTTPException, OSError) as error:
+                # the server may have closed an idle keep-alive connection, so reconnect and try again
+                self.reset()
+                if attempt == self.retries:
+                    raise EutilsError("Could not reach NCBI E-utilities: " + str(error))
+                time.sleep(2 ** attempt)
+                continue
+            if response.status == 200:
+                return data
+            # 429 (too many requests) and 5xx errors are worth retrying, anything else is not
+            if response.status == 429 or response.status >= 500:
+                if attempt < self.retries:
+                    time.sleep(2 ** attempt)
+                    continue
+            raise EutilsError("NCBI E-utilities returned HTTP " + str(response.status) + " for " + endpoint
+                              + ": " + data.decode("utf-8", "replace")[:200])
+
+
+class RateLimiter:
+    '''A thread safe limiter that spaces requests so that no more than rate requests are sent per second.'''
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate
+        self.lock = threading.Lock()
+        self.next_time = 0.0
+
+    def wait(self):
+        with self.lock:
+            now = time.monotonic()
+            delay = self.next_time - now
+            self.next_time = max(now, self.next_time) + self.interval
+        if delay > 0:
+            time.sleep(delay)
+
+
+class EutilsClient:
+    '''A client for the NCBI E-utilities returning structured results.
+    transport: an object with a request(endpoint, params) method (defaults to a keep-alive HTTPTransport)
+    api_key, email: sent to NCBI with every request (the API key also raises the rate limit to 10 requests per second)
+    cache: an EDirectCache answering repeated queries (defaults to the programme-wide cache, False disables caching)
+    '''
+
+    def __init__(self, transport=None, api_key=NCBI_API_KEY, email=NCBI_EMAIL, cache=None):
+        self.transport = transport if transport is not None else HTTPTransport()
+        self.api_key = api_key
+        self.email = email
+        self.cache = get_default_cache() if cache is None else cache
+        self.rate_limiter = RateLimiter(10 if api_key else 3)
+
+    def call(self, endpoint, params):
+        '''This function sends one rate limited request to an E-utilities endpoint and returns the reply as bytes.'''
+        params = dict(params)
+        params["tool"] = TOOL_NAME
+        if self.email:
+            params["email"] = self.email
+        if self.api_key:
+            params["api_key"] = self.api_key
+        self.rate_limiter.wait()
+        return self.transport.request(endpoint, params)
+
+    def cached(self, db, query, fmt, compute, cacheable=None):
+        '''This function answers (db, query, fmt) from the cache if possible, or by calling compute() otherwise.
+        cacheable: a check of the answer before it is cached (by default, any non-empty answer is cached)'''
+        if not self.cache:
+            return compute()
+        if cacheable is None:
+            cacheable = lambda value: bool(value.strip())
+        return self.cache.get_or_compute(db, query, fmt, compute, cacheable=cacheable)
+
+    def spell(self, db, term):
+        '''This function returns NCBI's spelling-corrected version of term (the equivalent of esearch -spell).'''
+        root = parse_xml(self.call("espell.fcgi", {"db": db, "term": term}))
+        corrected = root.findtext("CorrectedQuery")
+        return corrected if corrected else term
+
+    def esearch(self, db, term, retmax=0, usehistory=False, spell=True):
+        '''This function searches db for term and returns a dictionary with:
+        count: the number of records found
+        ids: the UIDs of the first retmax records
+        webenv, query_key: the history server location of the result set (only if usehistory is True)
+        errors, warnings: lists of messages reported by NCBI
+        '''
+        def compute():
+            query = self.spell(db, term) if spell else term
+            params = {"db": db, "term": query, "retmax": retmax}
+            if usehistory:
+                params["usehistory"] = "y"
+            root = parse_xml(self.call("esearch.fcgi", params))
+            return json.dumps(parse_esearch(root))
+
+        # history server sessions expire, so results carrying a WebEnv are never cached
+        if usehistory:
+            return json.loads(compute())
+        return json.loads(self.cached(db, term, "esearch-" + str(retmax), compute, cacheable=is_cacheable_search))
+
+    def count(self, db, term):
+        '''This function returns the number of records in db matching term.'''
+        return self.esearch(db, term)["count"]
+
+    def scientific_names(self, term):
+        '''This function returns the list of scientific names (from the taxonomy DocSums) of the taxa matching term.'''
+        def compute():
+            result = self.esearch("taxonomy", term, usehistory=True)
+            if result["count"] == 0 or result["errors"]:
+                return ""
+            reply = self.call("esummary.fcgi", {"db": "taxonomy", "WebEnv": result["webenv"],
+                                                "query_key": result["query_key"], "retmode": "json",
+                                                "retmax": result["count"]})
+            return "\n".join(parse_esummary_names(reply))
+
+        return [name for name in self.cached("taxonomy", term, "docsum-scientificname", compute).splitlines() if name]
+
+    def efetch(self, db, ids=None, webenv=None, query_key=None, rettype="fasta", retmode="text",
+               retstart=0, retmax=None):
+        '''This function fetches records either by a list of UIDs or from a history server result set,
+        and returns them as text.'''
+        params = {"db": db, "rettype": rettype, "retmode": retmode}
+        if ids is not None:
+            params["id"] = ",".join(str(uid) for uid in ids)
+        else:
+            params["WebEnv"] = webenv
+            params["query_key"] = query_key
+            params["retstart"] = retstart
+        if retmax is not None:
+            params["retmax"] = retmax
+        return self.call("efetch.fcgi", params).decode("utf-8")
+
+
+def parse_xml(data):
+    '''This function parses an XML reply, turning malformed replies into an EutilsError.'''
+    try:
+        return ElementTree.fromstring(data)
+    except ElementTree.ParseError as error:
+        raise EutilsError("Could not parse the reply from NCBI: " + str(error))
+
+
+def is_cacheable_search(value):
+    '''This function returns True if an esearch result (as JSON) is worth caching: it found something and NCBI
+    reported no error or warning. Failures and empty results may be transient, so they are asked again next time.'''
+    try:
+        result = json.loads(value)
+    except ValueError:
+        return False
+    return result.get("count", 0) > 0 and not result.get("errors") and not result.get("warnings")
+
+
+def parse_esearch(root):
+    '''This function turns an eSearchResult XML element into the dictionary returned by EutilsClient.esearch.'''
+    # NCBI reports failed searches with an <ERROR> element instead of a Count
+    errors = [element.text for element in root.iter("ERROR") if element.text]
+    errors += [element.text for element in root.iter("OutputMessage") if element.text]
+    warnings = [element.text for element in root.iter("PhraseNotFound") if element.text]
+    warnings += [element.text for element in root.iter("QuotedPhraseNotFound") if element.text]
+    count = root.findtext("Count")
+    return {"count": int(count) if count else 0,
+            "ids": [element.text for element in root.iterfind("IdList/Id")],
+            "webenv": root.findtext("WebEnv"),
+            "query_key": root.findtext("QueryKey"),
+            "errors": errors,
+            "warnings": warnings}
+
+
+def parse_esummary_names(data):
+    '''This function extracts the scientific names from an esummary JSON reply (in the order of the UIDs).'''
+    try:
+        result = json.loads(data.decode("utf-8"))["result"]
+    except (ValueError, KeyError) as error:
+        raise EutilsError("Could not parse the esummary reply from NCBI: " + str(error))
+    return [result[uid].get("scientificname", "") for uid in result.get("uids", [])]
+
+
+# a lazily created client shared by the whole programme
+_default_client = None
+
+
+def get_default_client():
+    '''This function returns the EutilsClient shared by the whole programme, creating it on first use.'''
+    global _default_client
+    if _default_client is None:
+        _default_client = EutilsClient()
+    return _default_client
@@ -0,0 +1,148 @@
+#!/usr/bin/python3
+'''A single-pass, streaming FASTA reader and a compact index of the records in a FASTA file.
+
+read_fasta yields the records of a file one at a time (accession, header, sequence), so a file is never held in memory
+as one big string. FastaIndex reads a file once and keeps, for every record, its accession, the byte offsets where the
+record starts and ends and its sequence length in compact arrays. Questions about the file (the shortest and longest
+sequence, how many sequences fall in a length window, the records themselves) are then answered from the index
+without reading the file again.
+'''
+import os
+from array import array
+
+
+def accession_of(header):
+    '''This function returns the accession ID of a FASTA header (the first word after the '>').'''
+    words = header.split(None, 1)
+    return words[0] if words else ""
+
+
+def read_fasta(path):
+    '''This function reads a FASTA file record by record and yields (accession, header, sequence) for each record.
+    header is the header line without the leading '>', sequence has no line breaks or white space.'''
+    with open(path, "r") as f:
+        header = None
+        chunks = []
+        for line in f:
+            if line.startswith(">"):
+                if header is not None:
+                    yield accession_of(header), header, "".join(chunks)
+                header = line[1:].strip()
+                chunks = []
+            elif header is not None:
+                chunks.append(line.strip())
+        if header is not None:
+            yield accession_of(header), header, "".join(chunks)
+
+
+def write_fasta(f, header, sequence, width=60):
+    '''This function writes one FASTA record to the open file f, wrapping the sequence every width residues.'''
+    f.write(">" + header + "\n")
+    for start in range(0, len(sequence), width):
+        f.write(sequence[start:start + width] + "\n")
+
+
+def write_chunks(sequences, prefix, chunks):
+    '''This function splits sequences (a dictionary with the accession ID as the key and the sequence as the value)
+    into chunks multi-sequence FASTA files of about the same number of sequences, {prefix}_chunk{n}.fasta, and returns
+    a list of (path, accession IDs in the file) for every file written.'''
+    accessions = list(sequences)
+    chunks = max(1, min(int(chunks), len(accessions)))
+    size = -(-len(accessions) // chunks)
+    written = []
+    for n, start in enumerate(range(0, len(accessions), size), start=1):
+        path = prefix + "_chunk" + str(n) + ".fasta"
+        with open(path, "w") as f:
+            for accession in accessions[start:start + size]:
+                write_fasta(f, accession, str(sequences[accession]))
+        written.append((path, accessions[start:start + size]))
+    return written
+
+
+class FastaIndex:
+    '''An index of the records of a FASTA file, built in one pass over the file.
+    accessions: the accession ID of every record, in file order
+    starts, ends: the byte offsets where every record (header line included) starts and ends
+    lengths: the sequence length of every record
+    '''
+
+    def __init__(self, path):
+        self.path = os.path.abspath(path)
+        self.accessions = []
+        self.starts = array("q")
+        self.ends = array("q")
+        self.lengths = array("q")
+        stat = os.stat(self.path)
+        # remember which version of the file the index describes
+        self.signature = (stat.st_size, stat.st_mtime_ns)
+        self.build()
+
+    def build(self):
+        '''This function reads the file once and records the offsets and the sequence length of every record.'''
+        offset = 0
+        length = 0
+        with open(self.path, "rb") as f:
+            for line in f:
+                if line.startswith(b">"):
+                    # close the previous record before starting a new one
+                    if self.starts:
+                        self.ends.append(offset)
+                        self.lengths.append(length)
+                    self.accessions.append(accession_of(line[1:].decode("utf-8", "replace")))
+                    self.starts.append(offset)
+                    length = 0
+                elif self.starts:
+                    length += len(line.strip())
+                offset += len(line)
+        if self.starts:
+            self.ends.append(offset)
+            self.lengths.append(length)
+
+    def __len__(self):
+        return len(self.accessions)
+
+    def is_current(self):
+        '''This function returns True if the file has not changed since the index was built.'''
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return False
+        return self.signature == (stat.st_size, stat.st_mtime_ns)
+
+    def min_max(self):
+        '''This function returns the length of the shortest and of the longest sequence as a tuple.'''
+        if not self.lengths:
+            raise ValueError("There are no sequences in " + self.path)
+        return min(self.lengths), max(self.lengths)
+
+    def record_bytes(self, i):
+        '''This function returns the raw bytes of record i (header line included) with a single read.'''
+        with open(self.path, "rb") as f:
+            f.seek(self.starts[i])
+            return f.read(self.ends[i] - self.starts[i])
+
+    def records(self, indices=None):
+        '''This function yields (accession, header, sequence) for the records at indices (every record by default),
+        reading only those records from the file.'''
+        if indices is None:
+            indices = range(len(self))
+        with open(self.path, "rb") as f:
+            for i in indices:
+                f.seek(self.starts[i])
+                lines = f.read(self.ends[i] - self.starts[i]).decode("utf-8", "replace").splitlines()
+                header = lines[0][1:].strip()
+                yield accession_of(header), header, "".join(line.strip() for line in lines[1:])
+
+
+# indexes already built in this run, keyed by the absolute path of their file
+_indexes = {}
+
+
+def get_index(path):
+    '''This function returns the FastaIndex of the file at path, building it only if the file is new or has changed.'''
+    key = os.path.abspath(path)
+    index = _indexes.get(key)
+    if index is None or not index.is_current():
+        index = FastaIndex(key)
+        _indexes[key] = index
+    return index
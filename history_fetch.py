@@ -0,0 +1,162 @@
+#!/usr/bin/python3
+'''Streaming, batched efetch through the NCBI history server.
+
+Instead of pulling a whole result set into one Python string, the search is posted to the history server once
+(WebEnv/query_key) and the FASTA records are downloaded in fixed-size retstart/retmax batches. Every batch is
+appended to the output file as soon as it arrives, so memory stays bounded by a few batches whatever the size of the
+result set. A small progress file next to the output records the last completed batch, so an interrupted download
+resumes where it stopped. A few batches can be fetched concurrently; the client's rate limiter keeps the requests
+within NCBI's limit. When the same search was downloaded before, update_fasta only fetches the records that are new
+since then.
+'''
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from eutils import EutilsError
+from fasta import get_index
+
+# the number of records fetched per efetch request (NCBI serves at most 10000 per request)
+DEFAULT_BATCH_SIZE = 500
+
+
+def progress_path(out_path):
+    '''This function returns the path of the progress file kept next to out_path while it is being downloaded.'''
+    return str(out_path) + ".progress"
+
+
+def read_progress(out_path):
+    '''This function returns the saved progress of an interrupted download of out_path, or None.'''
+    try:
+        with open(progress_path(out_path), "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def write_progress(out_path, progress):
+    '''This function saves the download progress atomically (write to a temporary file, then rename it).'''
+    temp_path = progress_path(out_path) + ".tmp"
+    with open(temp_path, "w") as f:
+        json.dump(progress, f)
+    os.replace(temp_path, progress_path(out_path))
+
+
+def fetch_fasta_batches(client, db, term, out_path, batch_size=DEFAULT_BATCH_SIZE, workers=1, resume=True,
+                        report=print):
+    '''This function downloads every record in db matching term as FASTA into out_path, batch by batch.
+    client: an eutils.EutilsClient
+    batch_size: the number of records per efetch request
+    workers: the number of batches fetched concurrently (batches are still written in order)
+    resume: continue an interrupted download of out_path from its last completed batch
+    report: a function called with a progress message after every batch (None to stay quiet)
+    It returns the number of records in the result set.'''
+    # post the search to the history server, so that every batch is cut from the same result set
+    result = client.esearch(db, term, usehistory=True)
+    if result["errors"]:
+        raise EutilsError("NCBI could not run the search " + str(term) + ": " + "; ".join(result["errors"]))
+    count = result["count"]
+    batch_count = (count + batch_size - 1) // batch_size
+
+    # work out where to start: after the last completed batch of an interrupted run of the same search, or at the start
+    first_batch = 0
+    progress = read_progress(out_path) if resume else None
+    if (progress and progress.get("db") == db and progress.get("term") == term
+            and progress.get("count") == count and progress.get("batch_size") == batch_size
+            and os.path.exists(out_path)):
+        first_batch = progress["completed"]
+        # drop anything written after the last completed batch (e.g. half a batch from a crash)
+        with open(out_path, "r+b") as f:
+            f.truncate(progress["bytes"])
+        if report and first_batch:
+            report("Resuming the download from batch " + str(first_batch + 1) + " of " + str(batch_count) + "...")
+    else:
+        open(out_path, "wb").close()
+    progress = {"db": db, "term": term, "count": count, "batch_size": batch_size,
+                "completed": first_batch, "bytes": os.path.getsize(out_path)}
+    write_progress(out_path, progress)
+
+    def fetch_batch(batch):
+        text = client.efetch(db, webenv=result["webenv"], query_key=result["query_key"], rettype="fasta",
+                             retstart=batch * batch_size, retmax=batch_size)
+        # anything but FASTA (e.g. an error message in place of the records) must not end up in the output
+        if text.strip() and not text.lstrip().startswith(">"):
+            raise EutilsError("NCBI returned something other than FASTA for batch " + str(batch + 1)
+                              + ": " + text.strip()[:200])
+        return text
+
+    with open(out_path, "ab") as out, ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        # keep at most `workers` batches in flight, so that memory is bounded by a few batches
+        pending = {}
+        next_batch = first_batch
+        for batch in range(first_batch, batch_count):
+            while next_batch < batch_count and len(pending) < max(1, workers):
+                pending[next_batch] = executor.submit(fetch_batch, next_batch)
+                next_batch += 1
+            text = pending.pop(batch).result()
+            if text and not text.endswith("\n"):
+                text += "\n"
+            out.write(text.encode("utf-8"))
+            out.flush()
+            # only record the batch as completed once it is safely in the file
+            progress["completed"] = batch + 1
+            progress["bytes"] = out.tell()
+            write_progress(out_path, progress)
+            if report:
+                report("Downloaded batch " + str(batch + 1) + " of " + str(batch_count) + " ("
+                       + str(min((batch + 1) * batch_size, count)) + " of " + str(count) + " sequences)")
+
+    # the download is complete, so the progress file is no longer needed
+    os.remove(progress_path(out_path))
+    return count
+
+
+def fetch_accessions(client, db, term, batch_size=10000):
+    '''This function returns the accession IDs (accession.version) of every record in db matching term,
+    fetched in batches (efetch -format acc) from the history server.'''
+    result = client.esearch(db, term, usehistory=True)
+    if result["errors"]:
+        raise EutilsError("NCBI could not run the search " + str(term) + ": " + "; ".join(result["errors"]))
+    accessions = []
+    for retstart in range(0, result["count"], batch_size):
+        text = client.efetch(db, webenv=result["webenv"], query_key=result["query_key"], rettype="acc",
+                             retstart=retstart, retmax=batch_size)
+        accessions.extend(line.strip() for line in text.splitlines() if line.strip())
+    return accessions
+
+
+def update_fasta(client, db, term, out_path, batch_size=DEFAULT_BATCH_SIZE, report=print):
+    '''This function brings a FASTA file downloaded by an earlier run of the same search up to date.
+    Only the accession list of the search is downloaded in full: records whose accession (with its version, so a
+    changed sequence counts as new) is no longer found are dropped, and only the new records are fetched by accession.
+    Records found by both searches are copied unchanged from the old file.
+    It returns the number of records, and the lists of added and removed accession IDs.'''
+    accessions = fetch_accessions(client, db, term)
+    index = get_index(out_path)
+    old_accessions = set(index.accessions)
+    new_accessions = set(accessions)
+    added = [accession for accession in accessions if accession not in old_accessions]
+    removed = [accession for accession in index.accessions if accession not in new_accessions]
+    if report:
+        report("Updating " + str(out_path) + ": " + str(len(added)) + " new and " + str(len(removed))
+               + " removed sequences since the last download")
+    if not added and not removed:
+        return len(accessions), added, removed
+    temp_path = str(out_path) + ".tmp"
+    with open(temp_path, "wb") as out:
+        # copy the records that are still found, in their original order
+        kept = [i for i, accession in enumerate(index.accessions) if accession in new_accessions]
+        with open(index.path, "rb") as source:
+            for i in kept:
+                source.seek(index.starts[i])
+                out.write(source.read(index.ends[i] - index.starts[i]))
+        # then fetch the new records by accession, batch by batch
+        for start in range(0, len(added), batch_size):
+            text = client.efetch(db, ids=added[start:start + batch_size], rettype="fasta")
+            if text.strip() and not text.lstrip().startswith(">"):
+                raise EutilsError("NCBI returned something other than FASTA: " + text.strip()[:200])
+            if text and not text.endswith("\n"):
+                text += "\n"
+            out.write(text.encode("utf-8"))
+    os.replace(temp_path, out_path)
+    return len(accessions), added, removed
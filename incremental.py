@@ -0,0 +1,78 @@
+#!/usr/bin/python3
+'''Incremental re-analysis of a search that has been analysed before.
+
+Every analysis step that works sequence by sequence (the motif scan and the protein statistics) saves a small record
+next to its outputs: the settings it ran with and a digest of every sequence it processed. When the same analysis is
+run again (e.g. a weekly re-run of the same search), the sequences whose digest is unchanged are taken from the
+previous outputs (the _motif_hits.csv, the patmatmotifs reports and the _stats.csv) and only the new sequences are
+processed; sequences that are no longer found are simply left out of the rebuilt tables.
+'''
+import hashlib
+import json
+import os
+
+import pandas as pd
+
+
+def sequence_digest(sequence):
+    '''This function returns a short digest of a sequence, used to notice a sequence that has changed.'''
+    return hashlib.sha1(str(sequence).encode("utf-8")).hexdigest()
+
+
+def record_path(out_dir, new_file_name, step):
+    '''This function returns the path of the record of an analysis step (e.g. "motifs" or "stats") in out_dir.'''
+    return os.path.join(out_dir, f"{new_file_name}_{step}_run.json")
+
+
+def save_record(path, params, seq_data_dict):
+    '''This function saves the settings an analysis step ran with and the digest of every sequence it processed.'''
+    record = {"params": params,
+              "sequences": {accession: sequence_digest(sequence) for accession, sequence in seq_data_dict.items()}}
+    with open(path + ".tmp", "w") as f:
+        json.dump(record, f)
+    os.replace(path + ".tmp", path)
+
+
+def reusable_accessions(path, params, seq_data_dict):
+    '''This function returns the set of accession IDs whose results can be taken from the previous run of an analysis
+    step: the step must have run with the same settings and the sequence must not have changed since.'''
+    try:
+        with open(path, "r") as f:
+            record = json.load(f)
+    except (OSError, ValueError):
+        return set()
+    if record.get("params") != params:
+        return set()
+    previous = record.get("sequences", {})
+    return {accession for accession, sequence in seq_data_dict.items()
+            if previous.get(accession) == sequence_digest(sequence)}
+
+
+def previous_rows(csv_path, accessions):
+    '''This function returns the rows of a previous table (indexed by accession ID) for the given accession IDs,
+    as a dictionary of row dictionaries. Accession IDs missing from the table are left out.'''
+    if not accessions or not os.path.exists(csv_path):
+        return {}
+    table = pd.read_csv(csv_path, index_col=0)
+    table = table[table.index.isin(accessions)]
+    return table.to_dict("index")
+
+
+def previous_motif_hits(csv_path, accessions):
+    '''This function returns the motif hits of a previous _motif_hits.csv for the given accession IDs, as a dictionary
+    with the accession ID as the key and a list of [motif, start, end] as the value (an empty list for no hits).'''
+    if not accessions or not os.path.exists(csv_path):
+        return {}
+    hits = {accession: [] for accession in accessions}
+    table = pd.read_csv(csv_path)
+    for accession, motif, start, end in table[table['Sequence Name'].isin(accessions)].itertuples(index=False):
+        hits[accession].append([motif, int(start), int(end)])
+    return hits
+
+
+def remove_stale_reports(out_dir, suffix, seq_data_dict):
+    '''This function removes the per-sequence reports ({accession}{suffix}) in out_dir of the accession IDs
+    that are not in seq_data_dict any more.'''
+    for name in os.listdir(out_dir):
+        if name.endswith(suffix) and name[:-len(suffix)] not in seq_data_dict:
+            os.remove(os.path.join(out_dir, name))
@@ -0,0 +1,203 @@
+#!/usr/bin/python3
+'''Instrumentation of a ProteoQuest run: where the time goes.
+
+The run report records the wall time of every stage of the analysis, every external program run on the way (the
+command, its wall time, its exit code and the bytes it read and wrote), how many records every stage processed and how
+long the programme paused on purpose (the pauses between messages in interactive mode, kept apart so they do not blur
+the timings). Any stage can also be run under cProfile; only one stage is profiled at a time (a second cProfile
+profiler cannot be enabled while one is running, from Python 3.12 on), so the pipeline runs its stages one after the
+other while profiling (see profiling). The report is saved as JSON next to the CSV outputs and
+summarised in a table at the end of the run.
+'''
+import contextlib
+import cProfile
+import io
+import json
+import os
+import pstats
+import subprocess
+import threading
+import time
+
+import pandas as pd
+
+
+def file_size(path):
+    '''This function returns the size of the file at path, or 0 if there is no such file.'''
+    try:
+        return os.path.getsize(path)
+    except (OSError, TypeError):
+        return 0
+
+
+class RunReport:
+    '''The timings of one run.
+    profile: the names of the stages to run under cProfile ("all" for every stage)
+    '''
+
+    def __init__(self, profile=()):
+        self.started = time.time()
+        self.start = time.perf_counter()
+        self.profile = set(profile)
+        self.lock = threading.Lock()
+        self.stages = []
+        self.subprocesses = []
+        self.records = {}
+        self.paused_seconds = 0.0
+        self.profilers = {}
+        self.profile_summaries = {}
+        # the stage being profiled right now, if any
+        self.profiled_stage = None
+
+    def profiling(self):
+        '''This function returns True if any stage is to be run under cProfile.'''
+        return bool(self.profile)
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        '''This function times the code run inside the with block as the stage called name
+        (under cProfile if the stage is to be profiled and no other stage is being profiled at the same time).'''
+        profiler = None
+        if name in self.profile or "all" in self.profile:
+            with self.lock:
+                if self.profiled_stage is None:
+                    self.profiled_stage = name
+                    profiler = cProfile.Profile()
+                else:
+                    self.profile_summaries[name] = ("not profiled: it ran while " + self.profiled_stage
+                                                    + " was being profiled")
+        began = time.perf_counter()
+        if profiler:
+            profiler.enable()
+        try:
+            yield
+        finally:
+            if profiler:
+                profiler.disable()
+                self.profiled_stage = None
+            ended = time.perf_counter()
+            with self.lock:
+                self.stages.append({"stage": name, "start": round(began - self.start, 4),
+                                    "seconds": round(ended - began, 4), "thread": threading.current_thread().name})
+                if profiler:
+                    self.profilers[name] = profiler
+                    text = io.StringIO()
+                    pstats.Stats(profiler, stream=text).sort_stats("cumulative").print_stats(15)
+                    self.profile_summaries[name] = text.getvalue()
+
+    def count(self, name, records):
+        '''This function adds records to the number of records processed by the stage called name.'''
+        with self.lock:
+            self.records[name] = self.records.get(name, 0) + int(records)
+
+    def paused(self, seconds):
+        '''This function adds to the time the programme paused on purpose.'''
+        with self.lock:
+            self.paused_seconds += seconds
+
+    def add_subprocess(self, command, seconds, status, bytes_in=0, bytes_out=0):
+        '''This function records one run of an external program.'''
+        if not isinstance(command, str):
+            command = " ".join(str(word) for word in command)
+        with self.lock:
+            self.subprocesses.append({"command": command, "program": command.split()[0] if command.split() else "",
+                                      "start": round(time.perf_counter() - self.start - seconds, 4),
+                                      "seconds": round(seconds, 4), "status": status,
+                                      "bytes_in": bytes_in, "bytes_out": bytes_out})
+
+    def call(self, command, inputs=(), outputs=(), **kwargs):
+        '''This function is an instrumented subprocess.call: it runs command and records it.
+        inputs, outputs: the files the command reads and writes (their sizes are recorded as the bytes in and out)'''
+        bytes_in = sum(file_size(path) for path in inputs)
+        began = time.perf_counter()
+        try:
+            status = subprocess.call(command, **kwargs)
+        except OSError:
+            # the program is not installed
+            status = 127
+        self.add_subprocess(command, time.perf_counter() - began, status, bytes_in,
+                            sum(file_size(path) for path in outputs))
+        return status
+
+    def run(self, command, inputs=(), **kwargs):
+        '''This function is an instrumented subprocess.run: it runs command and records it. The captured standard
+        output (if any) counts as the bytes out. A program that is not installed gives status 127, as with call.'''
+        bytes_in = sum(file_size(path) for path in inputs)
+        began = time.perf_counter()
+        status = 127
+        result = None
+        try:
+            try:
+                result = subprocess.run(command, **kwargs)
+            except OSError as error:
+                # the program is not installed: answer like a shell would (status 127), with the reason on stderr
+                program = command.split()[0] if isinstance(command, str) else str(command[0])
+                message = program + " is not installed or cannot be run (" + str(error) + ")"
+                text = kwargs.get("universal_newlines") or kwargs.get("text") or kwargs.get("encoding")
+                result = subprocess.CompletedProcess(command, 127, "" if text else b"",
+                                                     message if text else message.encode("utf-8"))
+            status = result.returncode
+            return result
+        finally:
+            stdout = result.stdout if result is not None and result.stdout else ""
+            self.add_subprocess(command, time.perf_counter() - began, status, bytes_in, len(stdout))
+
+    def to_dict(self):
+        '''This function returns the report as a dictionary (what is saved as JSON).'''
+        with self.lock:
+            programs = {}
+            for record in self.subprocesses:
+                program = programs.setdefault(record["program"], {"runs": 0, "seconds": 0.0, "failures": 0})
+                program["runs"] += 1
+                program["seconds"] = round(program["seconds"] + record["seconds"], 4)
+                program["failures"] += record["status"] != 0
+            return {"started": self.started, "seconds": round(time.perf_counter() - self.start, 4),
+                    "paused_seconds": round(self.paused_seconds, 4), "stages": list(self.stages),
+                    "records": dict(self.records), "programs": programs, "subprocesses": list(self.subprocesses),
+                    "profiles": dict(self.profile_summaries)}
+
+    def write(self, path):
+        '''This function saves the report as JSON at path, and the profile of every profiled stage next to it
+        ({path without .json}_{stage}.prof, readable with pstats or snakeviz).'''
+        report = self.to_dict()
+        with open(path, "w") as f:
+            json.dump(report, f, indent=1)
+        for name, profiler in self.profilers.items():
+            profiler.dump_stats(os.path.splitext(path)[0] + "_" + name + ".prof")
+        return path
+
+    def summary(self):
+        '''This function returns the stage timings and the external program totals as a table (a string).'''
+        report = self.to_dict()
+        rows = [{'Stage': stage["stage"], 'Seconds': stage["seconds"], 'Records': report["records"].get(stage["stage"], "")}
+                for stage in report["stages"]]
+        rows += [{'Stage': "  " + program + " (" + str(totals["runs"]) + " runs)", 'Seconds': totals["seconds"],
+                  'Records': ""} for program, totals in report["programs"].items()]
+        rows.append({'Stage': "paused", 'Seconds': report["paused_seconds"], 'Records': ""})
+        rows.append({'Stage': "total", 'Seconds': report["seconds"], 'Records': ""})
+        return pd.DataFrame(rows, columns=['Stage', 'Seconds', 'Records']).to_string(index=False)
+
+
+# the report of the run in progress
+_report = RunReport()
+
+
+def get_report():
+    '''This function returns the report of the run in progress.'''
+    return _report
+
+
+def start_report(profile=()):
+    '''This function starts a new run report (e.g. for every search of a manifest) and returns it.'''
+    global _report
+    _report = RunReport(profile)
+    return _report
+
+
+def timed(name, function):
+    '''This function returns function wrapped so that every call is timed as the stage called name
+    (in the report of the run in progress at the time of the call).'''
+    def run(*arguments, **keywords):
+        with get_report().stage(name):
+            return function(*arguments, **keywords)
+    return run
@@ -0,0 +1,44 @@
+#!/usr/bin/python3
+'''A built-in sequence length filter, replacing the external pullseq binary.
+
+The sequence lengths from the FASTA index are kept in a sorted array, so the number of sequences inside any
+(min, max) length window is found with two binary searches, which is instant even for very large files and makes the
+interactive refine loop respond immediately. The sequences inside the chosen window are then written to the trimmed
+FASTA file in one sequential pass over the original file.
+'''
+from array import array
+from bisect import bisect_left, bisect_right
+
+from fasta import get_index
+
+
+class LengthFilter:
+    '''A length window filter over the sequences of one FASTA file.
+    path: the FASTA file to filter (its FastaIndex is reused if it has already been built)
+    '''
+
+    def __init__(self, path):
+        self.index = get_index(path)
+        # the sorted sequence lengths, used to count the sequences in a window by binary search
+        self.sorted_lengths = array("q", sorted(self.index.lengths))
+
+    def count(self, min_len, max_len):
+        '''This function returns the number of sequences whose length is between min_len and max_len (both included).'''
+        if min_len > max_len:
+            return 0
+        return bisect_right(self.sorted_lengths, max_len) - bisect_left(self.sorted_lengths, min_len)
+
+    def selected(self, min_len, max_len):
+        '''This function returns the positions (in file order) of the records whose length is in the window.'''
+        return [i for i, length in enumerate(self.index.lengths) if min_len <= length <= max_len]
+
+    def write(self, out_path, min_len, max_len):
+        '''This function writes the records whose length is between min_len and max_len (both included) to out_path,
+        copying them unchanged in one sequential pass over the original file. It returns the number of records written.'''
+        selected = self.selected(min_len, max_len)
+        with open(self.index.path, "rb") as source, open(out_path, "wb") as out:
+            for i in selected:
+                # the records are visited in file order, so this only ever seeks forwards
+                source.seek(self.index.starts[i])
+                out.write(source.read(self.index.ends[i] - self.index.starts[i]))
+        return len(selected)
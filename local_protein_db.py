@@ -0,0 +1,478 @@
+#!/usr/bin/python3
+'''A local protein database: NCBI-style protein searches answered from a FASTA dump on disk instead of NCBI.
+
+A large FASTA file (a UniProt or RefSeq dump, any number of records) is indexed once into a SQLite file in the cache
+directory: the byte offsets of every record by accession, the organism (and taxid) of every record, whether it is
+partial, and an inverted index of the words of the protein names. UniProt headers give the organism and taxid
+(OS=/OX=) and mark fragments with "(Fragment)"; NCBI headers give the organism in square brackets and mark partial
+proteins with "partial", and their taxid is looked up in the local taxonomy index (taxonomy_index) if there is one.
+
+The searches ProteoQuest builds (Organism[ORGN] AND Protein[PROT], optionally followed by PARTIAL or NOT PARTIAL) are
+parsed into SQL: every term becomes a query on one index, and AND, OR and NOT become INTERSECT, UNION and EXCEPT,
+evaluated from left to right as Entrez does (terms side by side, such as Protein[PROT] PARTIAL, are joined by AND). With a taxonomy index an organism matches its whole subtree, as on NCBI
+(Aves[ORGN] finds every bird); without one it matches the organism name and the species of a genus name.
+
+LocalProteinTransport answers the esearch, espell and efetch requests of eutils.EutilsClient from the index, so the
+history-server download (history_fetch) streams the matching records straight from the dump, in file order, with no
+rate limit. Requests for any other database (e.g. taxonomy) are passed on to NCBI.
+'''
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import xml.sax.saxutils
+
+from edirect_cache import DEFAULT_CACHE_DIR
+from eutils import EutilsClient, HTTPTransport, RateLimiter, NCBI_API_KEY
+from fasta import accession_of
+from taxonomy_index import get_taxonomy_index
+
+# the FASTA dump searched instead of NCBI (none by default) and where its indexes are kept
+LOCAL_DB = os.environ.get("PROTEOQUEST_LOCAL_DB", "")
+LOCAL_DB_DIR = os.path.join(DEFAULT_CACHE_DIR, "local_db")
+# the number of records inserted at a time while the index is built
+INSERT_BATCH = 20000
+# the number of search results kept for efetch at a time (the oldest is dropped first)
+MAX_RESULT_SETS = 16
+
+# the search fields understood, by the names and abbreviations Entrez accepts for them
+ORGANISM_FIELDS = {"orgn", "organism"}
+PROTEIN_FIELDS = {"prot", "protein", "protein name", "titl", "title"}
+ACCESSION_FIELDS = {"accn", "accession"}
+PROPERTY_FIELDS = {"prop", "properties", "all fields", "all"}
+
+# UniProt headers: "sp|P69905|HBA_HUMAN Hemoglobin subunit alpha OS=Homo sapiens OX=9606 GN=HBA1 PE=1 SV=2"
+UNIPROT_ORGANISM = re.compile(r" OS=(.*?)(?= [A-Z]{2}=|$)")
+UNIPROT_TAXID = re.compile(r" OX=(\d+)")
+# NCBI headers: "XP_012345.1 hemoglobin subunit alpha, partial [Homo sapiens]"
+NCBI_TITLE = re.compile(r"^(.*?)\s*\[([^\[\]]+)\]\s*$")
+PARTIAL_WORD = re.compile(r"\bpartial\b", re.IGNORECASE)
+# the words of protein names and queries
+WORD = re.compile(r"[a-z0-9]+")
+# the pieces of a query: parentheses, the boolean operators and the terms between them
+QUERY_PIECES = re.compile(r"(\(|\)|\bAND\b|\bOR\b|\bNOT\b)")
+FIELD_TAG = re.compile(r"^(.*?)\s*\[([^\[\]]+)\]$")
+# the terms of a piece: every field-tagged term, and the untagged text between them
+PIECE_TERMS = re.compile(r"[^\[\]]*\[[^\[\]]+\]|[^\[\]]+")
+
+
+class QueryError(ValueError):
+    '''Raised when a search term cannot be parsed.'''
+
+
+def words(text):
+    '''This function returns the words of text (lower case letters and digits).'''
+    return WORD.findall(text.lower())
+
+
+def parse_header(header):
+    '''This function reads a FASTA header (without the >) and returns its accession ID, protein name, organism
+    (None if not given), taxid (None if not given) and whether the protein is partial.'''
+    # NCBI nr headers hold several titles separated by ^A: the first one stands for the record
+    header = header.split("\x01")[0].strip()
+    accession = accession_of(header)
+    title = header[len(header.split()[0]):].strip() if header.split() else ""
+    organism = taxid = None
+    position = (" " + title).find(" OS=")
+    if position >= 0:
+        name = title[:max(position - 1, 0)].strip()
+        match = UNIPROT_ORGANISM.search(" " + title)
+        organism = match.group(1).strip() if match else None
+        match = UNIPROT_TAXID.search(" " + title)
+        taxid = int(match.group(1)) if match else None
+        partial = "(Fragment)" in name
+    else:
+        match = NCBI_TITLE.match(title)
+        if match:
+            name, organism = match.group(1), match.group(2).strip()
+        else:
+            name = title
+        partial = bool(PARTIAL_WORD.search(name))
+    return accession, name, organism, taxid, partial
+
+
+def base_accession(accession):
+    '''This function returns an accession ID without its version (XP_012345.1: XP_012345) or, for a UniProt ID,
+    the accession it holds (sp|P69905|HBA_HUMAN: P69905).'''
+    parts = accession.split("|")
+    if len(parts) >= 3 and parts[0] in ("sp", "tr"):
+        return parts[1]
+    return accession.rsplit(".", 1)[0] if "." in accession else accession
+
+
+def index_path(fasta_path, index_dir=LOCAL_DB_DIR):
+    '''This function returns where the index of the FASTA file at fasta_path is kept.'''
+    digest = hashlib.sha1(os.path.abspath(fasta_path).encode("utf-8")).hexdigest()[:16]
+    return os.path.join(index_dir, os.path.basename(fasta_path) + "." + digest + ".sqlite")
+
+
+def fasta_signature(fasta_path):
+    '''This function returns what identifies the version of a FASTA file (its size and modification time).'''
+    stat = os.stat(fasta_path)
+    return str(stat.st_size) + ":" + str(stat.st_mtime_ns)
+
+
+def header_records(fasta_path):
+    '''This function reads a FASTA file once and yields (start, end, header) for every record, where start and end
+    are the byte offsets of the record (header line included).'''
+    offset = 0
+    start = header = None
+    with open(fasta_path, "rb") as f:
+        for line in f:
+            if line.startswith(b">"):
+                if header is not None:
+                    yield start, offset, header
+                start, header = offset, line[1:].decode("utf-8", "replace").strip()
+            offset += len(line)
+    if header is not None:
+        yield start, offset, header
+
+
+def build_local_index(fasta_path, db_path=None, report=print):
+    '''This function indexes the FASTA file at fasta_path into db_path (by default in the cache directory) and
+    returns the number of records. The index is written to a temporary file first, so a build that fails never
+    leaves a broken index behind.'''
+    db_path = index_path(fasta_path) if db_path is None else db_path
+    os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+    temp_path = db_path + ".building"
+    if os.path.exists(temp_path):
+        os.remove(temp_path)
+    taxonomy = get_taxonomy_index(report=report)
+    # the taxid of every organism name met so far (NCBI headers only give the name)
+    taxids = {}
+    connection = sqlite3.connect(temp_path)
+    connection.execute("PRAGMA journal_mode = OFF")
+    connection.execute("PRAGMA synchronous = OFF")
+    connection.execute("CREATE TABLE records (number INTEGER PRIMARY KEY, accession TEXT, base_accession TEXT, "
+                       "start INTEGER, end INTEGER, organism TEXT, organism_lower TEXT, taxid INTEGER, partial INTEGER)")
+    connection.execute("CREATE TABLE tokens (token TEXT, number INTEGER, PRIMARY KEY (token, number)) WITHOUT ROWID")
+    connection.execute("CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT)")
+    records = []
+    tokens = []
+    count = 0
+
+    def flush():
+        connection.executemany("INSERT INTO records VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", records)
+        connection.executemany("INSERT INTO tokens VALUES (?, ?)", tokens)
+        del records[:], tokens[:]
+
+    for number, (start, end, header) in enumerate(header_records(fasta_path)):
+        accession, name, organism, taxid, partial = parse_header(header)
+        if taxid is None and organism is not None and taxonomy is not None:
+            if organism not in taxids:
+                taxa = taxonomy.resolve(organism)
+                taxids[organism] = taxa[0]["taxid"] if taxa else None
+            taxid = taxids[organism]
+        records.append((number, accession, base_accession(accession), start, end, organism,
+                        organism.lower() if organism else None, taxid, int(partial)))
+        tokens.extend((token, number) for token in set(words(name)))
+        count = number + 1
+        if len(records) >= INSERT_BATCH:
+            flush()
+            if report and count % (INSERT_BATCH * 50) == 0:
+                report("Indexed " + str(count) + " records of " + str(fasta_path) + "...")
+    flush()
+    # the indexes are made once every row is in, which is much faster than keeping them up to date row by row
+    connection.execute("CREATE INDEX records_accession ON records (accession)")
+    connection.execute("CREATE INDEX records_base_accession ON records (base_accession)")
+    connection.execute("CREATE INDEX records_taxid ON records (taxid)")
+    connection.execute("CREATE INDEX records_organism ON records (organism_lower)")
+    connection.execute("CREATE INDEX records_partial ON records (partial)")
+    connection.executemany("INSERT INTO meta VALUES (?, ?)", [("fasta", os.path.abspath(fasta_path)),
+                                                              ("signature", fasta_signature(fasta_path))])
+    connection.commit()
+    connection.close()
+    os.replace(temp_path, db_path)
+    if report:
+        report("The local protein database index (" + str(count) + " records) is saved in " + db_path + ".")
+    return count
+
+
+def glob_escape(text):
+    '''This function escapes the characters GLOB treats as wildcards.'''
+    return re.sub(r"([*?\[])", r"[\1]", text)
+
+
+def accession_sql(accession):
+    '''This function returns the SQL query selecting the records of an accession ID, with its parameters: an
+    accession without its version matches every version, and a UniProt accession matches its sp|...| or tr|...| ID.'''
+    accession = accession.strip()
+    return "SELECT number FROM records WHERE accession = ? OR base_accession = ?", [accession, accession]
+
+
+class LocalProteinDB:
+    '''The searches of a FASTA file indexed by build_local_index (the index is built, or rebuilt after the file has
+    changed, on first use).
+    fasta_path: the FASTA file
+    db_path: its index (by default in the cache directory)
+    taxonomy: a TaxonomyIndex to expand organisms to their subtree (by default the shared one, if there is one)
+    '''
+
+    def __init__(self, fasta_path, db_path=None, taxonomy=None, report=print):
+        self.fasta_path = os.path.abspath(fasta_path)
+        self.db_path = index_path(fasta_path) if db_path is None else db_path
+        if not self.index_is_current():
+            build_local_index(fasta_path, self.db_path, report)
+        self.taxonomy = taxonomy if taxonomy is not None else get_taxonomy_index(report=report)
+        self.connection = sqlite3.connect(self.db_path, check_same_thread=False)
+        self.lock = threading.RLock()
+        # the result sets kept for efetch (WebEnv: the name of the table holding the record numbers in order)
+        self.results = {}
+        self.result_count = 0
+
+    def index_is_current(self):
+        '''This function returns True if the index exists and describes the current version of the FASTA file.'''
+        if not os.path.exists(self.db_path):
+            return False
+        try:
+            connection = sqlite3.connect(self.db_path)
+            try:
+                row = connection.execute("SELECT value FROM meta WHERE key = 'signature'").fetchone()
+            finally:
+                connection.close()
+        except sqlite3.Error:
+            return False
+        return row is not None and row[0] == fasta_signature(self.fasta_path)
+
+    def __len__(self):
+        with self.lock:
+            return self.connection.execute("SELECT COUNT(*) FROM records").fetchone()[0]
+
+    def term_sql(self, text, field):
+        '''This function returns the SQL query selecting the record numbers matching one search term, with its
+        parameters.'''
+        text = text.strip().strip('"').strip()
+        field = field.strip().lower()
+        if field in PROPERTY_FIELDS and text.lower() == "partial":
+            return "SELECT number FROM records WHERE partial = 1", []
+        if field in ORGANISM_FIELDS:
+            return self.organism_sql(text)
+        if field in PROTEIN_FIELDS:
+            return self.words_sql(text)
+        if field in ACCESSION_FIELDS:
+            return accession_sql(text)
+        if field in PROPERTY_FIELDS:
+            # any other word is looked for in the protein names and the organisms
+            name_sql, name_params = self.words_sql(text)
+            organism_sql, organism_params = self.organism_sql(text)
+            return name_sql + " UNION " + organism_sql, name_params + organism_params
+        raise QueryError("Unknown search field [" + field + "] in the term " + text + "[" + field + "]")
+
+    def words_sql(self, text):
+        '''This function returns the SQL query selecting the records with every word of text in their protein name.'''
+        tokens = words(text)
+        if not tokens:
+            raise QueryError("No word to search for in " + repr(text))
+        return (" INTERSECT ".join("SELECT number FROM tokens WHERE token = ?" for token in tokens), tokens)
+
+    def organism_sql(self, text):
+        '''This function returns the SQL query selecting the records of an organism: the records of the taxon and
+        of every taxon below it (with a taxonomy index), and the records of that organism name or, for a genus name,
+        of its species.'''
+        name = text.lower()
+        sql = "SELECT number FROM records WHERE organism_lower = ? OR organism_lower GLOB ?"
+        params = [name, glob_escape(name) + " *"]
+        taxa = self.taxonomy.resolve(text) if self.taxonomy is not None else []
+        if taxa:
+            # the subtree can hold many thousands of taxids, so it goes to a temporary table rather than the query
+            table = "taxa_" + hashlib.sha1(name.encode("utf-8")).hexdigest()[:12]
+            self.connection.execute("CREATE TEMP TABLE IF NOT EXISTS " + table + " (taxid INTEGER PRIMARY KEY)")
+            for taxon in taxa:
+                self.connection.executemany("INSERT OR IGNORE INTO temp." + table + " VALUES (?)",
+                                            ((taxid,) for taxid in self.taxonomy.descendants(taxon["taxid"])))
+            sql += " OR taxid IN (SELECT taxid FROM temp." + table + ")"
+        return sql, params
+
+    def piece_sql(self, piece):
+        '''This function returns the SQL query selecting the records matching a piece of a search term between two
+        boolean operators, with its parameters. Terms side by side in a piece (e.g. "kinase[PROT] PARTIAL") must all
+        match, as if they were joined by AND.'''
+        sql, params = None, []
+        for text in PIECE_TERMS.findall(piece):
+            text = text.strip()
+            if not text:
+                continue
+            match = FIELD_TAG.match(text)
+            term_sql, term_params = self.term_sql(match.group(1), match.group(2)) if match else \
+                self.term_sql(text, "all fields")
+            if sql is None:
+                sql, params = term_sql, term_params
+            else:
+                sql = "SELECT number FROM (" + sql + ") INTERSECT SELECT number FROM (" + term_sql + ")"
+                params = params + term_params
+        if sql is None:
+            raise QueryError("Nothing to search for in " + repr(piece))
+        return sql, params
+
+    def query_sql(self, term):
+        '''This function parses an Entrez search term and returns the SQL query selecting the matching record numbers,
+        with its parameters. The boolean operators are applied from left to right, as Entrez does.'''
+        pieces = [piece.strip() for piece in QUERY_PIECES.split(term) if piece.strip()]
+        position = 0
+
+        def operand():
+            nonlocal position
+            if position >= len(pieces):
+                raise QueryError("The search term " + repr(term) + " ends too early")
+            piece = pieces[position]
+            position += 1
+            if piece == "(":
+                sql, params = expression()
+                if position >= len(pieces) or pieces[position] != ")":
+                    raise QueryError("A parenthesis is not closed in " + repr(term))
+                position += 1
+                return sql, params
+            if piece in ("AND", "OR", "NOT", ")"):
+                raise QueryError("Unexpected " + piece + " in " + repr(term))
+            return self.piece_sql(piece)
+
+        def expression():
+            nonlocal position
+            # a leading NOT excludes from every record
+            if position < len(pieces) and pieces[position] == "NOT":
+                sql, params = "SELECT number FROM records", []
+            else:
+                sql, params = operand()
+            while position < len(pieces) and pieces[position] in ("AND", "OR", "NOT"):
+                operator = {"AND": "INTERSECT", "OR": "UNION", "NOT": "EXCEPT"}[pieces[position]]
+                position += 1
+                right_sql, right_params = operand()
+                sql = ("SELECT number FROM (" + sql + ") " + operator + " SELECT number FROM (" + right_sql + ")")
+                params = params + right_params
+            return sql, params
+
+        sql, params = expression()
+        if position != len(pieces):
+            raise QueryError("Could not read " + repr(" ".join(pieces[position:])) + " in " + repr(term))
+        return sql, params
+
+    def search(self, term):
+        '''This function runs a search and keeps its result for efetch. It returns the number of records found and
+        the WebEnv of the result.'''
+        with self.lock:
+            sql, params = self.query_sql(term)
+            self.result_count += 1
+            webenv = "local" + str(self.result_count)
+            table = "result_" + str(self.result_count)
+            self.connection.execute("CREATE TEMP TABLE " + table + " (position INTEGER PRIMARY KEY, number INTEGER)")
+            self.connection.execute("INSERT INTO temp." + table + " (number) SELECT number FROM (" + sql + ") "
+                                    "ORDER BY number", params)
+            self.results[webenv] = table
+            # only the latest results are kept
+            while len(self.results) > MAX_RESULT_SETS:
+                oldest = next(iter(self.results))
+                self.connection.execute("DROP TABLE temp." + self.results.pop(oldest))
+            count = self.connection.execute("SELECT COUNT(*) FROM temp." + table).fetchone()[0]
+        return count, webenv
+
+    def result_records(self, webenv, retstart=0, retmax=None):
+        '''This function returns (accession, start, end) of the records of a result, from position retstart on.'''
+        with self.lock:
+            table = self.results.get(webenv)
+            if table is None:
+                raise QueryError("The result " + str(webenv) + " has expired, run the search again")
+            return self.connection.execute(
+                "SELECT records.accession, records.start, records.end FROM temp." + table + " AS result "
+                "JOIN records ON records.number = result.number WHERE result.position > ? ORDER BY result.position "
+                "LIMIT ?", (int(retstart), -1 if retmax is None else int(retmax))).fetchall()
+
+    def accession_records(self, accessions):
+        '''This function returns (accession, start, end) of the records with these accession IDs, in file order.'''
+        found = []
+        with self.lock:
+            for accession in accessions:
+                rows = self.connection.execute("SELECT number, accession, start, end FROM records WHERE accession = ?",
+                                               (accession,)).fetchall()
+                if not rows:
+                    sql, params = accession_sql(accession)
+                    rows = self.connection.execute("SELECT number, accession, start, end FROM records WHERE number IN ("
+                                                   + sql + ")", params).fetchall()
+                found.extend(rows)
+        return [row[1:] for row in sorted(set(found))]
+
+    def read_records(self, records):
+        '''This function returns the FASTA text of records ((accession, start, end), in file order) as bytes; records
+        next to each other in the file are read in one go.'''
+        chunks = []
+        with open(self.fasta_path, "rb") as f:
+            run_start = run_end = None
+            for accession, start, end in records:
+                if start != run_end:
+                    if run_start is not None:
+                        f.seek(run_start)
+                        chunks.append(f.read(run_end - run_start))
+                    run_start = start
+                run_end = end
+            if run_start is not None:
+                f.seek(run_start)
+                chunks.append(f.read(run_end - run_start))
+        text = b"".join(chunks)
+        return text if not text or text.endswith(b"\n") else text + b"\n"
+
+    def close(self):
+        self.connection.close()
+
+
+class LocalProteinTransport:
+    '''A transport for eutils.EutilsClient answering the protein database from a LocalProteinDB and passing any
+    other request on to fallback (NCBI), rate limited as NCBI asks.
+    database: the LocalProteinDB
+    fallback: the transport of every other request (by default a keep-alive HTTPTransport to NCBI)
+    '''
+
+    def __init__(self, database, fallback=None, rate=None):
+        self.database = database
+        self.fallback = fallback if fallback is not None else HTTPTransport()
+        self.rate_limiter = RateLimiter(rate if rate else (10 if NCBI_API_KEY else 3))
+
+    def request(self, endpoint, params):
+        if params.get("db") != "protein":
+            self.rate_limiter.wait()
+            return self.fallback.request(endpoint, params)
+        if endpoint == "espell.fcgi":
+            # the local database has no spelling suggestions
+            return b"<eSpellResult><CorrectedQuery></CorrectedQuery></eSpellResult>"
+        if endpoint == "esearch.fcgi":
+            return self.esearch(params)
+        if endpoint == "efetch.fcgi":
+            return self.efetch(params)
+        raise QueryError("The local protein database cannot answer " + str(endpoint))
+
+    def esearch(self, params):
+        '''This function answers an esearch request with an eSearchResult, as NCBI would.'''
+        try:
+            count, webenv = self.database.search(params.get("term", ""))
+        except QueryError as error:
+            return ("<eSearchResult><Count>0</Count><ErrorList><ERROR>" + xml.sax.saxutils.escape(str(error))
+                    + "</ERROR></ErrorList></eSearchResult>").encode("utf-8")
+        retmax = int(params.get("retmax", 0) or 0)
+        ids = [row[0] for row in self.database.result_records(webenv, 0, retmax)] if retmax else []
+        return ("<eSearchResult><Count>" + str(count) + "</Count><RetMax>" + str(len(ids)) + "</RetMax>"
+                "<QueryKey>1</QueryKey><WebEnv>" + webenv + "</WebEnv><IdList>"
+                + "".join("<Id>" + xml.sax.saxutils.escape(accession) + "</Id>" for accession in ids)
+                + "</IdList></eSearchResult>").encode("utf-8")
+
+    def efetch(self, params):
+        '''This function answers an efetch request (by accession IDs or from a result) with FASTA records or, with
+        rettype acc, their accession IDs.'''
+        if "id" in params:
+            records = self.database.accession_records([accession for accession in str(params["id"]).split(",")
+                                                       if accession])
+        else:
+            retmax = params.get("retmax")
+            records = self.database.result_records(params.get("WebEnv"), int(params.get("retstart", 0) or 0),
+                                                    int(retmax) if retmax is not None else None)
+        if params.get("rettype") == "acc":
+            return "".join(accession + "\n" for accession, start, end in records).encode("utf-8")
+        return self.database.read_records(records)
+
+
+def local_client(fasta_path, report=print):
+    '''This function returns an EutilsClient searching the protein database in the FASTA file at fasta_path (and NCBI
+    for anything else). Nothing is cached: the local answers are as fast as the cache, and must not be mistaken for
+    NCBI's.'''
+    client = EutilsClient(transport=LocalProteinTransport(LocalProteinDB(fasta_path, report=report)), cache=False)
+    # the transport rate limits the requests that go to NCBI, the local ones need no limit
+    client.rate_limiter = RateLimiter(1e9)
+    return client
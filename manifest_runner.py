@@ -0,0 +1,270 @@
+#!/usr/bin/python3
+'''A batch runner for a whole manifest of searches.
+
+The manifest is a CSV or TSV file with one search per row, given either as a complete search term (search_term) or as
+taxon, protein and partial columns; min_len, max_len, prune and name are optional. Every search runs the ProteoQuest
+pipeline (fetch, conservation, motifs, statistics) unattended in its own folder under the output directory, so no
+search depends on the working directory of the process.
+
+The network-bound downloads run in a pool of threads and every search is handed to a pool of analysis processes as
+soon as its sequences are downloaded, so the downloads of later searches overlap with the analysis of earlier ones.
+When every search has finished, a combined summary table (one row per search) is saved as manifest_summary.csv.
+
+Usage: python3 manifest_runner.py manifest.tsv --output-dir results [--fetch-jobs 4] [--analysis-jobs 2]
+'''
+import argparse
+import contextlib
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+
+import pandas as pd
+
+import ProteoQuest as pq
+from length_filter import LengthFilter
+from motif_scan import available_cores
+from instrumentation import start_report
+
+# the columns of the summary table, in the order they are saved
+SUMMARY_COLUMNS = ['Name', 'Search Term', 'Status', 'Sequences Found', 'Sequences Analysed', 'Min Length', 'Max Length',
+                   'Motif Hits', 'Distinct Motifs', 'Mean Molecular Weight', 'Mean Isoelectric Point',
+                   'Fetch Seconds', 'Analysis Seconds', 'Folder']
+
+# the stages every analysis process runs under cProfile (set by init_analysis_worker)
+PROFILE = []
+
+
+def read_manifest(path):
+    '''This function reads the manifest and returns one job (a dictionary) per search.
+    Tab separated files (.tsv, .tab or any file whose header contains a tab) are read as TSV, anything else as CSV.'''
+    with open(path, "r") as f:
+        header = f.readline()
+    sep = "\t" if path.endswith((".tsv", ".tab")) or "\t" in header else ","
+    manifest = pd.read_csv(path, sep=sep, dtype=str, keep_default_na=False, comment="#")
+    manifest.columns = [column.strip().lower().replace(" ", "_") for column in manifest.columns]
+    jobs = []
+    for row_number, row in enumerate(manifest.to_dict("records"), start=1):
+        row = {key: value.strip() for key, value in row.items()}
+        search_term = row.get("search_term", "")
+        if not search_term:
+            if not row.get("taxon") or not row.get("protein"):
+                raise ValueError("row " + str(row_number) + " of " + path + " needs a search_term or a taxon and a protein")
+            search_term = pq.build_search_term(row["taxon"], row["protein"], row.get("partial", "").lower())
+        jobs.append({
+            "name": row.get("name") or pq.search_term_to_file_name(search_term),
+            "search_term": search_term,
+            "min_len": int(row["min_len"]) if row.get("min_len") else None,
+            "max_len": int(row["max_len"]) if row.get("max_len") else None,
+            "prune": row.get("prune", "").lower() in ("y", "yes", "true", "1"),
+        })
+    return jobs
+
+
+def assign_folders(jobs, output_dir):
+    '''This function gives every job its own folder under output_dir (repeated names get a _2, _3, ... suffix).'''
+    seen = {}
+    for job in jobs:
+        seen[job["name"]] = seen.get(job["name"], 0) + 1
+        if seen[job["name"]] > 1:
+            job["name"] = job["name"] + "_" + str(seen[job["name"]])
+        job["work_dir"] = os.path.abspath(os.path.join(output_dir, job["name"]))
+    return jobs
+
+
+def summary_row(job, status, **values):
+    '''This function returns the summary table row of a job.'''
+    row = dict.fromkeys(SUMMARY_COLUMNS)
+    row.update({'Name': job["name"], 'Search Term': job["search_term"], 'Status': status, 'Folder': job["work_dir"],
+                'Fetch Seconds': round(job.get("fetch_seconds", 0.0), 1)})
+    row.update(values)
+    return row
+
+
+def fetch_job(job, max_seq_count):
+    '''This function downloads the sequences of one job into its folder (run in a thread).
+    It returns the job with its fasta file and sequence count added.'''
+    start = time.perf_counter()
+    seq_count = pq.get_eutils().count("protein", job["search_term"])
+    if seq_count == 0 or (max_seq_count and seq_count > max_seq_count):
+        raise ValueError("the search returned " + str(seq_count) + " results (the limit is " + str(max_seq_count) + ")")
+    os.makedirs(job["work_dir"], exist_ok=True)
+    # the log of the download is kept in the folder of the job, as the downloads run side by side
+    with open(os.path.join(job["work_dir"], "proteoquest.log"), "w") as log:
+        job["fasta_path"], job["seq_count"] = pq.fetch_sequences(job["search_term"], job["name"], job["work_dir"],
+                                                                 report=lambda message: print(message, file=log))
+    job["fetch_seconds"] = time.perf_counter() - start
+    return job
+
+
+def init_analysis_worker(stats_engine, scan_workers, use_cache=True, profile=(), results_db="", local_db="",
+                         identity=pq.REDUNDANCY_IDENTITY, neighbours=pq.SIMILARITY_NEIGHBOURS,
+                         emboss_mode=pq.EMBOSS_MODE, conservation_engine=pq.CONSERVATION_ENGINE,
+                         winsize=pq.CONSERVATION_WINSIZE):
+    '''This function prepares an analysis process: batch mode, plots saved without a display, the engine and analysis
+    settings and the results warehouse every analysis is added to.'''
+    global PROFILE
+    PROFILE = list(profile)
+    pq.BATCH_MODE = True
+    pq.get_artifacts().enabled = use_cache
+    pq.STATS_ENGINE = stats_engine
+    pq.SCAN_WORKERS = scan_workers
+    pq.EMBOSS_MODE = emboss_mode
+    pq.CONSERVATION_ENGINE = conservation_engine
+    pq.CONSERVATION_WINSIZE = winsize
+    pq.REDUNDANCY_IDENTITY = identity
+    pq.SIMILARITY_NEIGHBOURS = neighbours
+    pq.RESULTS_DB = results_db
+    # only recorded as the source of the sequences, the analysis itself never searches
+    pq.LOCAL_PROTEIN_DB = local_db
+    pq.plt.switch_backend("Agg")
+
+
+def analyse_job(job):
+    '''This function runs the conservation, motif and statistics steps of one job (run in an analysis process)
+    and returns its summary table row.'''
+    start = time.perf_counter()
+    # every job gets its own run report, saved in its folder
+    start_report(profile=PROFILE)
+    try:
+        # everything the pipeline prints goes to the log in the folder of the job
+        with open(os.path.join(job["work_dir"], "proteoquest.log"), "a") as log:
+            with contextlib.redirect_stdout(log):
+                min_seq_len, max_seq_len = pq.get_min_and_max_seq_len(job["fasta_path"])
+                def_min_seq_len = job["min_len"] if job["min_len"] is not None else int(min_seq_len)
+                def_max_seq_len = job["max_len"] if job["max_len"] is not None else int(max_seq_len)
+                trimmed_seq_count = LengthFilter(job["fasta_path"]).count(def_min_seq_len, def_max_seq_len)
+                if trimmed_seq_count == 0:
+                    raise ValueError("no sequence is between " + str(def_min_seq_len) + " and " + str(def_max_seq_len)
+                                     + " amino acids long")
+                new_file_name, df, stats_df = pq.analyse_sequences(job["name"], job["work_dir"], def_min_seq_len,
+                                                                   def_max_seq_len, prune=job["prune"],
+                                                                   search_term=job["search_term"])
+    except (Exception, SystemExit) as error:
+        return summary_row(job, "failed: " + str(error), **{'Sequences Found': job["seq_count"],
+                                                            'Analysis Seconds': round(time.perf_counter() - start, 1)})
+    return summary_row(job, "ok", **{
+        'Sequences Found': job["seq_count"],
+        'Sequences Analysed': trimmed_seq_count,
+        'Min Length': def_min_seq_len,
+        'Max Length': def_max_seq_len,
+        'Motif Hits': int(df.values.sum()) if not df.empty else 0,
+        'Distinct Motifs': int((df.sum(axis=0) > 0).sum()) if not df.empty else 0,
+        'Mean Molecular Weight': round(float(stats_df['Molecular Weight'].mean()), 2),
+        'Mean Isoelectric Point': round(float(stats_df['Isoelectric Point'].mean()), 4),
+        'Analysis Seconds': round(time.perf_counter() - start, 1),
+    })
+
+
+def run_manifest(jobs, output_dir=".", fetch_jobs=4, analysis_jobs=0, max_seq_count=pq.MAX_SEQ_COUNT,
+                 stats_engine=pq.STATS_ENGINE, scan_workers=1, use_cache=True, profile=(), results_db="",
+                 identity=pq.REDUNDANCY_IDENTITY, neighbours=pq.SIMILARITY_NEIGHBOURS, emboss_mode=pq.EMBOSS_MODE,
+                 conservation_engine=pq.CONSERVATION_ENGINE, winsize=pq.CONSERVATION_WINSIZE, report=print):
+    '''This function runs every job of the manifest and returns the combined summary table as a dataframe.
+    fetch_jobs: the number of searches downloaded at the same time
+    analysis_jobs: the number of searches analysed at the same time (0 uses every available core)
+    scan_workers: the number of patmatmotifs scans each analysis runs at the same time
+    use_cache: reuse cached alignments, plots, motif hits and statistics (False recomputes everything)
+    profile: the stages every analysis runs under cProfile
+    results_db: the SQLite results warehouse every analysis is added to (none by default)
+    identity: collapse sequences at least this identical into one representative before the analysis (0 keeps them all)
+    neighbours: the number of nearest neighbours listed for every sequence by k-mer similarity (0 skips the overview)
+    emboss_mode: run patmatmotifs and pepstats once per multi-sequence chunk ("chunked") or once per sequence
+    conservation_engine: how the conservation is calculated ("native" or "plotcon"), averaged over winsize columns'''
+    # nothing is asked, paused for or opened in a viewer while the manifest runs
+    pq.BATCH_MODE = True
+    jobs = assign_folders(jobs, output_dir)
+    if not analysis_jobs:
+        analysis_jobs = available_cores()
+    rows = []
+    # the analysis processes are started fresh ("spawn"), so they do not inherit the locks held by the download threads
+    context = multiprocessing.get_context("spawn")
+    with ThreadPoolExecutor(max_workers=fetch_jobs) as fetch_pool, \
+            ProcessPoolExecutor(max_workers=analysis_jobs, mp_context=context, initializer=init_analysis_worker,
+                                initargs=(stats_engine, scan_workers, use_cache, list(profile), results_db,
+                                          pq.LOCAL_PROTEIN_DB, identity, neighbours, emboss_mode, conservation_engine,
+                                          winsize)) as analysis_pool:
+        fetches = {fetch_pool.submit(fetch_job, job, max_seq_count): job for job in jobs}
+        analyses = []
+        # hand every search to the analysis pool as soon as its download has finished
+        for future in as_completed(fetches):
+            job = fetches[future]
+            try:
+                future.result()
+            except Exception as error:
+                report("Download failed for " + job["name"] + ": " + str(error))
+                rows.append(summary_row(job, "failed: " + str(error)))
+                continue
+            report("Downloaded " + str(job["seq_count"]) + " sequences for " + job["name"]
+                   + " (" + format(job["fetch_seconds"], ".1f") + " s), analysing...")
+            analyses.append(analysis_pool.submit(analyse_job, job))
+        for future in as_completed(analyses):
+            row = future.result()
+            report("Finished " + row['Name'] + ": " + row['Status'])
+            rows.append(row)
+    # keep the rows in manifest order
+    order = {job["name"]: i for i, job in enumerate(jobs)}
+    rows.sort(key=lambda row: order[row['Name']])
+    summary = pd.DataFrame(rows, columns=SUMMARY_COLUMNS)
+    os.makedirs(output_dir, exist_ok=True)
+    summary.to_csv(os.path.join(output_dir, "manifest_summary.csv"), index=False)
+    return summary
+
+
+def main(argv=None):
+    '''This function runs a manifest from the command line.'''
+    parser = argparse.ArgumentParser(description="Run the ProteoQuest pipeline unattended for every search in a CSV/TSV manifest.")
+    parser.add_argument("manifest", help="a CSV or TSV file with a search_term column, or taxon, protein and partial columns "
+                                         "(optional columns: name, min_len, max_len, prune)")
+    parser.add_argument("--output-dir", default=".", help="the directory holding one folder per search (default: .)")
+    parser.add_argument("--fetch-jobs", type=int, default=4, help="the number of searches downloaded at once (default: 4)")
+    parser.add_argument("--analysis-jobs", type=int, default=0,
+                        help="the number of searches analysed at once (default: every core)")
+    parser.add_argument("--max-seqs", type=int, default=pq.MAX_SEQ_COUNT,
+                        help="the largest number of sequences a search may return (0 for no limit)")
+    parser.add_argument("--stats-engine", choices=["native", "pepstats"], default=pq.STATS_ENGINE,
+                        help="how the protein statistics are calculated")
+    parser.add_argument("--emboss-mode", choices=["chunked", "per-sequence"], default=pq.EMBOSS_MODE,
+                        help="run patmatmotifs and pepstats once per multi-sequence chunk (the default) or once per "
+                             "sequence")
+    parser.add_argument("--conservation-engine", choices=["native", "plotcon"], default=pq.CONSERVATION_ENGINE,
+                        help="how the conservation is calculated")
+    parser.add_argument("--winsize", type=int, default=pq.CONSERVATION_WINSIZE,
+                        help="the window size the conservation is averaged over (default: 4)")
+    parser.add_argument("--identity", type=float, default=pq.REDUNDANCY_IDENTITY,
+                        help="collapse sequences at least this identical (e.g. 0.95) into one representative before "
+                             "every analysis (default: 0, keep every sequence)")
+    parser.add_argument("--neighbours", type=int, default=pq.SIMILARITY_NEIGHBOURS,
+                        help="the number of nearest neighbours listed for every sequence by k-mer similarity "
+                             "(default: %(default)s; 0 skips the similarity overview)")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="recompute every alignment, plot, motif scan and statistic instead of reusing cached ones")
+    parser.add_argument("--profile", default="",
+                        help="run these stages of every analysis under cProfile, comma-separated (e.g. motifs,stats) "
+                             "or all (the stages of an analysis then run one at a time instead of side by side)")
+    parser.add_argument("--local-db", default=pq.LOCAL_PROTEIN_DB,
+                        help="search this protein FASTA file instead of NCBI (it is indexed the first time it is used)")
+    parser.add_argument("--results-db", default=pq.RESULTS_DB,
+                        help="add the sequences, motif hits and protein statistics of every search to this SQLite "
+                             "results warehouse")
+    options = parser.parse_args(argv)
+    if options.local_db:
+        pq.use_local_database(options.local_db)
+    jobs = read_manifest(options.manifest)
+    print("Running", len(jobs), "searches from", options.manifest)
+    summary = run_manifest(jobs, options.output_dir, fetch_jobs=options.fetch_jobs, analysis_jobs=options.analysis_jobs,
+                           max_seq_count=options.max_seqs, stats_engine=options.stats_engine,
+                           use_cache=not options.no_cache, results_db=options.results_db,
+                           identity=options.identity, neighbours=options.neighbours, emboss_mode=options.emboss_mode,
+                           conservation_engine=options.conservation_engine, winsize=options.winsize,
+                           profile=[stage.strip() for stage in options.profile.split(",") if stage.strip()])
+    print(summary.to_string(index=False))
+    print("The summary table is saved in", os.path.join(options.output_dir, "manifest_summary.csv"))
+    print(pq.get_default_cache().report())
+    # a non-zero status tells a scheduler that at least one search failed
+    return 0 if (summary['Status'] == "ok").all() else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,105 @@
+#!/usr/bin/python3
+'''A parallel executor for the per-sequence PROSITE scans (EMBOSS patmatmotifs).
+
+Instead of running one patmatmotifs process after another, the scans are spread over a pool of workers, so all the
+cores of the machine are kept busy. Each report is read from the tool's standard output and collected in memory as
+soon as its worker finishes, so there is no need to move report files around and read them back. Progress and
+throughput are reported while the scan runs.
+'''
+import os
+import subprocess
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from instrumentation import get_report
+from fasta import write_chunks
+from emboss_reports import parse_patmatmotifs, demultiplex
+
+# the smallest number of sequences given to one EMBOSS run when the sequences are split into chunks
+CHUNK_MIN_SEQUENCES = int(os.environ.get("PROTEOQUEST_CHUNK_MIN_SEQUENCES", 200))
+
+
+def available_cores():
+    '''This function returns the number of CPU cores this process is allowed to run on.'''
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        # os.sched_getaffinity is not available on every platform
+        return os.cpu_count() or 1
+
+
+def chunk_count(seq_count, workers=0, min_chunk=None):
+    '''This function returns the number of multi-sequence files seq_count sequences are split into for the EMBOSS
+    tools: one per worker, but no chunk smaller than min_chunk sequences (a process is not worth starting for less).
+    workers: the number of tools running at the same time (0 uses every available core)'''
+    if min_chunk is None:
+        min_chunk = CHUNK_MIN_SEQUENCES
+    if not workers:
+        workers = available_cores()
+    return max(1, min(workers, -(-seq_count // max(1, min_chunk))))
+
+
+def run_patmatmotifs(seq_path, prune=False):
+    '''This function scans one sequence file with patmatmotifs and returns the report as a string.
+    prune: leave out the simple post-translational modification sites (patmatmotifs -prune)'''
+    command = ["patmatmotifs", "-sequence", str(seq_path), "-outfile", "stdout", "-auto"]
+    if prune:
+        command.append("-prune")
+    result = get_report().run(command, inputs=[seq_path], stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                              universal_newlines=True)
+    if result.returncode == 127:
+        raise RuntimeError("patmatmotifs is not installed: install EMBOSS, or set PROSITE_DAT to a prosite.dat file "
+                           "to scan the motifs in-process (" + result.stderr.strip() + ")")
+    if result.returncode != 0:
+        raise RuntimeError("patmatmotifs failed on " + str(seq_path) + ": " + result.stderr.strip())
+    return result.stdout
+
+
+def scan_sequences(seq_paths, prune=False, workers=0, scan=run_patmatmotifs, report=print):
+    '''This function scans every sequence file in seq_paths concurrently and returns a dictionary with
+    the sequence file as the key and its report as the value.
+    workers: the number of scans running at the same time (0 uses every available core)
+    scan: the function scanning one sequence file, called as scan(seq_path, prune)
+    report: a function called with progress messages (None to stay quiet)'''
+    seq_paths = list(seq_paths)
+    if not workers:
+        workers = available_cores()
+    reports = {}
+    start = time.perf_counter()
+    # report progress roughly every 10% of the sequences
+    report_every = max(1, len(seq_paths) // 10)
+    # every worker only waits on its own patmatmotifs process, so threads are enough to keep the cores busy
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(scan, seq_path, prune): seq_path for seq_path in seq_paths}
+        for done, future in enumerate(as_completed(futures), start=1):
+            reports[futures[future]] = future.result()
+            if report and (done % report_every == 0 or done == len(seq_paths)):
+                elapsed = time.perf_counter() - start
+                report("Scanned " + str(done) + " of " + str(len(seq_paths)) + " sequences ("
+                       + format(done / elapsed if elapsed else 0.0, ".1f") + " sequences/s, "
+                       + str(workers) + " workers)")
+    return reports
+
+
+def scan_chunks(sequences, prefix, prune=False, workers=0, scan=run_patmatmotifs, report=print):
+    '''This function scans sequences (a dictionary with the accession ID as the key and the sequence as the value) with
+    patmatmotifs run once per multi-sequence chunk, one chunk per worker, instead of once per sequence. The chunks are
+    written to {prefix}_chunk{n}.fasta and their reports saved as {prefix}_chunk{n}.patmatmotifs.
+    It returns the motif hits as a list of (accession, motif, start, end), with (accession, None, None, None) for a
+    sequence without any hit.'''
+    if not sequences:
+        return []
+    chunks = write_chunks(sequences, prefix, chunk_count(len(sequences), workers))
+    try:
+        reports = scan_sequences([path for path, accessions in chunks], prune=prune, workers=len(chunks), scan=scan,
+                                 report=report)
+    finally:
+        for path, accessions in chunks:
+            os.remove(path)
+    hits = []
+    for path, accessions in chunks:
+        with open(os.path.splitext(path)[0] + ".patmatmotifs", "w") as f:
+            f.write(reports[path])
+        # the report names every sequence; the names are turned back into the accession IDs of the chunk
+        hits.extend(demultiplex(parse_patmatmotifs(reports[path].splitlines()), accessions))
+    return hits
@@ -0,0 +1,68 @@
+#!/usr/bin/python3
+'''A small DAG scheduler for the stages of a ProteoQuest analysis.
+
+Every stage is a function and the stages it depends on; a stage is called with the results of its dependencies (in
+the order they were listed) as soon as they are all available, on a pool of threads. Stages that do not depend on
+each other therefore run at the same time: the per-sequence motif scan and statistics only need the extracted
+sequences, so they run while clustalo is still aligning, and the end-to-end time approaches that of the slowest chain
+of stages instead of the sum of all of them. The start and end time of every stage is kept in Pipeline.timings.
+'''
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+
+class Pipeline:
+    '''A set of stages and their dependencies, run by run().'''
+
+    def __init__(self):
+        # name: (function, names of the stages it depends on), in the order the stages were added
+        self.stages = {}
+        # name: (start, end) in seconds since the pipeline started
+        self.timings = {}
+
+    def add(self, name, function, after=()):
+        '''This function adds a stage called name, which calls function with the results of the stages in after.'''
+        if name in self.stages:
+            raise ValueError("the pipeline already has a stage called " + str(name))
+        self.stages[name] = (function, tuple(after))
+        return self
+
+    def run(self, workers=None):
+        '''This function runs every stage as soon as its dependencies have finished and returns a dictionary with the
+        result of every stage. An exception raised by a stage is raised again here once the running stages finished.
+        workers: the number of stages run at the same time (by default, all the stages that are ready)'''
+        for name, (function, after) in self.stages.items():
+            for dependency in after:
+                if dependency not in self.stages:
+                    raise ValueError("the stage " + str(name) + " depends on an unknown stage " + str(dependency))
+        results = {}
+        pending = dict(self.stages)
+        running = {}
+        start = time.perf_counter()
+
+        def call(name, function, arguments):
+            began = time.perf_counter() - start
+            try:
+                return function(*arguments)
+            finally:
+                self.timings[name] = (began, time.perf_counter() - start)
+
+        with ThreadPoolExecutor(max_workers=workers or max(1, len(self.stages))) as executor:
+            while pending or running:
+                # start every stage whose dependencies have all finished
+                for name, (function, after) in list(pending.items()):
+                    if all(dependency in results for dependency in after):
+                        running[executor.submit(call, name, function, [results[dependency] for dependency in after])] = name
+                        del pending[name]
+                if not running:
+                    raise ValueError("the stages " + ", ".join(pending) + " depend on each other")
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    # a failed stage stops the pipeline: nothing new is started and the error is raised
+                    if future.exception() is not None:
+                        pending.clear()
+                        wait(running)
+                        raise future.exception()
+                    results[name] = future.result()
+        return results
@@ -0,0 +1,197 @@
+#!/usr/bin/python3
+'''A native PROSITE pattern engine, replacing one patmatmotifs process per sequence.
+
+The PROSITE pattern file (prosite.dat) is read once, every PROSITE pattern is translated into a regular expression and
+the translated set is cached on disk, so later runs do not even parse prosite.dat again. All the sequences are then
+scanned in-process: they are joined into a single string (one sequence per line) and every pattern is run over that
+string once, so the number of regex scans depends on the number of patterns, not on the number of sequences.
+Hits are reported with their positions, and the same -prune behaviour as patmatmotifs is available.
+'''
+import bisect
+import hashlib
+import os
+import pickle
+import re
+
+import numpy as np
+import pandas as pd
+
+from edirect_cache import DEFAULT_CACHE_DIR
+
+# where prosite.dat is looked for when no path is given
+PROSITE_DAT = os.environ.get("PROSITE_DAT", os.path.join(os.path.dirname(os.path.abspath(__file__)), "prosite.dat"))
+
+# the simple post-translational modification sites left out by patmatmotifs -prune
+PRUNED_MOTIFS = frozenset(["MYRISTYL", "ASN_GLYCOSYLATION", "CAMP_PHOSPHO_SITE", "PKC_PHOSPHO_SITE",
+                           "CK2_PHOSPHO_SITE", "TYR_PHOSPHO_SITE"])
+# the version of the pattern translation, part of the signature of the translated set: translations (and the motif
+# hits cached with them) made by an older pattern_to_regex are not reused
+TRANSLATION_VERSION = 2
+
+
+def pattern_to_regex(pattern):
+    '''This function translates a PROSITE pattern (e.g. "<M-[DE]-x(2,4)-{P}-C>.") into a Python regular expression.
+    x is any residue, [..] any of the residues listed, {..} any residue but those listed, (n) or (n,m) a repetition
+    (* any number), < and > anchor the pattern to the N- or C-terminus (a < or > inside brackets means "or the N- or
+    C-terminus").'''
+    pattern = pattern.strip().rstrip(".")
+    regex = []
+    for element in pattern.split("-"):
+        element = element.strip()
+        # the N- and C-terminal anchors come first and last, outside any bracket or repetition
+        prefix = ""
+        suffix = ""
+        if element.startswith("<"):
+            prefix = "^"
+            element = element[1:]
+        if element.endswith(">"):
+            suffix = "$"
+            element = element[:-1]
+        # a repetition such as x(2,4), [ST](3) or {C}*
+        repeat = ""
+        match = re.match(r"^(.*?)(?:\((\d+)(?:,(\d+))?\)|(\*))$", element)
+        if match:
+            element = match.group(1)
+            if match.group(4):
+                repeat = "*"
+            else:
+                repeat = "{" + match.group(2) + ("," + match.group(3) if match.group(3) else "") + "}"
+        if element == "x" or element == "X":
+            atom = "."
+        elif element.startswith("["):
+            residues = element.strip("[]")
+            # e.g. [G>]: a G, or the end of the sequence; [<M]: the start of the sequence, or an M
+            ends = (["^"] if "<" in residues else []) + (["$"] if ">" in residues else [])
+            residues = residues.replace("<", "").replace(">", "")
+            atom = "[" + residues + "]"
+            if ends:
+                atom = "(?:" + "|".join([atom] + ends) + ")"
+        elif element.startswith("{"):
+            atom = "[^" + element.strip("{}") + "\\n]"
+        else:
+            atom = element
+        regex.append(prefix + atom + repeat + suffix)
+    return "".join(regex)
+
+
+def read_prosite_dat(path):
+    '''This function reads prosite.dat and returns a list of (id, accession, description, pattern) for every PATTERN entry.'''
+    entries = []
+    entry_id = accession = description = None
+    pattern = []
+    is_pattern = False
+    with open(path, "r", encoding="latin-1") as f:
+        for line in f:
+            code = line[:2]
+            value = line[5:].strip()
+            if code == "ID":
+                # e.g. "ID   ASN_GLYCOSYLATION; PATTERN."
+                entry_id, _, entry_type = value.partition(";")
+                entry_id = entry_id.strip()
+                is_pattern = entry_type.strip().rstrip(".") == "PATTERN"
+            elif code == "AC":
+                accession = value.rstrip(";")
+            elif code == "DE":
+                description = value
+            elif code == "PA":
+                pattern.append(value)
+            elif code == "//":
+                if is_pattern and pattern:
+                    entries.append((entry_id, accession, description, "".join(pattern)))
+                entry_id = accession = description = None
+                pattern = []
+                is_pattern = False
+    return entries
+
+
+class PrositePatterns:
+    '''The PROSITE patterns of one prosite.dat file, translated into regular expressions.
+    path: the prosite.dat file
+    cache_dir: where the translated patterns are cached (None disables the cache)
+    '''
+
+    def __init__(self, path=PROSITE_DAT, cache_dir=DEFAULT_CACHE_DIR):
+        self.path = os.path.abspath(path)
+        self.entries = self.load(cache_dir)
+        # compile every pattern once; the lookahead lets overlapping hits of the same motif be found
+        self.compiled = [(entry_id, accession, re.compile("(?=(" + regex + "))", re.MULTILINE))
+                         for entry_id, accession, description, regex in self.entries]
+
+    def load(self, cache_dir):
+        '''This function returns the translated patterns, from the on-disk cache if prosite.dat has not changed.'''
+        stat = os.stat(self.path)
+        signature = hashlib.sha256((self.path + str(stat.st_size) + str(stat.st_mtime_ns)
+                                   + str(TRANSLATION_VERSION)).encode("utf-8")).hexdigest()
+        # the signature identifies this version of prosite.dat, e.g. in the keys of cached motif hits
+        self.signature = signature[:16]
+        cache_path = os.path.join(cache_dir, "prosite_" + self.signature + ".pickle") if cache_dir else None
+        if cache_path and os.path.exists(cache_path):
+            with open(cache_path, "rb") as f:
+                return pickle.load(f)
+        entries = [(entry_id, accession, description, pattern_to_regex(pattern))
+                   for entry_id, accession, description, pattern in read_prosite_dat(self.path)]
+        if cache_path:
+            os.makedirs(cache_dir, exist_ok=True)
+            with open(cache_path + ".tmp", "wb") as f:
+                pickle.dump(entries, f)
+            os.replace(cache_path + ".tmp", cache_path)
+        return entries
+
+    def scan(self, sequences, prune=False):
+        '''This function scans every sequence with every pattern and returns a list of motif hits.
+        sequences: a dictionary with the accession ID as the key and the sequence as the value
+        prune: leave out the simple post-translational modification sites (like patmatmotifs -prune)
+        Each hit is a tuple (accession, motif, start, end) with 1-based, inclusive positions.'''
+        accessions = list(sequences)
+        # join every sequence into one string, one sequence per line, and remember where every sequence starts
+        offsets = []
+        position = 0
+        for accession in accessions:
+            offsets.append(position)
+            position += len(sequences[accession]) + 1
+        text = "\n".join(str(sequences[accession]).upper() for accession in accessions)
+        hits = []
+        for entry_id, entry_accession, regex in self.compiled:
+            if prune and entry_id.upper() in PRUNED_MOTIFS:
+                continue
+            for match in regex.finditer(text):
+                # find the sequence the hit is in from its offset in the joined string
+                i = bisect.bisect_right(offsets, match.start()) - 1
+                start = match.start() - offsets[i] + 1
+                hits.append((accessions[i], entry_id, start, start + len(match.group(1)) - 1))
+        # report the hits sequence by sequence (in the order given) and by position
+        order = {accession: i for i, accession in enumerate(accessions)}
+        hits.sort(key=lambda hit: (order[hit[0]], hit[2], hit[1]))
+        return hits
+
+
+def motif_counts(hits, accessions=()):
+    '''This function turns a list of motif hits into a nested dictionary with the accession ID as the key
+    and a dictionary of motif names and counts as the value. accessions without any hit are included with no motifs.'''
+    counts = {accession: {} for accession in accessions}
+    for accession, motif, start, end in hits:
+        motif_name_count = counts.setdefault(accession, {})
+        motif_name_count[motif] = motif_name_count.get(motif, 0) + 1
+    return counts
+
+
+def motif_count_table(hits, accessions=()):
+    '''This function counts the motif hits of every sequence and returns a dataframe with one row per accession ID (the
+    accessions first, in order, then any other sequence with a hit) and one column per motif (in the order they are
+    first found). Hits whose motif is None (a sequence without any hit) only add the row.'''
+    rows = list(dict.fromkeys(accessions))
+    known = set(rows)
+    hit_rows = []
+    hit_motifs = []
+    for accession, motif, start, end in hits:
+        if accession not in known:
+            known.add(accession)
+            rows.append(accession)
+        if motif is not None:
+            hit_rows.append(accession)
+            hit_motifs.append(motif)
+    # count every (sequence, motif) pair straight into a matrix, without building a dictionary per sequence
+    motif_codes, motifs = pd.factorize(pd.Series(hit_motifs, dtype=object))
+    counts = np.zeros((len(rows), len(motifs)), dtype=np.int64)
+    np.add.at(counts, (pd.Index(rows).get_indexer(hit_rows), motif_codes), 1)
+    return pd.DataFrame(counts, index=rows, columns=list(motifs))
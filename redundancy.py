@@ -0,0 +1,156 @@
+#!/usr/bin/python3
+'''Redundancy reduction: collapsing identical and near-identical sequences before the analysis.
+
+NCBI protein results are full of identical and near-identical entries (redundant isolates, RefSeq and GenBank copies
+of the same protein). Exact duplicates are collapsed first, by the hash of their sequence. The distinct sequences are
+then clustered greedily, longest first (as CD-HIT does): a sequence joins the first representative it is at least
+`identity` identical to, or becomes a new representative. Representatives are only compared if they share enough
+k-mers to possibly reach the threshold (every mismatch destroys at most k of the shorter sequence's k-mers), which is
+looked up in an inverted k-mer index, so most pairs are never compared at all. The identity of the pairs that pass is
+the number of residues in the blocks the two sequences have in common over the length of the shorter one (sequences
+that only differ by substitutions are measured position by position first, which is much cheaper).
+
+Only the representatives are analysed downstream; the cluster membership is saved as a CSV file, so the results of a
+representative can be projected back onto every member of its cluster (project_to_members).
+'''
+import difflib
+import hashlib
+import os
+
+import numpy as np
+import pandas as pd
+
+from fasta import get_index
+
+# the identity two sequences need to be clustered together (0 turns the redundancy reduction off)
+DEFAULT_IDENTITY = float(os.environ.get("PROTEOQUEST_REDUNDANCY_IDENTITY", 0))
+# the length of the k-mers of the prefilter
+KMER_SIZE = int(os.environ.get("PROTEOQUEST_REDUNDANCY_KMER", 5))
+
+# the columns of the cluster membership file
+CLUSTER_COLUMNS = ['Member', 'Representative', 'Identity', 'Cluster Size']
+
+
+def sequence_hash(sequence):
+    '''This function returns the hash identifying a sequence (case and line breaks do not matter).'''
+    return hashlib.sha1(str(sequence).upper().encode("ascii", "replace")).hexdigest()
+
+
+def kmers(sequence, k=KMER_SIZE):
+    '''This function returns the set of the k-mers of a sequence.'''
+    return {sequence[i:i + k] for i in range(len(sequence) - k + 1)}
+
+
+def ungapped_identity(a, b):
+    '''This function returns the fraction of the shorter of two sequences that matches the longer one position by
+    position, with the shorter one laid against the start or against the end of the longer one (whichever is best).'''
+    if len(a) > len(b):
+        a, b = b, a
+    if not a:
+        return 0.0
+    short = np.frombuffer(a.encode("ascii", "replace"), dtype=np.uint8)
+    long = np.frombuffer(b.encode("ascii", "replace"), dtype=np.uint8)
+    matches = max(int((short == long[:len(short)]).sum()), int((short == long[len(long) - len(short):]).sum()))
+    return matches / len(short)
+
+
+def identity(a, b, threshold=0.0):
+    '''This function returns the fraction of the shorter of two sequences found in the blocks they have in common.
+    Sequences that differ only by substitutions are measured position by position; the blocks are only searched for
+    (with difflib) when that is not enough to reach threshold.'''
+    shorter = min(len(a), len(b))
+    if shorter == 0:
+        return 0.0
+    score = ungapped_identity(a, b)
+    if score >= threshold and threshold > 0:
+        return score
+    matcher = difflib.SequenceMatcher(None, a, b, autojunk=False)
+    return max(score, sum(block.size for block in matcher.get_matching_blocks()) / shorter)
+
+
+def cluster_sequences(sequences, threshold=0.95, k=KMER_SIZE):
+    '''This function clusters sequences (a dictionary with the accession ID as the key and the sequence as the value).
+    It returns a dictionary with every accession ID as the key and (its representative, its identity to it) as the
+    value; a representative is its own representative with identity 1.0.'''
+    membership = {}
+    # exact duplicates: every copy joins the first accession with the same sequence
+    distinct = {}
+    for accession, sequence in sequences.items():
+        sequence = str(sequence).upper()
+        representative = distinct.setdefault(sequence_hash(sequence), (accession, sequence))[0]
+        membership[accession] = (representative, 1.0)
+    if threshold >= 1.0:
+        return membership
+    # greedy clustering of the distinct sequences, longest first
+    order = sorted(distinct.values(), key=lambda item: -len(item[1]))
+    representatives = []
+    # k-mer: the numbers of the representatives that have it
+    index = {}
+    for accession, sequence in order:
+        query_kmers = kmers(sequence, k)
+        shared = {}
+        for kmer in query_kmers:
+            for number in index.get(kmer, ()):
+                shared[number] = shared.get(number, 0) + 1
+        # the representatives are at least as long as the query, so the query is the shorter sequence
+        needed = len(query_kmers) - (1.0 - threshold) * len(sequence) * k
+        found = None
+        for number, count in sorted(shared.items(), key=lambda item: -item[1]):
+            if count < needed:
+                break
+            score = identity(sequence, representatives[number][1], threshold)
+            if score >= threshold:
+                found = (representatives[number][0], score)
+                break
+        if found is None:
+            number = len(representatives)
+            representatives.append((accession, sequence))
+            for kmer in query_kmers:
+                index.setdefault(kmer, []).append(number)
+            found = (accession, 1.0)
+        membership[accession] = found
+    # the exact duplicates follow their sequence into its cluster
+    for accession, (representative, score) in list(membership.items()):
+        if representative != accession:
+            cluster_representative, cluster_score = membership[representative]
+            membership[accession] = (cluster_representative, cluster_score if score == 1.0 else score)
+    return membership
+
+
+def membership_table(membership):
+    '''This function returns the cluster membership as a dataframe (the CLUSTER_COLUMNS), representatives first.'''
+    table = pd.DataFrame([(member, representative, round(score, 4))
+                          for member, (representative, score) in membership.items()],
+                         columns=['Member', 'Representative', 'Identity'])
+    table['Cluster Size'] = table.groupby('Representative')['Member'].transform('size')
+    table['Is Representative'] = table['Member'] == table['Representative']
+    table = table.sort_values(['Representative', 'Is Representative'], ascending=[True, False], kind="stable")
+    return table[CLUSTER_COLUMNS].reset_index(drop=True)
+
+
+def reduce_redundancy(in_path, out_path, clusters_path, threshold=0.95, k=KMER_SIZE):
+    '''This function clusters the sequences of the FASTA file in_path, writes the representatives (unchanged, in file
+    order) to out_path and the cluster membership to clusters_path (CSV).
+    It returns the number of sequences and the number of representatives.'''
+    index = get_index(in_path)
+    sequences = {accession: sequence for accession, header, sequence in index.records()}
+    membership = cluster_sequences(sequences, threshold, k)
+    with open(index.path, "rb") as source, open(out_path, "wb") as out:
+        for i, accession in enumerate(index.accessions):
+            if membership[accession][0] == accession:
+                source.seek(index.starts[i])
+                out.write(source.read(index.ends[i] - index.starts[i]))
+    membership_table(membership).to_csv(clusters_path, index=False)
+    return len(membership), sum(1 for accession, (representative, score) in membership.items()
+                                if representative == accession)
+
+
+def project_to_members(df, clusters_path):
+    '''This function projects a table of per-representative results (with the accession ID as the index) back onto
+    every member of the clusters in clusters_path, returning one row per member (indexed by the member) with the
+    results of its representative.'''
+    clusters = pd.read_csv(clusters_path)
+    projected = df.reindex(clusters['Representative'])
+    projected.index = clusters['Member'].values
+    projected.insert(0, 'Representative', clusters['Representative'].values)
+    return projected
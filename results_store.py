@@ -0,0 +1,229 @@
+#!/usr/bin/python3
+'''A results warehouse: the sequences, motif hits and protein statistics of every run in one indexed SQLite file.
+
+Every run leaves its results in CSV files inside its own nested folders, and the individual sequence files are deleted
+at the end. With a results warehouse, every run is also bulk-inserted, in one transaction, into a single SQLite file:
+the run itself (its name, folder, search term, length window and time), the sequences it analysed (accession, header,
+organism and taxid, length; the sequence text is stored once per distinct sequence, by its hash), every motif hit with
+its position, and every protein statistic. The tables are indexed on the run, the accession, the taxid and organism,
+the motif and the isoelectric point, so questions across all runs, such as "which sequences carry motif X with a pI
+below 5", are single indexed queries (see find_motif) instead of globbing and re-parsing CSV files.
+
+Several processes (e.g. the analyses of a manifest) can add their runs to the same file at the same time.
+'''
+import argparse
+import os
+import sqlite3
+import sys
+import threading
+import time
+
+import pandas as pd
+
+from fasta import read_fasta
+from local_protein_db import parse_header
+from protein_stats import STATS_COLUMNS
+from redundancy import sequence_hash
+from taxonomy_index import get_taxonomy_index
+
+# the results warehouse every run is added to (none by default)
+RESULTS_DB = os.environ.get("PROTEOQUEST_RESULTS_DB", "")
+
+# the columns of the stats table, in the order of protein_stats.STATS_COLUMNS
+STATS_FIELDS = ['molecular_weight', 'residues', 'average_residue_weight', 'charge', 'isoelectric_point',
+                'a280_molar_reduced', 'a280_molar_cysteine_bridges', 'a280_1mg_reduced', 'a280_1mg_cysteine_bridges']
+
+SCHEMA = [
+    "CREATE TABLE IF NOT EXISTS runs (run_id INTEGER PRIMARY KEY, started REAL, name TEXT, work_dir TEXT, "
+    "search_term TEXT, min_length INTEGER, max_length INTEGER, sequences INTEGER, source TEXT)",
+    "CREATE TABLE IF NOT EXISTS sequences (run_id INTEGER, accession TEXT, header TEXT, organism TEXT, taxid INTEGER, "
+    "length INTEGER, sequence_hash TEXT, PRIMARY KEY (run_id, accession))",
+    "CREATE TABLE IF NOT EXISTS sequence_texts (sequence_hash TEXT PRIMARY KEY, sequence TEXT)",
+    "CREATE TABLE IF NOT EXISTS motif_hits (run_id INTEGER, accession TEXT, motif TEXT, start INTEGER, end INTEGER)",
+    "CREATE TABLE IF NOT EXISTS stats (run_id INTEGER, accession TEXT, "
+    + ", ".join(field + " REAL" for field in STATS_FIELDS) + ", PRIMARY KEY (run_id, accession))",
+    "CREATE INDEX IF NOT EXISTS runs_name ON runs (name)",
+    "CREATE INDEX IF NOT EXISTS sequences_accession ON sequences (accession)",
+    "CREATE INDEX IF NOT EXISTS sequences_taxid ON sequences (taxid)",
+    "CREATE INDEX IF NOT EXISTS sequences_organism ON sequences (organism)",
+    "CREATE INDEX IF NOT EXISTS motif_hits_motif ON motif_hits (motif, run_id)",
+    "CREATE INDEX IF NOT EXISTS motif_hits_run ON motif_hits (run_id, accession)",
+    "CREATE INDEX IF NOT EXISTS motif_hits_accession ON motif_hits (accession)",
+    "CREATE INDEX IF NOT EXISTS stats_isoelectric_point ON stats (isoelectric_point)",
+    "CREATE INDEX IF NOT EXISTS stats_accession ON stats (accession)",
+]
+
+
+def number_or_none(value):
+    '''This function returns value as a float, or None if it is missing (NaN).'''
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return None
+    return None if value != value else value
+
+
+class ResultsStore:
+    '''The results warehouse.
+    path: the SQLite file
+    '''
+
+    def __init__(self, path=RESULTS_DB):
+        self.path = os.path.abspath(path)
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        # other processes may be adding their runs at the same time, so wait for them rather than fail
+        self.connection = sqlite3.connect(self.path, timeout=120, check_same_thread=False)
+        self.lock = threading.Lock()
+        with self.lock:
+            # write-ahead logging lets the readers carry on while a run is being added
+            self.connection.execute("PRAGMA journal_mode = WAL")
+            for statement in SCHEMA:
+                self.connection.execute(statement)
+            self.connection.commit()
+
+    def add_run(self, name, work_dir, fasta_path, motif_hits=(), stats_df=None, search_term=None, min_length=None,
+                max_length=None, source=None):
+        '''This function adds a run to the warehouse in one transaction and returns its run_id.
+        fasta_path: the FASTA file of the sequences the run analysed
+        motif_hits: (accession, motif, start, end) for every motif hit
+        stats_df: the protein statistics (the STATS_COLUMNS, with the accession ID as the index)
+        source: where the sequences came from (e.g. NCBI or the path of a local database)'''
+        taxonomy = get_taxonomy_index(report=lambda message: None)
+        # the taxid of every organism name met so far
+        taxids = {}
+        sequences = []
+        texts = {}
+        for accession, header, sequence in read_fasta(fasta_path):
+            organism, taxid = parse_header(header)[2:4]
+            if taxid is None and organism is not None and taxonomy is not None:
+                if organism not in taxids:
+                    taxa = taxonomy.resolve(organism)
+                    taxids[organism] = taxa[0]["taxid"] if taxa else None
+                taxid = taxids[organism]
+            digest = sequence_hash(sequence)
+            texts[digest] = sequence
+            sequences.append([accession, header, organism, taxid, len(sequence), digest])
+        stats_rows = []
+        if stats_df is not None:
+            for accession, row in stats_df.reindex(columns=STATS_COLUMNS).iterrows():
+                stats_rows.append([str(accession)] + [number_or_none(row[column]) for column in STATS_COLUMNS])
+        hits = [(str(accession), motif, int(start), int(end)) for accession, motif, start, end in motif_hits
+                if motif is not None]
+        with self.lock, self.connection:
+            # the whole run goes in at once, or not at all
+            cursor = self.connection.execute(
+                "INSERT INTO runs (started, name, work_dir, search_term, min_length, max_length, sequences, source) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (time.time(), name, os.path.abspath(work_dir), search_term, min_length, max_length, len(sequences),
+                 source))
+            run_id = cursor.lastrowid
+            self.connection.executemany("INSERT OR IGNORE INTO sequence_texts VALUES (?, ?)", texts.items())
+            self.connection.executemany("INSERT OR REPLACE INTO sequences VALUES (?, ?, ?, ?, ?, ?, ?)",
+                                        ([run_id] + row for row in sequences))
+            self.connection.executemany("INSERT INTO motif_hits VALUES (?, ?, ?, ?, ?)",
+                                        ((run_id,) + hit for hit in hits))
+            placeholders = ", ".join(["?"] * (len(STATS_FIELDS) + 2))
+            self.connection.executemany(f"INSERT OR REPLACE INTO stats VALUES ({placeholders})",
+                                        ([run_id] + row for row in stats_rows))
+        return run_id
+
+    def query(self, sql, params=()):
+        '''This function runs any SQL query on the warehouse and returns the result as a dataframe.'''
+        with self.lock:
+            return pd.read_sql_query(sql, self.connection, params=list(params))
+
+    def runs(self):
+        '''This function returns every run as a dataframe, latest first.'''
+        return self.query("SELECT * FROM runs ORDER BY run_id DESC")
+
+    def find_motif(self, motif, min_pi=None, max_pi=None, taxon=None, latest=False):
+        '''This function returns the sequences carrying a motif across all runs, with the position of every hit and
+        the statistics of the sequence, as a dataframe.
+        min_pi, max_pi: only the sequences with an isoelectric point in this range
+        taxon: only the sequences of this taxon (and, with the local taxonomy index, of every taxon below it)
+        latest: only the latest run of every name and folder'''
+        sql = ("SELECT runs.run_id, runs.name, sequences.accession, sequences.organism, sequences.taxid, "
+               "motif_hits.motif, motif_hits.start, motif_hits.end, stats.isoelectric_point, stats.molecular_weight, "
+               "stats.charge FROM motif_hits "
+               "JOIN runs ON runs.run_id = motif_hits.run_id "
+               "JOIN sequences ON sequences.run_id = motif_hits.run_id AND sequences.accession = motif_hits.accession "
+               "LEFT JOIN stats ON stats.run_id = motif_hits.run_id AND stats.accession = motif_hits.accession "
+               "WHERE motif_hits.motif = ?")
+        params = [motif]
+        if min_pi is not None:
+            sql += " AND stats.isoelectric_point >= ?"
+            params.append(min_pi)
+        if max_pi is not None:
+            sql += " AND stats.isoelectric_point < ?"
+            params.append(max_pi)
+        if taxon:
+            taxonomy = get_taxonomy_index(report=lambda message: None)
+            taxa = taxonomy.resolve(taxon) if taxonomy is not None else []
+            taxids = sorted({taxid for found in taxa for taxid in taxonomy.descendants(found["taxid"])})
+            conditions = ["sequences.organism = ? COLLATE NOCASE"]
+            params.append(taxon)
+            if taxids:
+                conditions.append("sequences.taxid IN (" + ", ".join(str(int(taxid)) for taxid in taxids) + ")")
+            sql += " AND (" + " OR ".join(conditions) + ")"
+        if latest:
+            sql += " AND runs.run_id IN (SELECT MAX(run_id) FROM runs GROUP BY name, work_dir)"
+        sql += " ORDER BY runs.run_id, sequences.accession, motif_hits.start"
+        return self.query(sql, params)
+
+    def sequence(self, accession, run_id=None):
+        '''This function returns the sequence analysed under an accession ID (by the latest run that had it, or by
+        run_id), or None.'''
+        sql = ("SELECT sequence_texts.sequence FROM sequences JOIN sequence_texts "
+               "ON sequence_texts.sequence_hash = sequences.sequence_hash WHERE sequences.accession = ?")
+        params = [accession]
+        if run_id is not None:
+            sql += " AND sequences.run_id = ?"
+            params.append(run_id)
+        with self.lock:
+            row = self.connection.execute(sql + " ORDER BY sequences.run_id DESC LIMIT 1", params).fetchone()
+        return row[0] if row else None
+
+    def close(self):
+        self.connection.close()
+
+
+def parse_arguments(argv=None):
+    '''This function reads the command line options.'''
+    parser = argparse.ArgumentParser(description="Query the ProteoQuest results warehouse.")
+    parser.add_argument("--db", default=RESULTS_DB or None, required=not RESULTS_DB,
+                        help="the results warehouse (default: $PROTEOQUEST_RESULTS_DB)")
+    parser.add_argument("--runs", action="store_true", help="list every run")
+    parser.add_argument("--motif", help="list the sequences carrying this motif across all runs")
+    parser.add_argument("--min-pi", type=float, help="with --motif: only isoelectric points from this value")
+    parser.add_argument("--max-pi", type=float, help="with --motif: only isoelectric points below this value")
+    parser.add_argument("--taxon", help="with --motif: only the sequences of this taxon (and the taxa below it)")
+    parser.add_argument("--latest", action="store_true", help="with --motif: only the latest run of every search")
+    parser.add_argument("--sql", help="run this SQL query and print the result")
+    parser.add_argument("--output", help="save the result to this csv file instead of printing it")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    '''This function answers one question about the warehouse from the command line.'''
+    options = parse_arguments(argv)
+    if not os.path.exists(options.db):
+        print("There is no results warehouse at", options.db)
+        return 1
+    store = ResultsStore(options.db)
+    if options.sql:
+        result = store.query(options.sql)
+    elif options.motif:
+        result = store.find_motif(options.motif, options.min_pi, options.max_pi, options.taxon, options.latest)
+    else:
+        result = store.runs()
+    if options.output:
+        result.to_csv(options.output, index=False)
+        print(len(result), "rows are saved in", options.output)
+    else:
+        print(result.to_string(index=False))
+    store.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,221 @@
+#!/usr/bin/python3
+'''A fast, alignment-free first look at how similar the sequences of a set are to each other.
+
+Every sequence is turned into a profile of its k-mer counts (a sparse vector with one entry per k-mer it contains),
+normalised to unit length, so the dot product of two profiles is the cosine similarity of their k-mer contents: 1 for
+sequences made of the same k-mers, 0 for sequences without any k-mer in common. All-vs-all similarities are then
+matrix products of the profile matrix with its transpose, computed a block of rows at a time, so the memory stays
+bounded however many sequences there are: the nearest neighbours of every sequence are picked from each block as it is
+made, and the full matrix is only assembled when asked for (in memory, or in a memory-mapped .npy file for large sets).
+
+The profiles are SciPy sparse matrices if SciPy is installed, and dense NumPy arrays otherwise (fine for a few thousand
+sequences). A clustered heatmap of the matrix (of an evenly spaced sample of the sequences for large sets) shows the
+structure of the family at a glance; the order of its rows comes from average-linkage clustering with SciPy, or from
+a greedy nearest-neighbour chain without it.
+'''
+import os
+
+import matplotlib.pyplot as plt
+import numpy as np
+import pandas as pd
+
+# the length of the k-mers of the profiles
+SIMILARITY_KMER = int(os.environ.get("PROTEOQUEST_SIMILARITY_KMER", 3))
+# the number of rows of the similarity matrix computed at a time
+CHUNK_ROWS = int(os.environ.get("PROTEOQUEST_SIMILARITY_CHUNK_ROWS", 1000))
+# the number of nearest neighbours listed for every sequence (0 turns the similarity overview off)
+NEIGHBOURS = int(os.environ.get("PROTEOQUEST_SIMILARITY_NEIGHBOURS", 5))
+# the largest number of sequences drawn in the heatmap
+HEATMAP_LIMIT = int(os.environ.get("PROTEOQUEST_HEATMAP_LIMIT", 1000))
+
+# the residues the k-mers are made of; a k-mer with any other character (X, B, Z, *...) is left out
+RESIDUES = "ACDEFGHIKLMNPQRSTVWY"
+# the code of every byte: its position in RESIDUES, or len(RESIDUES) for any other character
+RESIDUE_CODES = np.full(256, len(RESIDUES), dtype=np.int64)
+for _code, _residue in enumerate(RESIDUES):
+    RESIDUE_CODES[ord(_residue)] = _code
+    RESIDUE_CODES[ord(_residue.lower())] = _code
+
+# the columns of the nearest-neighbour table
+NEIGHBOUR_COLUMNS = ['Accession', 'Rank', 'Neighbour', 'Similarity']
+
+
+def sparse_module():
+    '''This function returns scipy.sparse, or None if SciPy is not installed.'''
+    try:
+        import scipy.sparse
+    except ImportError:
+        return None
+    return scipy.sparse
+
+
+def kmer_codes(sequence, k=SIMILARITY_KMER):
+    '''This function returns the k-mers of a sequence as integers (the k-mer read as a number in base len(RESIDUES)),
+    leaving out the k-mers with a character that is not one of the RESIDUES.'''
+    codes = RESIDUE_CODES[np.frombuffer(str(sequence).encode("ascii", "replace"), dtype=np.uint8)]
+    if len(codes) < k:
+        return np.empty(0, dtype=np.int64)
+    windows = np.lib.stride_tricks.sliding_window_view(codes, k)
+    windows = windows[(windows < len(RESIDUES)).all(axis=1)]
+    return windows @ (len(RESIDUES) ** np.arange(k - 1, -1, -1, dtype=np.int64))
+
+
+class KmerProfiles:
+    '''The unit-length k-mer count profiles of a set of sequences, one row per sequence.
+    accessions: the accession IDs of the rows
+    matrix: the profiles (a SciPy sparse CSR matrix, or a dense NumPy array without SciPy)
+    kmers: the k-mer codes of the columns
+    k: the length of the k-mers
+    '''
+
+    def __init__(self, accessions, matrix, kmers, k):
+        self.accessions = list(accessions)
+        self.matrix = matrix
+        self.kmers = kmers
+        self.k = k
+
+    def __len__(self):
+        return len(self.accessions)
+
+    def block(self, rows):
+        '''This function returns the similarities of the sequences in rows (a slice or an array of row numbers) to
+        every sequence as a dense array (one row per sequence in rows).'''
+        product = self.matrix[rows] @ self.matrix.T
+        if hasattr(product, "toarray"):
+            product = product.toarray()
+        return np.asarray(product, dtype=np.float32)
+
+    def blocks(self, chunk_rows=CHUNK_ROWS):
+        '''This function yields (first row, similarities) for every block of chunk_rows rows of the similarity
+        matrix, in order.'''
+        for start in range(0, len(self), max(1, chunk_rows)):
+            yield start, self.block(slice(start, min(start + chunk_rows, len(self))))
+
+
+def build_profiles(sequences, k=SIMILARITY_KMER):
+    '''This function builds the k-mer profiles of sequences (a dictionary with the accession ID as the key and the
+    sequence as the value) and returns them as KmerProfiles.'''
+    accessions = list(sequences)
+    codes = [kmer_codes(sequences[accession], k) for accession in accessions]
+    rows = np.repeat(np.arange(len(codes), dtype=np.int64), [len(row) for row in codes])
+    codes = np.concatenate(codes) if codes else np.empty(0, dtype=np.int64)
+    # number the columns by the k-mers that occur at all
+    present = np.bincount(codes, minlength=len(RESIDUES) ** k) > 0
+    kmers = np.flatnonzero(present)
+    columns = (np.cumsum(present) - 1)[codes]
+    # count every (sequence, k-mer) pair: the runs of equal keys once sorted
+    keys = np.sort(rows * max(1, len(kmers)) + columns)
+    starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]]) if len(keys) else np.empty(0, dtype=np.int64)
+    counts = np.diff(np.r_[starts, len(keys)])
+    rows, columns = keys[starts] // max(1, len(kmers)), keys[starts] % max(1, len(kmers))
+    # normalise every profile to unit length
+    norms = np.sqrt(np.bincount(rows, weights=counts.astype(np.float64) ** 2, minlength=len(accessions)))
+    values = (counts / norms[rows]).astype(np.float32)
+    shape = (len(accessions), len(kmers))
+    sparse = sparse_module()
+    if sparse is not None:
+        matrix = sparse.csr_matrix((values, (rows, columns)), shape=shape)
+    else:
+        # the keys are the positions of the pairs in the flattened matrix
+        matrix = np.zeros(shape, dtype=np.float32)
+        matrix.reshape(-1)[keys[starts]] = values
+    return KmerProfiles(accessions, matrix, kmers, k)
+
+
+def similarity_matrix(profiles, chunk_rows=CHUNK_ROWS, path=None):
+    '''This function returns the all-vs-all similarity matrix of the profiles (float32), computed chunk_rows rows at
+    a time. If path is given, the matrix is written to that .npy file (memory-mapped, so it never has to fit in
+    memory) and returned as a memory map.'''
+    shape = (len(profiles), len(profiles))
+    if path is None:
+        matrix = np.empty(shape, dtype=np.float32)
+    else:
+        matrix = np.lib.format.open_memmap(path, mode="w+", dtype=np.float32, shape=shape)
+    for start, block in profiles.blocks(chunk_rows):
+        matrix[start:start + len(block)] = block
+    if path is not None:
+        matrix.flush()
+    return matrix
+
+
+def nearest_neighbours(profiles, n=NEIGHBOURS, chunk_rows=CHUNK_ROWS):
+    '''This function returns the n most similar other sequences of every sequence as a dataframe (the
+    NEIGHBOUR_COLUMNS, one row per sequence and rank), without ever holding the whole similarity matrix.'''
+    n = min(n, len(profiles) - 1)
+    table = {column: [] for column in NEIGHBOUR_COLUMNS}
+    if n <= 0:
+        return pd.DataFrame(table, columns=NEIGHBOUR_COLUMNS)
+    accessions = np.array(profiles.accessions, dtype=object)
+    for start, block in profiles.blocks(chunk_rows):
+        rows = np.arange(len(block))
+        # a sequence is not its own neighbour
+        block[rows, start + rows] = -np.inf
+        # the n best of every row, then sorted best first
+        best = np.argpartition(-block, n - 1, axis=1)[:, :n]
+        best = np.take_along_axis(best, np.argsort(-np.take_along_axis(block, best, axis=1), axis=1, kind="stable"),
+                                  axis=1)
+        table['Accession'].extend(np.repeat(accessions[start:start + len(block)], n))
+        table['Rank'].extend(np.tile(np.arange(1, n + 1), len(block)))
+        table['Neighbour'].extend(accessions[best].reshape(-1))
+        table['Similarity'].extend(np.round(np.take_along_axis(block, best, axis=1).reshape(-1), 4))
+    return pd.DataFrame(table, columns=NEIGHBOUR_COLUMNS)
+
+
+def cluster_order(matrix):
+    '''This function returns an order of the rows of a similarity matrix that puts similar sequences next to each
+    other: the leaves of an average-linkage tree (SciPy), or a greedy chain from every sequence to its most similar
+    sequence not yet placed.'''
+    count = len(matrix)
+    if count < 3:
+        return np.arange(count)
+    try:
+        from scipy.cluster.hierarchy import leaves_list, linkage
+        from scipy.spatial.distance import squareform
+    except ImportError:
+        order = [0]
+        placed = np.zeros(count, dtype=bool)
+        placed[0] = True
+        for _ in range(count - 1):
+            row = np.where(placed, -np.inf, matrix[order[-1]])
+            order.append(int(np.argmax(row)))
+            placed[order[-1]] = True
+        return np.array(order)
+    distances = 1.0 - np.asarray(matrix, dtype=np.float64)
+    distances = np.clip((distances + distances.T) / 2, 0.0, None)
+    np.fill_diagonal(distances, 0.0)
+    return leaves_list(linkage(squareform(distances, checks=False), method="average"))
+
+
+def heatmap_sample(profiles, limit=HEATMAP_LIMIT):
+    '''This function returns the row numbers of the sequences drawn in the heatmap: every sequence, or limit evenly
+    spaced ones for larger sets.'''
+    if len(profiles) <= limit:
+        return np.arange(len(profiles))
+    return np.unique(np.linspace(0, len(profiles) - 1, limit).round().astype(int))
+
+
+def heatmap_matrix(profiles, limit=HEATMAP_LIMIT):
+    '''This function returns the accession IDs and the similarity matrix of the sequences drawn in the heatmap,
+    in cluster order.'''
+    rows = heatmap_sample(profiles, limit)
+    matrix = profiles.block(rows)[:, rows]
+    order = cluster_order(matrix)
+    return [profiles.accessions[rows[i]] for i in order], matrix[np.ix_(order, order)]
+
+
+def plot_heatmap(accessions, matrix, title, plot_path):
+    '''This function draws the clustered similarity matrix as a heatmap and saves it to plot_path. The figure is left
+    open for the caller to show or close.'''
+    plt.figure(figsize=(8, 7))
+    plt.imshow(matrix, cmap="viridis", vmin=0, vmax=1, interpolation="nearest")
+    plt.colorbar(label='k-mer Similarity')
+    # the accession IDs are only readable for small sets
+    if len(accessions) <= 50:
+        plt.xticks(range(len(accessions)), accessions, rotation=90, fontsize='x-small')
+        plt.yticks(range(len(accessions)), accessions, fontsize='x-small')
+    else:
+        plt.xlabel('Sequence (clustered)')
+        plt.ylabel('Sequence (clustered)')
+    plt.title(title)
+    plt.tight_layout()
+    plt.savefig(plot_path)
@@ -0,0 +1,113 @@
+#!/usr/bin/python3
+'''The SQLite storage shared by the on-disk caches of ProteoQuest (the EDirect cache and the artifact cache).
+
+Every entry is a row of one table, keyed by a hash, with its size and the times it was created and last used. Entries
+expire after a time-to-live, and once the stored entries grow past the size limit the least recently used ones are
+evicted. The caches only add the columns of their own entries and decide what the keys are and what is worth keeping.
+'''
+import os
+import sqlite3
+import threading
+import time
+
+# the number of keys looked up per query (SQLite allows 999 parameters per statement in older versions)
+LOOKUP_CHUNK = 500
+
+
+class TTLCache:
+    '''A persistent, TTL and size bounded LRU table of entries.
+    path: the SQLite file
+    table: the name of the table holding the entries
+    columns: the columns of an entry besides key, size, created and last_access, as (name, SQL type) pairs
+    ttl: the number of seconds an entry is kept for (0 or None disables expiry)
+    max_bytes: the total size of the stored entries before least recently used entries are evicted
+    '''
+
+    def __init__(self, path, table, columns, ttl, max_bytes):
+        # keep an absolute path, so the cache is found whatever the working directory is
+        self.path = os.path.abspath(path)
+        self.table = table
+        self.fields = [name for name, kind in columns]
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        # the connection is shared by every thread of the programme (e.g. concurrent fetches), one statement at a time
+        self.connection = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        self.lock = threading.RLock()
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS " + table + " (key TEXT PRIMARY KEY, "
+            + "".join(name + " " + kind + ", " for name, kind in columns)
+            + "size INTEGER, created REAL, last_access REAL)")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS " + table + "_last_access ON " + table + " (last_access)")
+        self.connection.commit()
+
+    def lookup(self, key, fields):
+        '''This function returns the values of fields (a list of column names) of the entry stored under key, or None
+        if there is no fresh entry. An expired entry is removed; a fresh one becomes the most recently used.'''
+        return self.lookup_many([key], fields).get(key)
+
+    def lookup_many(self, keys, fields):
+        '''This function looks up many entries at once and returns a dictionary of the values of fields of every fresh
+        entry, by key (keys without a fresh entry are left out). The entries are read LOOKUP_CHUNK keys per query, and
+        the expired ones are removed and the fresh ones touched in a single transaction.'''
+        keys = list(dict.fromkeys(keys))
+        found = {}
+        expired = []
+        now = time.time()
+        with self.lock:
+            for start in range(0, len(keys), LOOKUP_CHUNK):
+                chunk = keys[start:start + LOOKUP_CHUNK]
+                for row in self.connection.execute(
+                        "SELECT key, created, " + ", ".join(fields) + " FROM " + self.table + " WHERE key IN ("
+                        + ", ".join(["?"] * len(chunk)) + ")", chunk):
+                    if self.ttl and now - row[1] > self.ttl:
+                        expired.append((row[0],))
+                    else:
+                        found[row[0]] = row[2:]
+            if not expired and not found:
+                return found
+            self.connection.executemany("DELETE FROM " + self.table + " WHERE key = ?", expired)
+            # touch the entries so that they become the most recently used ones
+            self.connection.executemany("UPDATE " + self.table + " SET last_access = ? WHERE key = ?",
+                                        [(now, key) for key in found])
+            self.connection.commit()
+        return found
+
+    def store(self, rows):
+        '''This function stores entries in one transaction and then trims the cache.
+        rows: (key, size, values of the columns in order) for every entry'''
+        now = time.time()
+        names = ["key"] + self.fields + ["size", "created", "last_access"]
+        with self.lock:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO " + self.table + " (" + ", ".join(names) + ") VALUES ("
+                + ", ".join(["?"] * len(names)) + ")",
+                [(key,) + tuple(values) + (size, now, now) for key, size, values in rows])
+            self.connection.commit()
+            self.evict()
+
+    def evict(self):
+        '''This function removes expired entries and then the least recently used entries until the cache fits in
+        max_bytes.'''
+        with self.lock:
+            if self.ttl:
+                self.connection.execute("DELETE FROM " + self.table + " WHERE created < ?", (time.time() - self.ttl,))
+            total = self.connection.execute("SELECT COALESCE(SUM(size), 0) FROM " + self.table).fetchone()[0]
+            if self.max_bytes and total > self.max_bytes:
+                # walk from the least recently used entry and drop entries until we are back under the limit
+                for key, size in self.connection.execute("SELECT key, size FROM " + self.table
+                                                         + " ORDER BY last_access").fetchall():
+                    if total <= self.max_bytes:
+                        break
+                    self.connection.execute("DELETE FROM " + self.table + " WHERE key = ?", (key,))
+                    total -= size
+            self.connection.commit()
+
+    def clear(self):
+        '''This function removes every entry from the cache.'''
+        with self.lock:
+            self.connection.execute("DELETE FROM " + self.table)
+            self.connection.commit()
+
+    def close(self):
+        self.connection.close()
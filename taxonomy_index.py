@@ -0,0 +1,353 @@
+#!/usr/bin/python3
+'''An offline taxonomy index built from the NCBI taxdump, so taxon names are validated and resolved without NCBI.
+
+The importer reads names.dmp (every name of every taxon: scientific names, synonyms, common names...) and nodes.dmp
+(the parent and rank of every taxon) from a taxdump directory or straight from taxdump.tar.gz, and loads them into a
+small SQLite file in the cache directory. The names are indexed as given and in lower case, so exact, case-insensitive
+and prefix look-ups are single index searches (well under a millisecond); fuzzy look-ups compare the names of about the
+same length and the same first letter with difflib. The lineage of a taxon is followed through the parent links.
+The index is built once and rebuilt whenever the taxdump is newer than it.
+
+Get the full taxdump from https://ftp.ncbi.nlm.nih.gov/pub/taxonomy/taxdump.tar.gz and build the index with
+    python3 taxonomy_index.py --build taxdump.tar.gz
+A miniature taxdump (a few dozen taxa, with most intermediate clades left out) is bundled in taxdump_sample for trying
+the index out.
+'''
+import argparse
+import contextlib
+import difflib
+import io
+import os
+import sqlite3
+import sys
+import tarfile
+import threading
+
+from edirect_cache import DEFAULT_CACHE_DIR
+
+# the SQLite file of the index and the taxdump it is built from (a directory or taxdump.tar.gz)
+TAXONOMY_DB = os.environ.get("PROTEOQUEST_TAXONOMY_DB", os.path.join(DEFAULT_CACHE_DIR, "taxonomy.sqlite"))
+TAXDUMP = os.environ.get("PROTEOQUEST_TAXDUMP", os.path.join(DEFAULT_CACHE_DIR, "taxdump"))
+# the miniature taxdump shipped with ProteoQuest
+SAMPLE_TAXDUMP = os.path.join(os.path.dirname(os.path.abspath(__file__)), "taxdump_sample")
+
+# the name classes worth suggesting to the user (names.dmp also holds authorities, type material...)
+NAME_CLASSES = ("scientific name", "synonym", "genbank common name", "common name", "equivalent name",
+                "genbank synonym", "acronym", "genbank acronym", "blast name")
+# the number of rows inserted at a time while the index is built
+INSERT_BATCH = 50000
+
+
+def dmp_rows(lines):
+    '''This function yields the fields of every row of a .dmp file (fields are separated by "\\t|\\t" and every row
+    ends with "\\t|").'''
+    for line in lines:
+        line = line.rstrip("\n")
+        if line.endswith("\t|"):
+            line = line[:-2]
+        if line:
+            yield line.split("\t|\t")
+
+
+@contextlib.contextmanager
+def open_dmp(source, name):
+    '''This function opens the .dmp file called name in source, a taxdump directory or a taxdump.tar.gz archive,
+    for reading as text (use it in a with statement).'''
+    if os.path.isdir(source):
+        with open(os.path.join(source, name), "r", encoding="utf-8", errors="replace") as f:
+            yield f
+        return
+    with tarfile.open(source, "r:*") as archive:
+        member = archive.extractfile(name)
+        if member is None:
+            raise FileNotFoundError(name + " is not in " + source)
+        with io.TextIOWrapper(member, encoding="utf-8", errors="replace") as f:
+            yield f
+
+
+def source_exists(source):
+    '''This function returns True if source is a taxdump directory holding names.dmp and nodes.dmp, or an archive.'''
+    if os.path.isdir(source):
+        return all(os.path.exists(os.path.join(source, name)) for name in ("names.dmp", "nodes.dmp"))
+    return os.path.isfile(source)
+
+
+def source_mtime(source):
+    '''This function returns the time the taxdump was last modified.'''
+    if os.path.isdir(source):
+        return max(os.path.getmtime(os.path.join(source, name)) for name in ("names.dmp", "nodes.dmp"))
+    return os.path.getmtime(source)
+
+
+def batches(rows, size=INSERT_BATCH):
+    '''This function yields the rows in lists of up to size rows.'''
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def build_taxonomy_index(source=TAXDUMP, db_path=TAXONOMY_DB, report=print):
+    '''This function builds the taxonomy index at db_path from the taxdump in source (a directory or an archive)
+    and returns the number of taxa and of names loaded. The index is written to a temporary file first, so a build
+    that fails never leaves a broken index behind.'''
+    os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+    temp_path = db_path + ".building"
+    if os.path.exists(temp_path):
+        os.remove(temp_path)
+    connection = sqlite3.connect(temp_path)
+    # nothing needs to survive a crash of the build, so skip the journal
+    connection.execute("PRAGMA journal_mode = OFF")
+    connection.execute("PRAGMA synchronous = OFF")
+    connection.execute("CREATE TABLE nodes (taxid INTEGER PRIMARY KEY, parent INTEGER, rank TEXT)")
+    connection.execute("CREATE TABLE names (taxid INTEGER, name TEXT, name_lower TEXT, class TEXT, "
+                       "initial TEXT, length INTEGER)")
+    connection.execute("CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT)")
+    with open_dmp(source, "nodes.dmp") as f:
+        for batch in batches((int(row[0]), int(row[1]), row[2]) for row in dmp_rows(f)):
+            connection.executemany("INSERT INTO nodes VALUES (?, ?, ?)", batch)
+    with open_dmp(source, "names.dmp") as f:
+        rows = ((int(row[0]), row[1], row[1].lower(), row[3], row[1][:1].lower(), len(row[1]))
+                for row in dmp_rows(f) if len(row) > 3 and row[3] in NAME_CLASSES)
+        for batch in batches(rows):
+            connection.executemany("INSERT INTO names VALUES (?, ?, ?, ?, ?, ?)", batch)
+    # the indexes are made once every row is in, which is much faster than keeping them up to date row by row
+    connection.execute("CREATE INDEX names_name ON names (name)")
+    connection.execute("CREATE INDEX names_name_lower ON names (name_lower)")
+    connection.execute("CREATE INDEX names_taxid ON names (taxid, class)")
+    connection.execute("CREATE INDEX names_initial_length ON names (initial, length)")
+    connection.execute("CREATE INDEX nodes_parent ON nodes (parent)")
+    connection.executemany("INSERT INTO meta VALUES (?, ?)", [("source", os.path.abspath(source)),
+                                                              ("source_mtime", repr(source_mtime(source)))])
+    connection.commit()
+    taxa = connection.execute("SELECT COUNT(*) FROM nodes").fetchone()[0]
+    names = connection.execute("SELECT COUNT(*) FROM names").fetchone()[0]
+    connection.close()
+    os.replace(temp_path, db_path)
+    report("The taxonomy index (" + str(taxa) + " taxa, " + str(names) + " names) is saved in " + db_path + ".")
+    return taxa, names
+
+
+class TaxonomyIndex:
+    '''The look-ups of a taxonomy index built by build_taxonomy_index.
+    path: the SQLite file of the index
+    Every look-up returns taxa as dictionaries with the taxid, the scientific name, the rank, the name that matched
+    and the class of that name.
+    '''
+
+    def __init__(self, path=TAXONOMY_DB):
+        self.path = os.path.abspath(path)
+        # the index is only read, by any thread, one statement at a time
+        self.connection = sqlite3.connect("file:" + self.path + "?mode=ro", uri=True, check_same_thread=False)
+        self.lock = threading.Lock()
+
+    def query(self, sql, params=()):
+        '''This function runs a query on the index and returns every row.'''
+        with self.lock:
+            return self.connection.execute(sql, params).fetchall()
+
+    def taxa(self, sql, params=(), limit=None):
+        '''This function runs a query returning (taxid, matched name, name class) rows and returns the matching taxa
+        (each taxon once, in the order of the rows).'''
+        found = {}
+        for taxid, matched, name_class in self.query(sql, params):
+            if taxid not in found:
+                found[taxid] = self.taxon(taxid, matched, name_class)
+            if limit and len(found) >= limit:
+                break
+        return [taxon for taxon in found.values() if taxon is not None]
+
+    def taxon(self, taxid, matched=None, name_class="scientific name"):
+        '''This function returns the taxon with this taxid (None if there is none).'''
+        node = self.query("SELECT rank FROM nodes WHERE taxid = ?", (int(taxid),))
+        if not node:
+            return None
+        name = self.scientific_name(taxid)
+        return {"taxid": int(taxid), "name": name, "rank": node[0][0],
+                "matched": matched if matched is not None else name, "class": name_class}
+
+    def scientific_name(self, taxid):
+        '''This function returns the scientific name of the taxon with this taxid (None if there is none).'''
+        rows = self.query("SELECT name FROM names WHERE taxid = ? AND class = 'scientific name'", (int(taxid),))
+        return rows[0][0] if rows else None
+
+    def exact(self, name):
+        '''This function returns the taxa with a name spelt exactly as name.'''
+        return self.taxa("SELECT taxid, name, class FROM names WHERE name = ?", (name.strip(),))
+
+    def case_insensitive(self, name):
+        '''This function returns the taxa with a name equal to name whatever the case.'''
+        return self.taxa("SELECT taxid, name, class FROM names WHERE name_lower = ?", (name.strip().lower(),))
+
+    def prefix(self, text, limit=10):
+        '''This function returns up to limit taxa with a name starting with text (whatever the case), shortest names
+        first.'''
+        text = text.strip().lower()
+        if not text:
+            return []
+        # every name starting with text sorts between text and text followed by the highest character
+        return self.taxa("SELECT taxid, name, class FROM names WHERE name_lower >= ? AND name_lower < ? "
+                         "ORDER BY length, name LIMIT ?", (text, text + "\U0010ffff", limit * 5), limit)
+
+    def fuzzy(self, text, limit=5, cutoff=0.8):
+        '''This function returns up to limit taxa with a name close to text (a difflib ratio of at least cutoff,
+        whatever the case), closest first. Only the names with the same first letter and about the same length are
+        compared (the look-up is keyed on the first letter), so a misspelt first letter is never corrected.'''
+        text = text.strip().lower()
+        if not text:
+            return []
+        # a ratio of at least cutoff bounds how much longer or shorter a name can be
+        slack = int(len(text) * (1.0 - cutoff) / cutoff) + 1
+        rows = self.query("SELECT taxid, name, class, name_lower FROM names WHERE initial = ? AND length BETWEEN ? AND ?",
+                          (text[:1], len(text) - slack, len(text) + slack))
+        matcher = difflib.SequenceMatcher(None, "", text, autojunk=False)
+        scored = []
+        for taxid, name, name_class, name_lower in rows:
+            matcher.set_seq1(name_lower)
+            if matcher.real_quick_ratio() >= cutoff and matcher.quick_ratio() >= cutoff:
+                score = matcher.ratio()
+                if score >= cutoff:
+                    scored.append((-score, len(name), taxid, name, name_class))
+        scored.sort()
+        found = {}
+        for score, length, taxid, name, name_class in scored:
+            if taxid not in found:
+                found[taxid] = self.taxon(taxid, name, name_class)
+            if len(found) >= limit:
+                break
+        return [taxon for taxon in found.values() if taxon is not None]
+
+    def resolve(self, name):
+        '''This function returns the taxa name stands for: the taxa with exactly this name, or else with this name
+        whatever the case; a taxid (e.g. 9606 or txid9606) stands for its taxon.'''
+        name = name.strip()
+        taxid = name[len("txid"):] if name.lower().startswith("txid") else name
+        if taxid.isdigit():
+            taxon = self.taxon(int(taxid))
+            return [taxon] if taxon is not None else []
+        return self.exact(name) or self.case_insensitive(name)
+
+    def suggest(self, text, limit=5):
+        '''This function returns up to limit scientific names the user may have meant by text: the names starting
+        with it, or else the names close to it.'''
+        taxa = self.prefix(text, limit) or self.fuzzy(text, limit)
+        names = []
+        for taxon in taxa:
+            if taxon["name"] not in names:
+                names.append(taxon["name"])
+        return names
+
+    def lineage(self, taxid):
+        '''This function returns the lineage of the taxon with this taxid as a list of taxa, from the root down to
+        the taxon itself.'''
+        # one recursive query walks up the parent links (the root is its own parent)
+        rows = self.query("WITH RECURSIVE up (taxid, depth) AS (SELECT ?, 0 UNION "
+                          "SELECT nodes.parent, up.depth + 1 FROM nodes JOIN up ON nodes.taxid = up.taxid "
+                          "WHERE nodes.parent != nodes.taxid) "
+                          "SELECT up.taxid, names.name, nodes.rank FROM up JOIN nodes ON nodes.taxid = up.taxid "
+                          "LEFT JOIN names ON names.taxid = up.taxid AND names.class = 'scientific name' "
+                          "GROUP BY up.taxid ORDER BY MAX(up.depth) DESC", (int(taxid),))
+        return [{"taxid": row_taxid, "name": name, "rank": rank, "matched": name, "class": "scientific name"}
+                for row_taxid, name, rank in rows]
+
+    def descendants(self, taxid):
+        '''This function returns the taxids of the taxon with this taxid and of every taxon below it.'''
+        rows = self.query("WITH RECURSIVE down (taxid) AS (SELECT ? UNION "
+                          "SELECT nodes.taxid FROM nodes JOIN down ON nodes.parent = down.taxid "
+                          "WHERE nodes.taxid != nodes.parent) SELECT taxid FROM down", (int(taxid),))
+        return [row[0] for row in rows]
+
+    def close(self):
+        self.connection.close()
+
+
+def format_lineage(lineage, skip_ranks=("no rank", "clade")):
+    '''This function returns a lineage as text, e.g. "Eukaryota > Metazoa > Chordata > Mammalia", leaving out the
+    root and the taxa of the skip_ranks.'''
+    shown = [taxon["name"] for taxon in lineage[:-1] if taxon["rank"] not in skip_ranks]
+    return " > ".join(shown + [taxon["name"] for taxon in lineage[-1:]])
+
+
+def index_is_current(db_path=TAXONOMY_DB, source=TAXDUMP):
+    '''This function returns True if the index at db_path exists and is not older than the taxdump in source.'''
+    if not os.path.exists(db_path):
+        return False
+    if not source_exists(source):
+        return True
+    return os.path.getmtime(db_path) >= source_mtime(source)
+
+
+# the index shared by the whole programme (False once it is known there is none)
+_index = None
+
+
+def get_taxonomy_index(db_path=None, source=None, report=print):
+    '''This function returns the TaxonomyIndex shared by the whole programme, building it first if there is a taxdump
+    but no up-to-date index. It returns None if there is neither, so the callers go to NCBI instead.'''
+    global _index
+    if _index is not None and db_path is None and source is None:
+        return _index or None
+    db_path = TAXONOMY_DB if db_path is None else db_path
+    source = TAXDUMP if source is None else source
+    index = None
+    try:
+        if not index_is_current(db_path, source) and source_exists(source):
+            report("Building the local taxonomy index from " + source + ", this is only done once...")
+            build_taxonomy_index(source, db_path, report)
+        if os.path.exists(db_path):
+            index = TaxonomyIndex(db_path)
+    except (OSError, sqlite3.Error, tarfile.TarError, ValueError, IndexError) as error:
+        report("The local taxonomy index cannot be used (" + str(error) + "), NCBI is asked instead.")
+        index = None
+    _index = index if index is not None else False
+    return index
+
+
+def parse_arguments(argv=None):
+    '''This function reads the command line options.'''
+    parser = argparse.ArgumentParser(description="Build and query the local taxonomy index.")
+    parser.add_argument("names", nargs="*", help="the taxon names (or taxids) to look up")
+    parser.add_argument("--build", metavar="TAXDUMP",
+                        help="build the index from a taxdump directory or taxdump.tar.gz "
+                             "(use taxdump_sample for the bundled miniature taxdump)")
+    parser.add_argument("--db", default=TAXONOMY_DB, help="the index file (default: %(default)s)")
+    parser.add_argument("--prefix", action="store_true", help="list the taxa with a name starting with every name")
+    parser.add_argument("--fuzzy", action="store_true", help="list the taxa with a name close to every name (the first letter must be right)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    '''This function builds the index and/or looks the names up, printing every taxon found with its lineage.'''
+    options = parse_arguments(argv)
+    if options.build:
+        build_taxonomy_index(options.build, options.db)
+    if not options.names:
+        return 0
+    if not os.path.exists(options.db):
+        print("There is no taxonomy index at", options.db, "- build one with --build first.")
+        return 1
+    index = TaxonomyIndex(options.db)
+    for name in options.names:
+        if options.prefix:
+            taxa = index.prefix(name)
+        elif options.fuzzy:
+            taxa = index.fuzzy(name)
+        else:
+            taxa = index.resolve(name)
+        if not taxa:
+            suggestions = index.suggest(name)
+            print(name + ": not found" + (" (did you mean " + ", ".join(suggestions) + "?)" if suggestions else ""))
+        for taxon in taxa:
+            print(name + ": " + taxon["name"] + " (taxid " + str(taxon["taxid"]) + ", " + taxon["rank"] + "; matched "
+                  + taxon["class"] + " '" + taxon["matched"] + "')")
+            print("    " + format_lineage(index.lineage(taxon["taxid"])))
+    index.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
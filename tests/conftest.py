@@ -0,0 +1,11 @@
+import os
+import sys
+import tempfile
+
+# the modules of ProteoQuest live at the top of the repository
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# the caches and indexes the modules create on import go to a throw-away directory, not the user's cache
+os.environ.setdefault("PROTEOQUEST_CACHE_DIR", tempfile.mkdtemp(prefix="proteoquest_tests_"))
+
+# the bundled fixtures
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
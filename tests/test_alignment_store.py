@@ -0,0 +1,67 @@
+'''Tests of the memory-mapped alignment store, from the FASTA and the MSF output of clustalo.'''
+import numpy as np
+
+from alignment_store import AlignmentStore, convert_alignment, open_alignment_store
+from conservation import GAP, encode, load_alignment, read_msf
+
+ALIGNMENT = {"A1": "MKWVT-FISLLFLFSSAYS", "B2": "MKWVTSFISLL--FSSAYS", "C3": "MRWVT-FLSLLFLFSSGYS"}
+
+MSF = """PileUp
+
+   MSF: 19  Type: P    Check:  1234   ..
+
+ Name: A1 oo  Len: 19  Check:  1111  Weight:  1.00
+ Name: B2 oo  Len: 19  Check:  2222  Weight:  1.00
+ Name: C3 oo  Len: 19  Check:  3333  Weight:  1.00
+
+//
+
+           1                                     10
+A1         MKWVT.FISL
+B2         MKWVTSFISL
+C3         MRWVT.FLSL
+
+           11
+A1         LFLFS SAYS
+B2         L~~FS SAYS
+C3         LFLFS SGYS
+"""
+
+
+def write_alignments(tmp_path):
+    fasta_path = tmp_path / "aligned.fasta"
+    fasta_path.write_text("".join(">" + name + "\n" + sequence + "\n" for name, sequence in ALIGNMENT.items()))
+    msf_path = tmp_path / "aligned.msf"
+    msf_path.write_text(MSF)
+    return str(fasta_path), str(msf_path)
+
+
+def test_read_msf(tmp_path):
+    fasta_path, msf_path = write_alignments(tmp_path)
+    assert [(name, encode(sequence).tolist()) for name, sequence in read_msf(msf_path)] == \
+        [(name, encode(sequence).tolist()) for name, sequence in ALIGNMENT.items()]
+
+
+def test_msf_and_fasta_stores_match(tmp_path):
+    fasta_path, msf_path = write_alignments(tmp_path)
+    from_fasta = AlignmentStore(convert_alignment(fasta_path, str(tmp_path / "from_fasta")))
+    from_msf = AlignmentStore(convert_alignment(msf_path, str(tmp_path / "from_msf")))
+    assert from_msf.accessions == from_fasta.accessions == list(ALIGNMENT)
+    assert np.array_equal(np.asarray(from_msf.matrix), np.asarray(from_fasta.matrix))
+    assert np.array_equal(np.asarray(from_fasta.matrix), load_alignment(fasta_path)[0])
+    assert from_msf.column_table().equals(from_fasta.column_table())
+    assert from_msf.sequence_table().equals(from_fasta.sequence_table())
+
+
+def test_statistics(tmp_path):
+    fasta_path, msf_path = write_alignments(tmp_path)
+    store = open_alignment_store(msf_path)
+    assert store.shape == (3, 19)
+    gap_fraction = store.gap_fraction()
+    assert gap_fraction[5] == 2 / 3 and gap_fraction[0] == 0
+    assert store.consensus()[1] == encode("K")[0]
+    identity, gaps = store.identity(chunk_rows=2)
+    assert np.allclose(gaps, [1 / 19, 2 / 19, 1 / 19])
+    # B2 is the only sequence with a residue in column 6, so it agrees with the consensus there
+    assert identity[1] == 1.0
+    assert (np.asarray(store.matrix) == GAP).sum() == 4
@@ -0,0 +1,98 @@
+'''Tests of the on-disk caches: expiry, least recently used eviction and clearing, which both caches share.'''
+import os
+import subprocess
+import sys
+import time
+
+from artifact_cache import ArtifactCache, artifact_key
+from edirect_cache import EDirectCache
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_edirect_answers_are_cached(tmp_path):
+    cache = EDirectCache(str(tmp_path / "edirect.sqlite"))
+    calls = []
+    compute = lambda: calls.append(1) or "42"
+    assert cache.get_or_compute("protein", '"Aves[ORGN]"', "count", compute) == "42"
+    assert cache.get_or_compute("protein", "Aves[ORGN] ", "count", compute) == "42"
+    assert (len(calls), cache.hits, cache.misses) == (1, 1, 1)
+    # failures are returned but not kept
+    assert cache.get_or_compute("protein", "x", "count", lambda: "ERROR") == "ERROR"
+    assert cache.get("protein", "x", "count") is None
+
+
+def test_expired_entries_are_dropped(tmp_path):
+    for cache in (EDirectCache(str(tmp_path / "edirect.sqlite"), ttl=60),
+                  ArtifactCache(str(tmp_path / "artifacts.sqlite"), ttl=60)):
+        if isinstance(cache, EDirectCache):
+            cache.put("protein", "old", "count", "1")
+            get = lambda: cache.get("protein", "old", "count")
+        else:
+            cache.put("old", "test", "1")
+            get = lambda: cache.get("old")
+        assert get() is not None
+        # age the entry past the time-to-live
+        cache.connection.execute("UPDATE " + cache.table + " SET created = ?", (time.time() - 120,))
+        assert get() is None
+        assert cache.connection.execute("SELECT COUNT(*) FROM " + cache.table).fetchone()[0] == 0
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache = ArtifactCache(str(tmp_path / "artifacts.sqlite"), max_bytes=25)
+    for key in ("a", "b"):
+        cache.put(key, "test", "x" * 10)
+        time.sleep(0.01)
+    # reading "a" makes "b" the least recently used entry
+    assert cache.get("a") == b"x" * 10
+    time.sleep(0.01)
+    cache.put("c", "test", "x" * 10)
+    assert cache.get("b") is None
+    assert cache.get("a") is not None and cache.get("c") is not None
+
+
+def test_per_sequence_artifacts_and_clear(tmp_path):
+    cache = ArtifactCache(str(tmp_path / "artifacts.sqlite"))
+    sequences = {"P1": "MKV", "P2": "MKL"}
+    cache.store_sequences("stats", {"engine": "native"}, sequences, {"P1": {"charge": 1.0}, "P3": {"charge": 2.0}})
+    found, missing = cache.lookup_sequences("stats", {"engine": "native"}, sequences)
+    assert (found, missing) == ({"P1": {"charge": 1.0}}, ["P2"])
+    assert cache.get(artifact_key("stats", {"engine": "other"}, "MKV")) is None
+    cache.clear()
+    assert cache.lookup_sequences("stats", {"engine": "native"}, sequences) == ({}, ["P1", "P2"])
+
+
+def test_disabled_artifact_cache(tmp_path):
+    cache = ArtifactCache(str(tmp_path / "artifacts.sqlite"), enabled=False)
+    cache.put("a", "test", "value")
+    assert cache.get("a") is None
+    assert cache.report() == "Artifact cache: disabled."
+
+
+def test_bulk_lookup_commits_once(tmp_path, monkeypatch):
+    monkeypatch.setattr("sqlite_cache.LOOKUP_CHUNK", 7)
+    cache = ArtifactCache(str(tmp_path / "artifacts.sqlite"), ttl=60)
+    sequences = {"P" + str(i): "MK" + "A" * i for i in range(30)}
+    cache.store_sequences("motifs", {}, sequences, {accession: [i] for i, accession in enumerate(sequences)
+                                                    if accession != "P3"})
+    # age one entry past the time-to-live
+    cache.connection.execute("UPDATE artifacts SET created = ? WHERE key = ?",
+                             (time.time() - 120, artifact_key("motifs", {}, sequences["P5"])))
+    cache.connection.commit()
+    statements = []
+    cache.connection.set_trace_callback(statements.append)
+    found, missing = cache.lookup_sequences("motifs", {}, sequences)
+    cache.connection.set_trace_callback(None)
+    assert missing == ["P3", "P5"]
+    assert len(found) == 28 and found["P29"] == [29]
+    assert statements.count("COMMIT") == 1
+    assert (cache.hits, cache.misses) == (28, 2)
+    assert cache.get(artifact_key("motifs", {}, sequences["P5"])) is None
+
+
+def test_importing_the_programme_opens_no_cache(tmp_path):
+    cache_dir = tmp_path / "cache"
+    environment = dict(os.environ, PROTEOQUEST_CACHE_DIR=str(cache_dir), MPLBACKEND="Agg")
+    subprocess.run([sys.executable, "-c", "import ProteoQuest, manifest_runner"], cwd=REPO_DIR, env=environment,
+                   check=True)
+    assert not cache_dir.exists() or not any(cache_dir.iterdir())
@@ -0,0 +1,140 @@
+'''Tests of the E-utilities client against a stub transport and a local fixture HTTP server.'''
+import http.server
+import json
+import threading
+
+import pytest
+
+from edirect_cache import EDirectCache
+from eutils import EutilsClient, EutilsError, HTTPTransport, RateLimiter, is_cacheable_search
+
+FOUND = b"<eSearchResult><Count>2</Count><RetMax>2</RetMax><IdList><Id>11</Id><Id>12</Id></IdList></eSearchResult>"
+NOTHING = b"<eSearchResult><Count>0</Count><IdList/></eSearchResult>"
+FAILED = (b"<eSearchResult><Count>0</Count><ErrorList><PhraseNotFound>nosuchtaxon</PhraseNotFound></ErrorList>"
+          b"</eSearchResult>")
+SPELLED = b"<eSpellResult><Query>homo sapeins</Query><CorrectedQuery>homo sapiens</CorrectedQuery></eSpellResult>"
+
+
+class StubTransport:
+    '''A transport answering every endpoint with a canned reply and recording the requests.'''
+
+    def __init__(self, replies):
+        self.replies = replies
+        self.requests = []
+
+    def request(self, endpoint, params):
+        self.requests.append((endpoint, params))
+        reply = self.replies[endpoint]
+        return reply(params) if callable(reply) else reply
+
+
+def client(replies, tmp_path):
+    transport = StubTransport(replies)
+    cache = EDirectCache(str(tmp_path / "cache.sqlite"))
+    eutils = EutilsClient(transport=transport, api_key=None, email=None, cache=cache)
+    # the stub is not NCBI, so there is no rate limit to keep to
+    eutils.rate_limiter = RateLimiter(1e9)
+    return eutils, transport
+
+
+def endpoints(transport):
+    return [endpoint for endpoint, params in transport.requests]
+
+
+def test_esearch_is_parsed_and_cached(tmp_path):
+    eutils, transport = client({"espell.fcgi": SPELLED, "esearch.fcgi": FOUND}, tmp_path)
+    result = eutils.esearch("protein", "homo sapeins[ORGN]", retmax=20)
+    assert result["count"] == 2 and result["ids"] == ["11", "12"]
+    assert result["errors"] == [] and result["warnings"] == []
+    # the spelling-corrected query is the one searched
+    assert transport.requests[1][1]["term"] == "homo sapiens"
+    assert transport.requests[1][1]["tool"] == "ProteoQuest"
+    # the same question again is answered by the cache
+    assert eutils.esearch("protein", "homo sapeins[ORGN]", retmax=20) == result
+    assert endpoints(transport) == ["espell.fcgi", "esearch.fcgi"]
+
+
+@pytest.mark.parametrize("reply", [NOTHING, FAILED], ids=["nothing found", "phrase not found"])
+def test_failed_and_empty_searches_are_not_cached(tmp_path, reply):
+    eutils, transport = client({"espell.fcgi": SPELLED, "esearch.fcgi": reply}, tmp_path)
+    first = eutils.esearch("taxonomy", "nosuchtaxon")
+    assert first["count"] == 0
+    eutils.esearch("taxonomy", "nosuchtaxon")
+    assert endpoints(transport).count("esearch.fcgi") == 2
+
+
+def test_is_cacheable_search():
+    assert is_cacheable_search(json.dumps({"count": 3, "errors": [], "warnings": []}))
+    assert not is_cacheable_search(json.dumps({"count": 0, "errors": [], "warnings": []}))
+    assert not is_cacheable_search(json.dumps({"count": 3, "errors": [], "warnings": ["phrase not found"]}))
+    assert not is_cacheable_search("")
+
+
+def test_searches_with_history_are_never_cached(tmp_path):
+    reply = b"<eSearchResult><Count>2</Count><QueryKey>1</QueryKey><WebEnv>MCID_1</WebEnv></eSearchResult>"
+    eutils, transport = client({"esearch.fcgi": reply}, tmp_path)
+    for _ in range(2):
+        result = eutils.esearch("protein", "kinase", usehistory=True, spell=False)
+    assert (result["webenv"], result["query_key"]) == ("MCID_1", "1")
+    assert endpoints(transport) == ["esearch.fcgi", "esearch.fcgi"]
+
+
+def test_scientific_names(tmp_path):
+    summary = json.dumps({"result": {"uids": ["9606"], "9606": {"scientificname": "Homo sapiens"}}}).encode()
+    history = b"<eSearchResult><Count>1</Count><QueryKey>1</QueryKey><WebEnv>MCID_1</WebEnv></eSearchResult>"
+    eutils, transport = client({"espell.fcgi": SPELLED, "esearch.fcgi": history, "esummary.fcgi": summary}, tmp_path)
+    assert eutils.scientific_names("human") == ["Homo sapiens"]
+    assert eutils.scientific_names("human") == ["Homo sapiens"]
+    assert endpoints(transport).count("esummary.fcgi") == 1
+
+
+def test_efetch_by_history(tmp_path):
+    eutils, transport = client({"efetch.fcgi": lambda params: b">A1\nMKV\n"}, tmp_path)
+    assert eutils.efetch("protein", webenv="MCID_1", query_key="1", retstart=500, retmax=500) == ">A1\nMKV\n"
+    params = transport.requests[0][1]
+    assert (params["WebEnv"], params["query_key"], params["retstart"], params["retmax"]) == ("MCID_1", "1", 500, 500)
+
+
+def test_malformed_reply(tmp_path):
+    eutils, transport = client({"esearch.fcgi": b"<eSearchResult><Count>"}, tmp_path)
+    with pytest.raises(EutilsError):
+        eutils.esearch("protein", "kinase", spell=False)
+
+
+class FixtureHandler(http.server.BaseHTTPRequestHandler):
+    '''A local E-utilities server: the first request fails with HTTP 500, every other one is answered.'''
+    protocol_version = "HTTP/1.1"
+    requests = []
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers["Content-Length"])).decode("utf-8")
+        FixtureHandler.requests.append((self.path, body))
+        status, reply = (500, b"busy") if len(FixtureHandler.requests) == 1 else (200, FOUND)
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(reply)))
+        self.end_headers()
+        self.wfile.write(reply)
+
+    def log_message(self, *args):
+        pass
+
+
+def test_http_transport_against_a_fixture_server(tmp_path, monkeypatch):
+    # no back-off pause between the retries
+    monkeypatch.setattr("eutils.time.sleep", lambda seconds: None)
+    FixtureHandler.requests = []
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), FixtureHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        transport = HTTPTransport(base_url="http://127.0.0.1:" + str(server.server_address[1]) + "/eutils")
+        eutils = EutilsClient(transport=transport, api_key=None, email=None, cache=False)
+        eutils.rate_limiter = RateLimiter(1e9)
+        assert eutils.esearch("protein", "kinase", spell=False)["count"] == 2
+        assert eutils.esearch("protein", "kinase", spell=False)["ids"] == ["11", "12"]
+    finally:
+        server.shutdown()
+        server.server_close()
+    # the failed request was retried, and every request went to the esearch endpoint under the base URL
+    assert [path for path, body in FixtureHandler.requests] == ["/eutils/esearch.fcgi"] * 3
+    assert "term=kinase" in FixtureHandler.requests[0][1]
@@ -0,0 +1,85 @@
+'''Tests of the run report: stages, record counts and the external programs run.'''
+import subprocess
+import sys
+import threading
+
+import pytest
+
+from instrumentation import RunReport, get_report, start_report, timed
+from motif_scan import run_patmatmotifs
+from pipeline import Pipeline
+
+
+def test_stages_and_counts():
+    report = RunReport()
+    with report.stage("trim"):
+        report.count("trim", 3)
+    report.count("trim", 2)
+    data = report.to_dict()
+    assert [stage["stage"] for stage in data["stages"]] == ["trim"]
+    assert data["records"] == {"trim": 5}
+
+
+def test_run_records_the_program():
+    report = RunReport()
+    result = report.run([sys.executable, "-c", "print('hello')"], stdout=subprocess.PIPE, universal_newlines=True)
+    assert (result.returncode, result.stdout) == (0, "hello\n")
+    assert report.to_dict()["subprocesses"][0]["bytes_out"] == len("hello\n")
+
+
+@pytest.mark.parametrize("text", [True, False])
+def test_missing_program_gives_status_127(text):
+    report = RunReport()
+    result = report.run(["no-such-program-proteoquest", "-auto"], stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                        universal_newlines=text)
+    assert result.returncode == 127
+    assert "no-such-program-proteoquest is not installed" in (result.stderr if text else result.stderr.decode())
+    assert report.call(["no-such-program-proteoquest"]) == 127
+    program = report.to_dict()["programs"]["no-such-program-proteoquest"]
+    assert (program["runs"], program["failures"]) == (2, 2)
+
+
+def test_missing_patmatmotifs(tmp_path, monkeypatch):
+    monkeypatch.setenv("PATH", str(tmp_path))
+    start_report()
+    with pytest.raises(RuntimeError, match="patmatmotifs is not installed"):
+        run_patmatmotifs(tmp_path / "A1.fasta")
+
+
+def test_profiles_one_stage_at_a_time():
+    report = RunReport(profile=["all"])
+    assert report.profiling() and not RunReport().profiling()
+    inside = threading.Barrier(2)
+    errors = []
+
+    def run_stage(name):
+        try:
+            with report.stage(name):
+                inside.wait(timeout=5)
+        except Exception as error:
+            errors.append(error)
+
+    threads = [threading.Thread(target=run_stage, args=(name,)) for name in ("motifs", "stats")]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    assert len(report.profilers) == 1
+    skipped = ({"motifs", "stats"} - set(report.profilers)).pop()
+    assert report.profile_summaries[skipped].startswith("not profiled")
+    # once the stages are over, the next one is profiled again
+    with report.stage("plots"):
+        pass
+    assert "plots" in report.profilers
+
+
+def test_concurrent_pipeline_under_profiling():
+    start_report(profile=["all"])
+    pipeline = Pipeline()
+    for name in ("motifs", "stats", "similarity"):
+        pipeline.add(name, timed(name, lambda: sum(range(100000))))
+    # every stage runs, each one either profiled or noted as not profiled
+    assert len(pipeline.run()) == 3
+    report = get_report()
+    assert set(report.profilers) | set(report.profile_summaries) == {"motifs", "stats", "similarity"}
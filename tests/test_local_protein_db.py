@@ -0,0 +1,57 @@
+'''Tests of the searches of a local protein database, on a small fixture FASTA file with NCBI and UniProt headers.'''
+import os
+
+import pytest
+
+from conftest import DATA_DIR
+from local_protein_db import LocalProteinDB, QueryError, parse_header
+from ProteoQuest import build_search_term
+
+LOCAL_PROTEINS = os.path.join(DATA_DIR, "local_proteins.fasta")
+
+
+@pytest.fixture
+def database(tmp_path):
+    database = LocalProteinDB(LOCAL_PROTEINS, db_path=str(tmp_path / "local.sqlite"), report=lambda message: None)
+    yield database
+    database.connection.close()
+
+
+def found(database, term):
+    count, webenv = database.search(term)
+    accessions = [accession for accession, start, end in database.result_records(webenv)]
+    assert len(accessions) == count
+    return accessions
+
+
+def test_parse_header():
+    assert parse_header("XP_000002.1 serine/threonine-protein kinase 2, partial [Homo sapiens]")[2:] == \
+        ("Homo sapiens", None, True)
+    assert parse_header("sp|Q00001|KIN3_MOUSE Protein kinase 3 (Fragment) OS=Mus musculus OX=10090 GN=Kin3 PE=2 SV=1")[2:] \
+        == ("Mus musculus", 10090, True)
+
+
+@pytest.mark.parametrize("organism, partial, expected", [
+    ("Homo sapiens", None, ["XP_000001.1", "XP_000002.1", "sp|Q00002|KIN4_HUMAN"]),
+    ("Homo sapiens", "y", ["XP_000002.1"]),
+    ("Homo sapiens", "n", ["XP_000001.1", "sp|Q00002|KIN4_HUMAN"]),
+    ("Mus musculus", None, ["XP_000003.1", "XP_000004.1", "sp|Q00001|KIN3_MOUSE"]),
+    ("Mus musculus", "y", ["XP_000003.1", "sp|Q00001|KIN3_MOUSE"]),
+    ("Mus musculus", "n", ["XP_000004.1"]),
+])
+def test_build_search_term_forms(database, organism, partial, expected):
+    assert found(database, build_search_term(organism, "kinase", partial)) == expected
+
+
+def test_boolean_operators(database):
+    assert found(database, "Homo sapiens[ORGN] AND (hemoglobin[PROT] OR kinase 4[PROT])") == \
+        ["XP_000005.1", "sp|Q00002|KIN4_HUMAN"]
+    assert found(database, "kinase[PROT] NOT Homo sapiens[ORGN] NOT PARTIAL") == ["XP_000004.1"]
+    assert found(database, "Mus[ORGN] AND tyrosine[PROT]") == ["XP_000003.1"]
+
+
+def test_unreadable_terms(database):
+    with pytest.raises(QueryError):
+        database.search("kinase[PROT] AND")
+    with pytest.raises(QueryError):
+        database.search("kinase[NOSUCHFIELD]")
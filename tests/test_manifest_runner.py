@@ -0,0 +1,39 @@
+'''Tests that the analysis settings given to the manifest runner reach every analysis process.'''
+import pandas as pd
+
+import manifest_runner
+import ProteoQuest as pq
+from artifact_cache import ArtifactCache
+
+SETTINGS = ["STATS_ENGINE", "SCAN_WORKERS", "RESULTS_DB", "LOCAL_PROTEIN_DB", "EMBOSS_MODE", "CONSERVATION_ENGINE",
+            "CONSERVATION_WINSIZE", "REDUNDANCY_IDENTITY", "SIMILARITY_NEIGHBOURS", "BATCH_MODE"]
+
+
+def test_init_analysis_worker_sets_the_analysis_settings(monkeypatch, tmp_path):
+    # the worker changes the module settings, put them back afterwards
+    for name in SETTINGS:
+        monkeypatch.setattr(pq, name, getattr(pq, name))
+    monkeypatch.setattr(pq, "artifacts", ArtifactCache(str(tmp_path / "artifacts.sqlite")))
+    monkeypatch.setattr(pq.plt, "switch_backend", lambda backend: None)
+    manifest_runner.init_analysis_worker("native", 2, False, [], "", "", 0.9, 0, "per-sequence", "plotcon", 6)
+    assert pq.artifacts.enabled is False
+    assert (pq.REDUNDANCY_IDENTITY, pq.SIMILARITY_NEIGHBOURS, pq.EMBOSS_MODE, pq.CONSERVATION_ENGINE,
+            pq.CONSERVATION_WINSIZE) == (0.9, 0, "per-sequence", "plotcon", 6)
+
+
+def test_command_line_options_are_passed_on(monkeypatch, tmp_path):
+    passed = {}
+
+    def run_manifest(jobs, output_dir, **options):
+        passed.update(options)
+        return pd.DataFrame({'Status': ["ok"]})
+
+    monkeypatch.setattr(manifest_runner, "read_manifest", lambda path: [])
+    monkeypatch.setattr(manifest_runner, "run_manifest", run_manifest)
+    status = manifest_runner.main(["manifest.tsv", "--output-dir", str(tmp_path), "--identity", "0.95",
+                                   "--neighbours", "3", "--emboss-mode", "per-sequence",
+                                   "--conservation-engine", "plotcon", "--winsize", "8"])
+    assert status == 0
+    assert {key: passed[key] for key in ("identity", "neighbours", "emboss_mode", "conservation_engine", "winsize")} \
+        == {"identity": 0.95, "neighbours": 3, "emboss_mode": "per-sequence", "conservation_engine": "plotcon",
+            "winsize": 8}
@@ -0,0 +1,70 @@
+'''Tests of the native PROSITE engine against a bundled subset of prosite.dat.
+
+prosite_subset.patmatmotifs holds the hits of every pattern of prosite_subset.dat in prosite_subset.fasta, worked out
+by hand and written as a patmatmotifs (dbmotif) report, so the native scan is checked through the same parser as
+the output of patmatmotifs itself.
+'''
+import os
+import re
+
+import pytest
+
+from conftest import DATA_DIR
+from emboss_reports import parse_patmatmotifs
+from fasta import read_fasta
+from prosite import PrositePatterns, pattern_to_regex, read_prosite_dat
+
+PROSITE_SUBSET = os.path.join(DATA_DIR, "prosite_subset.dat")
+
+
+def sequences():
+    return {accession: sequence for accession, header, sequence in read_fasta(os.path.join(DATA_DIR, "prosite_subset.fasta"))}
+
+
+@pytest.mark.parametrize("pattern, regex", [
+    ("N-{P}-[ST]-{P}.", "N[^P\\n][ST][^P\\n]"),
+    ("[STAGCN]-[RKH]-[LIVMAFY]>.", "[STAGCN][RKH][LIVMAFY]$"),
+    ("C-x(2)-C-x(0,1)>.", "C.{2}C.{0,1}$"),
+    ("<{C}*>.", "^[^C\\n]*$"),
+    ("F-[GSTV]-P-R-L-[G>].", "F[GSTV]PRL(?:[G]|$)"),
+    ("<M-[DE]-x(2,4)-{P}-C>.", "^M[DE].{2,4}[^P\\n]C$"),
+    ("[<M]-K.", "(?:[M]|^)K"),
+])
+def test_pattern_to_regex(pattern, regex):
+    assert pattern_to_regex(pattern) == regex
+
+
+def test_anchored_patterns_only_match_at_the_ends():
+    assert re.search(pattern_to_regex("[STAGCN]-[RKH]-[LIVMAFY]>."), "MAAGGSKL")
+    assert not re.search(pattern_to_regex("[STAGCN]-[RKH]-[LIVMAFY]>."), "MSKLAAGG")
+    assert re.search(pattern_to_regex("C-x(2)-C-x(0,1)>."), "MMCAACG")
+    assert not re.search(pattern_to_regex("C-x(2)-C-x(0,1)>."), "MMCAACGG")
+    assert re.search(pattern_to_regex("<{C}*>."), "MAAGG")
+    assert not re.search(pattern_to_regex("<{C}*>."), "MAACGG")
+
+
+def test_read_prosite_dat():
+    entries = read_prosite_dat(PROSITE_SUBSET)
+    assert [entry[0] for entry in entries] == ["ASN_GLYCOSYLATION", "PKC_PHOSPHO_SITE", "ER_TARGET", "PRENYLATION",
+                                               "MICROBODIES_CTER", "PYROKININ"]
+    assert entries[4][1:] == ("PS00342", "Microbodies C-terminal targeting signal.", "[STAGCN]-[RKH]-[LIVMAFY]>.")
+
+
+def test_scan_matches_patmatmotifs():
+    with open(os.path.join(DATA_DIR, "prosite_subset.patmatmotifs")) as f:
+        expected = sorted(hit for hit in parse_patmatmotifs(f) if hit[1] is not None)
+    hits = PrositePatterns(PROSITE_SUBSET, cache_dir=None).scan(sequences())
+    assert sorted(hits) == expected
+
+
+def test_scan_prune():
+    hits = PrositePatterns(PROSITE_SUBSET, cache_dir=None).scan(sequences(), prune=True)
+    assert {hit[1] for hit in hits} == {"ER_TARGET", "PRENYLATION", "MICROBODIES_CTER", "PYROKININ"}
+
+
+def test_translations_are_cached(tmp_path):
+    first = PrositePatterns(PROSITE_SUBSET, cache_dir=str(tmp_path))
+    assert len(os.listdir(tmp_path)) == 1
+    second = PrositePatterns(PROSITE_SUBSET, cache_dir=str(tmp_path))
+    assert second.entries == first.entries
+    assert second.signature == first.signature
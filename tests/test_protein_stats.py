@@ -0,0 +1,74 @@
+'''Tests of the in-process pepstats statistics.
+
+The statistics are compared with a fresh pepstats run at explicit tolerances when EMBOSS is installed. The reference
+values of the short peptides below only check the arithmetic (sums, termini, cystine bridges, the isoelectric point
+search): they are worked out by hand from the same EMBOSS tables (Eamino.dat, Epk.dat) protein_stats uses, so they
+cannot catch a wrong residue mass or pKa.
+'''
+import os
+import shutil
+import subprocess
+
+import pytest
+
+from conftest import DATA_DIR
+from emboss_reports import parse_pepstats
+from fasta import read_fasta
+from protein_stats import protein_statistics
+
+PEPSTATS_SEQUENCES = os.path.join(DATA_DIR, "pepstats_sequences.fasta")
+
+# how far the statistics may be from those printed by pepstats
+TOLERANCES = {'Molecular Weight': 0.1, 'Number of Residues': 0, 'Average Residue Weight': 0.01, 'Charge': 0.05,
+              'Isoelectric Point': 0.01, 'A280 Molar Extinction (Reduced)': 0,
+              'A280 Molar Extinction (Cysteine Bridges)': 0, 'A280 Extinction 1mg/ml (Reduced)': 0.002,
+              'A280 Extinction 1mg/ml (Cysteine Bridges)': 0.002}
+
+
+def sequences():
+    return {accession: sequence for accession, header, sequence in read_fasta(PEPSTATS_SEQUENCES)}
+
+
+def assert_matches_pepstats(lines):
+    stats_df = protein_statistics(sequences())
+    reported = dict(parse_pepstats(lines))
+    assert set(reported) == set(stats_df.index)
+    for name, stats in reported.items():
+        for column, tolerance in TOLERANCES.items():
+            assert stats_df.loc[name, column] == pytest.approx(stats[column], abs=tolerance), (name, column)
+
+
+@pytest.mark.parametrize("sequence, expected", [
+    # only the termini are charged: the isoelectric point is half way between their pKa values
+    ("GGG", {'Molecular Weight': 189.17, 'Number of Residues': 3, 'Average Residue Weight': 63.057, 'Charge': 0.0,
+             'Isoelectric Point': 6.1, 'A280 Molar Extinction (Reduced)': 0}),
+    ("MW", {'Molecular Weight': 335.42, 'Average Residue Weight': 167.711, 'A280 Molar Extinction (Reduced)': 5500,
+            'A280 Molar Extinction (Cysteine Bridges)': 5500, 'A280 Extinction 1mg/ml (Reduced)': 16.397}),
+    # three cysteines make one cystine bridge
+    ("CCCWY", {'Molecular Weight': 676.82, 'A280 Molar Extinction (Reduced)': 6990,
+               'A280 Molar Extinction (Cysteine Bridges)': 7115, 'A280 Extinction 1mg/ml (Reduced)': 10.328,
+               'A280 Extinction 1mg/ml (Cysteine Bridges)': 10.512}),
+    ("DEKRHBZ", {'Molecular Weight': 926.94, 'Charge': -0.5}),
+])
+def test_reference_values(sequence, expected):
+    stats = protein_statistics({"P1": sequence}).loc["P1"]
+    for column, value in expected.items():
+        assert stats[column] == pytest.approx(value, abs=1e-9), column
+
+
+def test_lower_case_and_unknown_residues():
+    stats_df = protein_statistics({"UPPER": "MKWVTFISLL", "LOWER": "mkwvtfisll", "ODD": "MKWVTF*ISLL"})
+    assert stats_df.loc["UPPER"].equals(stats_df.loc["LOWER"])
+    assert stats_df.loc["ODD", 'Number of Residues'] == 11
+
+
+def test_no_sequences():
+    assert protein_statistics({}).empty
+
+
+@pytest.mark.skipif(shutil.which("pepstats") is None, reason="EMBOSS pepstats is not installed")
+def test_matches_pepstats(tmp_path):
+    report_path = tmp_path / "pepstats_sequences.pepstats"
+    subprocess.run(["pepstats", "-sequence", PEPSTATS_SEQUENCES, "-outfile", str(report_path), "-auto"], check=True)
+    with open(report_path) as f:
+        assert_matches_pepstats(f)
@@ -0,0 +1,77 @@
+'''Tests of the local taxonomy index, built from the bundled miniature taxdump (taxdump_sample).'''
+import os
+
+import pytest
+
+from taxonomy_index import TaxonomyIndex, build_taxonomy_index, format_lineage, get_taxonomy_index
+
+TAXDUMP_SAMPLE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "taxdump_sample")
+
+
+@pytest.fixture(scope="module")
+def taxonomy(tmp_path_factory):
+    db_path = str(tmp_path_factory.mktemp("taxonomy") / "taxonomy.sqlite")
+    build_taxonomy_index(TAXDUMP_SAMPLE, db_path, report=lambda message: None)
+    index = TaxonomyIndex(db_path)
+    yield index
+    index.close()
+
+
+def taxids(taxa):
+    return [taxon["taxid"] for taxon in taxa]
+
+
+def test_resolve(taxonomy):
+    human = taxonomy.resolve("Homo sapiens")
+    assert human == [{"taxid": 9606, "name": "Homo sapiens", "rank": "species", "matched": "Homo sapiens",
+                      "class": "scientific name"}]
+    # common names, synonyms and taxids stand for their taxon
+    assert taxids(taxonomy.resolve("human")) == [9606]
+    assert taxonomy.resolve("Proteobacteria")[0]["name"] == "Pseudomonadota"
+    assert taxonomy.resolve("Proteobacteria")[0]["class"] == "synonym"
+    assert taxids(taxonomy.resolve("9031")) == [9031]
+    assert taxids(taxonomy.resolve("txid8782")) == [8782]
+    assert taxonomy.resolve("no such taxon") == []
+
+
+def test_case_insensitive(taxonomy):
+    assert taxonomy.exact("homo sapiens") == []
+    assert taxids(taxonomy.case_insensitive("homo SAPIENS")) == [9606]
+    assert taxids(taxonomy.resolve("AVES")) == [8782]
+
+
+def test_prefix(taxonomy):
+    # the shortest names first
+    assert taxids(taxonomy.prefix("homo")) == [9605, 9606]
+    assert taxids(taxonomy.prefix("Saccharomyces")) == [4930, 4932]
+    assert taxonomy.prefix("") == []
+
+
+def test_fuzzy(taxonomy):
+    assert taxids(taxonomy.fuzzy("mamalia"))[:1] == [40674]
+    assert taxids(taxonomy.fuzzy("Escherichia colli"))[:1] == [562]
+    # the look-up is keyed on the first letter, so a wrong first letter is never corrected
+    assert 40674 not in taxids(taxonomy.fuzzy("nammalia"))
+    assert taxonomy.suggest("Galus") == ["Gallus"]
+    assert taxonomy.suggest("Gallus g") == ["Gallus gallus"]
+
+
+def test_lineage(taxonomy):
+    lineage = taxonomy.lineage(9606)
+    assert taxids(lineage) == [1, 131567, 2759, 33154, 33208, 7711, 7742, 40674, 9443, 9604, 9605, 9606]
+    assert format_lineage(lineage) == ("Eukaryota > Metazoa > Chordata > Mammalia > Primates > Hominidae > Homo > "
+                                       "Homo sapiens")
+    assert taxids(taxonomy.lineage(1)) == [1]
+
+
+def test_descendants(taxonomy):
+    assert sorted(taxonomy.descendants(40674)) == sorted([40674, 9443, 9604, 9605, 9606, 9989, 10066, 10088, 10090,
+                                                          10116])
+    assert taxonomy.descendants(9606) == [9606]
+
+
+def test_get_taxonomy_index_without_a_taxdump(tmp_path, monkeypatch):
+    # the shared index is left as it was for the other tests
+    monkeypatch.setattr("taxonomy_index._index", None)
+    assert get_taxonomy_index(str(tmp_path / "none.sqlite"), str(tmp_path / "no_taxdump"),
+                              report=lambda message: None) is None